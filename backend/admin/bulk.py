@@ -0,0 +1,111 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from router import whole
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '5000'))
+BULK_MAX_IDS = int(os.environ.get('BULK_MAX_IDS', '100000'))
+
+Filters = Dict[str, Tuple[str, Callable[[Any], Any]]]
+
+
+def _flag(value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise ValueError('Expected true or false')
+    return value
+
+
+def _contains(value: Any) -> str:
+    return '%' + str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+USER_FILTERS: Filters = {
+    'is_verified': ('is_verified = %s', _flag),
+    'is_banned': ('is_banned = %s', _flag),
+    'role': ('role = %s', str),
+    'search': ('username ILIKE %s', _contains),
+}
+
+GAME_FILTERS: Filters = {
+    'status': ('status = %s', str),
+    'genre': ('genre = %s', str),
+    'engine_type': ('engine_type = %s', str),
+    'created_by': ('created_by = %s', int),
+}
+
+
+def parse_target(body: Dict[str, Any], ids_key: str, filters: Filters) -> Tuple[Optional[List[int]], str, List[Any]]:
+    '''
+    Business: Reads the rows a bulk action applies to - an explicit id list or a filter predicate
+    Args: body with ids_key (list of ids) or 'filter' (dict of whitelisted column filters); filters spec
+    Returns: (sorted unique ids or None, SQL condition, condition args); raises ValueError
+    '''
+    if body.get(ids_key) is not None:
+        raw = body[ids_key]
+        if not isinstance(raw, list) or not raw:
+            raise ValueError(f'{ids_key} must be a non-empty list')
+        ids = sorted({whole(i) for i in raw})
+        if len(ids) > BULK_MAX_IDS:
+            raise ValueError(f'At most {BULK_MAX_IDS} ids per request')
+        return ids, 'TRUE', []
+
+    predicate = body.get('filter')
+    if not isinstance(predicate, dict) or not predicate:
+        raise ValueError(f'Pass {ids_key} or a filter')
+    unknown = [k for k in predicate if k not in filters]
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(unknown)}")
+    conditions, args = [], []
+    for key, value in predicate.items():
+        condition, convert = filters[key]
+        conditions.append(condition)
+        args.append(convert(value))
+    return None, ' AND '.join(conditions), args
+
+
+def bulk_update(conn: Any, cur: Any, table: str, assignments: str, assignment_args: Sequence[Any],
+                guard: str, guard_args: Sequence[Any], ids: Optional[List[int]], condition: str, condition_args: Sequence[Any],
+                on_chunk: Optional[Callable[[Any, List[int]], None]] = None,
+                chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, int]:
+    '''
+    Business: Applies one set-based UPDATE to many rows, keyset-chunked by id with a commit per chunk
+    Args: conn/cur - pooled connection and its cursor; table; assignments - SET clause and its args;
+          guard and guard_args - extra condition skipping rows already in the target state ('TRUE' for none);
+          ids or condition/condition_args selecting the rows; on_chunk(cur, updated_ids) runs inside
+          each chunk's transaction; chunk_size rows per statement and commit
+    Returns: dict with matched, updated and chunks counts
+    '''
+    if ids is not None:
+        source = 'SELECT id FROM unnest(%s::int[]) AS t(id) WHERE id > %s ORDER BY id LIMIT %s'
+    else:
+        source = f'SELECT id FROM {SCHEMA}.{table} WHERE {condition} AND id > %s ORDER BY id LIMIT %s'
+    sql = f"""
+        WITH batch AS ({source}),
+        upd AS (
+            UPDATE {SCHEMA}.{table} t SET {assignments}
+            FROM batch WHERE t.id = batch.id AND {guard}
+            RETURNING t.id
+        )
+        SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM batch), ARRAY(SELECT id FROM upd)
+    """
+    select_args = [ids] if ids is not None else list(condition_args)
+
+    totals = {'matched': 0, 'updated': 0, 'chunks': 0}
+    after = 0
+    while True:
+        cur.execute(sql, [*select_args, after, chunk_size, *assignment_args, *guard_args])
+        last_id, matched, updated = cur.fetchone()
+        if not matched:
+            break
+        if updated and on_chunk is not None:
+            on_chunk(cur, updated)
+        conn.commit()
+        totals['matched'] += matched
+        totals['updated'] += len(updated)
+        totals['chunks'] += 1
+        after = last_id
+        if matched < chunk_size:
+            break
+    return totals
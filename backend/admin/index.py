@@ -1,189 +1,285 @@
-import json
 import os
-import psycopg2
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 from typing import Dict, Any
 
+from bulk import USER_FILTERS, bulk_update, parse_target
+from cache import bump_version, etag_for, etag_matches, get_version, not_modified
+from instrument import instrumented
+from ledger import add_balance, compact, ledger_balance, parse_range, revenue_by_day, revenue_by_game, set_balance, top_up_entries
+from listing import EXPORT_FORMATS, PENDING_GAMES, USERS, export, page
+from responses import dumps, error_response, json_response, money, raw_response, row_encoder
+from router import Request, Router, integer
+from sessions import revoke_user, revoke_users
+from settings import invalidate as invalidate_settings, is_maintenance
+
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('ADMIN_SEARCH_LIMIT', '20'))
+SEARCH_MAX_LIMIT = int(os.environ.get('ADMIN_SEARCH_MAX_LIMIT', '100'))
+USERS_ETAG_SECONDS = int(os.environ.get('ADMIN_USERS_ETAG_SECONDS', '60'))
+
+encode_user = USERS.encoder(USERS.fields(None))
+encode_pending_game = PENDING_GAMES.encoder(PENDING_GAMES.fields(None))
+encode_user_hit = row_encoder({
+    'id': 0,
+    'email': 1,
+    'username': 2,
+    'avatar_url': 3,
+    'role': 4,
+    'balance': (5, money),
+    'is_banned': 6,
+    'is_verified': 7,
+    'score': 8
+})
+encode_game_revenue = row_encoder({'game_id': 0, 'revenue': (1, money), 'purchases': 2, 'refunds': 3})
+encode_day_revenue = row_encoder({'day': (0, str), 'revenue': (1, money), 'purchases': 2, 'refunds': 3})
+
+
+def escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def positive_amount(raw: Any) -> Decimal:
+    try:
+        amount = Decimal(str(raw))
+    except InvalidOperation as e:
+        raise ValueError('Invalid amount') from e
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError('Invalid amount')
+    return amount
+
+
+def listing_response(conn: Any, cur: Any, listing: Any, params: Dict[str, Any], conditions: list, args: list) -> Dict[str, Any]:
+    fmt = params.get('format')
+    try:
+        if fmt in EXPORT_FORMATS:
+            body, next_cursor = export(conn, listing, params, conditions, args, fmt)
+            headers = {'Content-Disposition': f'attachment; filename="{listing.table}.{fmt}"'}
+            if next_cursor:
+                # The export is cut at ADMIN_EXPORT_MAX_ROWS; the client asks again with cursor=<this>
+                headers.update({'X-Next-Cursor': next_cursor, 'Access-Control-Expose-Headers': 'ETag, X-Next-Cursor'})
+            return raw_response(body, headers=headers, content_type=EXPORT_FORMATS[fmt])
+        result = page(cur, listing, params, conditions, args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    return json_response(result)
+
+
+def bulk_users_response(conn: Any, cur: Any, body: Dict[str, Any], assignments: str, assignment_args: list,
+                        guard: str, guard_args: list, on_chunk: Any = None) -> Dict[str, Any]:
+    try:
+        ids, condition, args = parse_target(body, 'user_ids', USER_FILTERS)
+    except (TypeError, ValueError) as e:
+        return error_response(400, str(e))
+    
+    def users_changed(c: Any, updated: list) -> None:
+        if on_chunk is not None:
+            on_chunk(c, updated)
+        bump_version(c, 'users')
+    
+    result = bulk_update(conn, cur, 'users', assignments, assignment_args, guard, guard_args, ids, condition, args, users_changed)
+    return json_response({'message': 'Пользователи обновлены', **result})
+
+
+router = Router('GET, POST, PUT, OPTIONS')
+
+
+@router.route('GET', 'maintenance_status')
+def maintenance_status(req: Request) -> Dict[str, Any]:
+    return json_response({'maintenance_mode': is_maintenance(req.cur)})
+
+
+@router.route('GET', 'users', admin=True)
+def users(req: Request) -> Dict[str, Any]:
+    conn, cur, params = req.conn, req.cur, req.params
+    search = params.get('search', '')
+    if params.keys() & {'limit', 'cursor', 'fields', 'format'}:
+        if search:
+            return listing_response(conn, cur, USERS, params, ['username ILIKE %s'], [f'%{escape_like(search)}%'])
+        return listing_response(conn, cur, USERS, params, [], [])
+    
+    # Register, profile edits and admin mutations bump cache_version:users. Sales and refunds do not
+    # (one hot row for every purchase), so balances they change show up within USERS_ETAG_SECONDS
+    etag = etag_for('users', get_version(cur, 'users'), search, int(time.time() // USERS_ETAG_SECONDS))
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    if search:
+        cur.execute("SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified FROM t_p74122035_gde_store_creation.users WHERE username ILIKE %s ORDER BY is_verified DESC, username", (f'%{escape_like(search)}%',))
+    else:
+        cur.execute("SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified FROM t_p74122035_gde_store_creation.users ORDER BY is_verified DESC, username")
+    payload = dumps([encode_user(u) for u in cur.fetchall()])
+    return raw_response(payload, headers={'ETag': etag})
+
+
+@router.route('GET', 'search_users', fields={'limit': integer(SEARCH_DEFAULT_LIMIT, 1, SEARCH_MAX_LIMIT), 'offset': integer(0, low=0)},
+              invalid='Invalid limit or offset', admin=True)
+def search_users(req: Request) -> Dict[str, Any]:
+    term = req.params.get('q', '').strip()
+    limit, offset = req.args['limit'], req.args['offset']
+    
+    users = []
+    if term:
+        escaped = escape_like(term)
+        req.cur.execute("""
+            SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified, similarity(username, %(term)s) AS score
+            FROM t_p74122035_gde_store_creation.users
+            WHERE username ILIKE %(contains)s OR username %% %(term)s
+            ORDER BY username ILIKE %(prefix)s DESC, score DESC, username
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, {'term': term, 'contains': f'%{escaped}%', 'prefix': f'{escaped}%', 'limit': limit + 1, 'offset': offset})
+        users = req.cur.fetchall()
+    
+    return json_response({
+        'items': [encode_user_hit(u) for u in users[:limit]],
+        'next_offset': offset + limit if len(users) > limit else None
+    })
+
+
+@router.route('GET', 'pending_games', admin=True)
+def pending_games(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    if req.params.keys() & {'limit', 'cursor', 'fields', 'format'}:
+        return listing_response(req.conn, cur, PENDING_GAMES, req.params, [], [])
+    
+    etag = etag_for('pending_games', get_version(cur, 'games'), get_version(cur, 'moderation'))
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cur.execute("SELECT id, title, description, genre, age_rating, price, logo_url, file_url, contact_email, created_by, engine_type, validation FROM t_p74122035_gde_store_creation.games WHERE status = 'pending' ORDER BY created_at DESC")
+    
+    return json_response([encode_pending_game(g) for g in cur.fetchall()], headers={'ETag': etag})
+
+
+@router.route('GET', 'user_balance', admin=True)
+def user_balance(req: Request) -> Dict[str, Any]:
+    balance = ledger_balance(req.cur, req.params.get('user_id'))
+    if balance is None:
+        return error_response(404, 'Пользователь не найден')
+    
+    return json_response({
+        'balance': money(balance['balance']),
+        'stored_balance': money(balance['stored_balance']),
+        'snapshot_ledger_id': balance['snapshot_ledger_id'],
+        'tail_entries': balance['tail_entries']
+    })
+
+
+@router.route('GET', 'revenue_by_game', admin=True)
+@router.route('GET', 'revenue_by_day', admin=True)
+def revenue(req: Request) -> Dict[str, Any]:
+    try:
+        start, end = parse_range(req.params)
+        game_id = int(req.params['game_id']) if req.params.get('game_id') else None
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    if req.params['action'] == 'revenue_by_game':
+        items = [encode_game_revenue(r) for r in revenue_by_game(req.cur, start, end, game_id)]
+    else:
+        items = [encode_day_revenue(r) for r in revenue_by_day(req.cur, start, end)]
+    return json_response({'from': start.date().isoformat(), 'to': (end.date() - timedelta(days=1)).isoformat(), 'items': items})
+
+
+@router.route('PUT', 'ban_user', admin=True)
+def ban_user(req: Request) -> Dict[str, Any]:
+    user_id = req.body.get('user_id')
+    is_banned = req.body.get('is_banned', True)
+    req.cur.execute("UPDATE t_p74122035_gde_store_creation.users SET is_banned = %s WHERE id = %s", (is_banned, user_id))
+    revoke_user(req.cur, user_id)
+    bump_version(req.cur, 'users')
+    req.conn.commit()
+    
+    return json_response({'message': 'Статус бана обновлён'})
+
+
+@router.route('PUT', 'update_balance', admin=True)
+def update_balance(req: Request) -> Dict[str, Any]:
+    set_balance(req.cur, req.body.get('user_id'), req.body.get('balance'))
+    bump_version(req.cur, 'users')
+    req.conn.commit()
+    
+    return json_response({'message': 'Баланс обновлён'})
+
+
+@router.route('PUT', 'verify_user', admin=True)
+def verify_user(req: Request) -> Dict[str, Any]:
+    user_id = req.body.get('user_id')
+    is_verified = req.body.get('is_verified', True)
+    req.cur.execute("UPDATE t_p74122035_gde_store_creation.users SET is_verified = %s WHERE id = %s", (is_verified, user_id))
+    bump_version(req.cur, 'users')
+    req.conn.commit()
+    
+    return json_response({'message': 'Статус верификации обновлён'})
+
+
+@router.route('PUT', 'toggle_maintenance', admin=True)
+def toggle_maintenance(req: Request) -> Dict[str, Any]:
+    enabled = req.body.get('enabled', False)
+    value = 'true' if enabled else 'false'
+    req.cur.execute("INSERT INTO t_p74122035_gde_store_creation.system_settings (key, value, updated_at) VALUES ('maintenance_mode', %s, CURRENT_TIMESTAMP) ON CONFLICT (key) DO UPDATE SET value = %s, updated_at = CURRENT_TIMESTAMP", (value, value))
+    bump_version(req.cur, 'settings')
+    req.conn.commit()
+    invalidate_settings()
+    
+    return json_response({'message': 'Режим тех. работ обновлён', 'enabled': enabled})
+
+
+@router.route('PUT', 'add_balance', admin=True)
+def add_balance_route(req: Request) -> Dict[str, Any]:
+    new_balance = add_balance(req.cur, req.body.get('user_id'), req.body.get('amount'))
+    if new_balance is None:
+        return error_response(404, 'Пользователь не найден')
+    bump_version(req.cur, 'users')
+    req.conn.commit()
+    
+    return json_response({'message': 'Баланс добавлен', 'new_balance': money(new_balance)})
+
+
+@router.route('PUT', 'bulk_ban', admin=True)
+def bulk_ban(req: Request) -> Dict[str, Any]:
+    is_banned = bool(req.body.get('is_banned', True))
+    return bulk_users_response(req.conn, req.cur, req.body, 'is_banned = %s', [is_banned], 't.is_banned IS DISTINCT FROM %s', [is_banned], revoke_users)
+
+
+@router.route('PUT', 'bulk_verify', admin=True)
+def bulk_verify(req: Request) -> Dict[str, Any]:
+    is_verified = bool(req.body.get('is_verified', True))
+    return bulk_users_response(req.conn, req.cur, req.body, 'is_verified = %s', [is_verified], 't.is_verified IS DISTINCT FROM %s', [is_verified])
+
+
+@router.route('PUT', 'bulk_add_balance', fields={'amount': positive_amount}, admin=True)
+def bulk_add_balance(req: Request) -> Dict[str, Any]:
+    amount = req.args['amount']
+    return bulk_users_response(req.conn, req.cur, req.body, 'balance = t.balance + %s', [amount], 'TRUE', [], top_up_entries(amount))
+
+
+@router.route('PUT', 'compact_ledger', admin=True)
+def compact_ledger(req: Request) -> Dict[str, Any]:
+    result = compact(req.conn, req.cur)
+    return json_response({'message': 'Журнал баланса сжат', **result})
+
+
+@router.route('POST', 'create_frame', admin=True)
+def create_frame(req: Request) -> Dict[str, Any]:
+    name = req.body.get('name')
+    image_url = req.body.get('image_url')
+    price = req.body.get('price')
+    
+    req.cur.execute("INSERT INTO t_p74122035_gde_store_creation.frames (name, image_url, price) VALUES (%s, %s, %s) RETURNING id", (name, image_url, price))
+    frame_id = req.cur.fetchone()[0]
+    bump_version(req.cur, 'frames')
+    req.conn.commit()
+    
+    return json_response({'id': frame_id, 'message': 'Рамка создана'})
+
+
+@instrumented('admin')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Admin operations - manage users, frames, moderate games
     Args: event with httpMethod, body, queryStringParameters; context with request_id
     Returns: HTTP response with admin data or status
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    try:
-        if method == 'GET':
-            params = event.get('queryStringParameters') or {}
-            action = params.get('action')
-            
-            if action == 'maintenance_status':
-                cur.execute("SELECT value FROM t_p74122035_gde_store_creation.system_settings WHERE key = 'maintenance_mode'")
-                result = cur.fetchone()
-                is_maintenance = result[0] == 'true' if result else False
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'maintenance_mode': is_maintenance})
-                }
-            
-            elif action == 'users':
-                search = params.get('search', '')
-                if search:
-                    cur.execute("SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified FROM t_p74122035_gde_store_creation.users WHERE username ILIKE %s ORDER BY is_verified DESC, username", (f'%{search}%',))
-                else:
-                    cur.execute("SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified FROM t_p74122035_gde_store_creation.users ORDER BY is_verified DESC, username")
-                users = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': u[0],
-                        'email': u[1],
-                        'username': u[2],
-                        'avatar_url': u[3],
-                        'role': u[4],
-                        'balance': float(u[5]),
-                        'is_banned': u[6],
-                        'is_verified': u[7]
-                    } for u in users])
-                }
-            
-            elif action == 'pending_games':
-                cur.execute("SELECT id, title, description, genre, age_rating, price, logo_url, file_url, contact_email, created_by, engine_type FROM t_p74122035_gde_store_creation.games WHERE status = 'pending' ORDER BY created_at DESC")
-                games = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': g[0],
-                        'title': g[1],
-                        'description': g[2],
-                        'genre': g[3],
-                        'age_rating': g[4],
-                        'price': float(g[5]),
-                        'logo_url': g[6],
-                        'file_url': g[7],
-                        'contact_email': g[8],
-                        'created_by': g[9],
-                        'engine_type': g[10]
-                    } for g in games])
-                }
-            
-            return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'isBase64Encoded': False, 'body': json.dumps({'error': 'Invalid action'})}
-        
-        elif method == 'PUT':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'ban_user':
-                user_id = body.get('user_id')
-                is_banned = body.get('is_banned', True)
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET is_banned = %s WHERE id = %s", (is_banned, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Статус бана обновлён'})
-                }
-            
-            elif action == 'update_balance':
-                user_id = body.get('user_id')
-                balance = body.get('balance')
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET balance = %s WHERE id = %s", (balance, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Баланс обновлён'})
-                }
-            
-            elif action == 'verify_user':
-                user_id = body.get('user_id')
-                is_verified = body.get('is_verified', True)
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET is_verified = %s WHERE id = %s", (is_verified, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Статус верификации обновлён'})
-                }
-            
-            elif action == 'toggle_maintenance':
-                enabled = body.get('enabled', False)
-                value = 'true' if enabled else 'false'
-                cur.execute("INSERT INTO t_p74122035_gde_store_creation.system_settings (key, value, updated_at) VALUES ('maintenance_mode', %s, CURRENT_TIMESTAMP) ON CONFLICT (key) DO UPDATE SET value = %s, updated_at = CURRENT_TIMESTAMP", (value, value))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Режим тех. работ обновлён', 'enabled': enabled})
-                }
-            
-            elif action == 'add_balance':
-                user_id = body.get('user_id')
-                amount = body.get('amount')
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET balance = balance + %s WHERE id = %s RETURNING balance", (amount, user_id))
-                new_balance = cur.fetchone()[0]
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Баланс добавлен', 'new_balance': float(new_balance)})
-                }
-        
-        elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'create_frame':
-                name = body.get('name')
-                image_url = body.get('image_url')
-                price = body.get('price')
-                
-                cur.execute("INSERT INTO t_p74122035_gde_store_creation.frames (name, image_url, price) VALUES (%s, %s, %s) RETURNING id", (name, image_url, price))
-                frame_id = cur.fetchone()[0]
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'id': frame_id, 'message': 'Рамка создана'})
-                }
-        
-        return {'statusCode': 405, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Method not allowed'})}
-    
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+    return router.dispatch(event, context)
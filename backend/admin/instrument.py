@@ -0,0 +1,195 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+ENABLED = os.environ.get('REQUEST_METRICS', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+STATEMENT_LOG_CHARS = 500
+
+PHASES = ('connect', 'execute', 'fetch', 'commit', 'rollback', 'serialize')
+
+_local = threading.local()
+
+
+class Invocation:
+    '''
+    Business: Per-request timings and round-trip counters, filled by instrumented connections
+    Args: function name, HTTP method, action and request_id of the invocation
+    Returns: object whose summary() is the structured per-invocation log record
+    '''
+
+    def __init__(self, function: str, method: str, action: Optional[str], request_id: Optional[str]):
+        self.function = function
+        self.method = method
+        self.action = action
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.round_trips = 0
+        self.statements = 0
+        self.slow_statements = 0
+
+    def statement(self, query: Any, seconds: float) -> None:
+        self.seconds['execute'] += seconds
+        self.round_trips += 1
+        self.statements += 1
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            self.slow_statements += 1
+            text = query.decode(errors='replace') if isinstance(query, bytes) else str(query)
+            emit({
+                'event': 'slow_query',
+                'function': self.function,
+                'action': self.action,
+                'request_id': self.request_id,
+                'duration_ms': round(seconds * 1000, 3),
+                'statement': ' '.join(text.split())[:STATEMENT_LOG_CHARS],
+            })
+
+    def summary(self, status: int) -> Dict[str, Any]:
+        record = {
+            'event': 'request_summary',
+            'function': self.function,
+            'method': self.method,
+            'action': self.action,
+            'request_id': self.request_id,
+            'status': status,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+        }
+        record.update({f'{phase}_ms': round(seconds * 1000, 3) for phase, seconds in self.seconds.items()})
+        record.update(round_trips=self.round_trips, statements=self.statements, slow_statements=self.slow_statements)
+        return record
+
+
+def emit(record: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    sys.stdout.flush()
+
+
+def current() -> Optional[Invocation]:
+    return getattr(_local, 'invocation', None)
+
+
+def record(phase: str, seconds: float, round_trip: bool = False) -> None:
+    invocation = getattr(_local, 'invocation', None)
+    if invocation is not None:
+        invocation.seconds[phase] += seconds
+        if round_trip:
+            invocation.round_trips += 1
+
+
+@functools.lru_cache(maxsize=None)
+def _instrumented_connection() -> Any:
+    import psycopg2.extensions
+
+    class InstrumentedCursor(psycopg2.extensions.cursor):
+        def execute(self, query: Any, vars: Any = None) -> Any:
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                invocation = current()
+                if invocation is not None:
+                    invocation.statement(query, time.perf_counter() - started)
+
+        def executemany(self, query: Any, vars_list: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                invocation = current()
+                if invocation is not None:
+                    invocation.statement(query, time.perf_counter() - started)
+
+        def _timed_fetch(self, fetch: Callable, *args: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fetch(*args)
+            finally:
+                record('fetch', time.perf_counter() - started, round_trip=self.name is not None)
+
+        def fetchone(self) -> Any:
+            return self._timed_fetch(super().fetchone)
+
+        def fetchmany(self, size: Optional[int] = None) -> Any:
+            return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+        def fetchall(self) -> Any:
+            return self._timed_fetch(super().fetchall)
+
+    class InstrumentedConnection(psycopg2.extensions.connection):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(*args, **kwargs)
+            self.cursor_factory = InstrumentedCursor
+
+        def commit(self) -> None:
+            started = time.perf_counter()
+            try:
+                super().commit()
+            finally:
+                record('commit', time.perf_counter() - started, round_trip=True)
+
+        def rollback(self) -> None:
+            started = time.perf_counter()
+            try:
+                super().rollback()
+            finally:
+                record('rollback', time.perf_counter() - started, round_trip=True)
+
+    return InstrumentedConnection
+
+
+def connection_factory() -> Any:
+    '''
+    Business: Connection class for the pool, built on first use so that importing this module
+              does not load psycopg2
+    Args: none; REQUEST_METRICS=1 selects the instrumented connection
+    Returns: psycopg2 connection subclass, or None for the driver default
+    '''
+    return _instrumented_connection() if ENABLED else None
+
+
+def _action(event: Dict[str, Any]) -> Optional[str]:
+    action = (event.get('queryStringParameters') or {}).get('action')
+    if action is None and event.get('body'):
+        try:
+            body = json.loads(event['body'])
+        except ValueError:
+            return None
+        action = body.get('action') if isinstance(body, dict) else None
+    return action
+
+
+def instrumented(function: str) -> Callable[[Callable], Callable]:
+    '''
+    Business: Wraps a cloud function handler with per-request timing and a summary log line
+    Args: function - name reported in log records; REQUEST_METRICS=1 enables it, otherwise the
+          handler is returned untouched
+    Returns: decorator
+    '''
+    def decorate(handler: Callable) -> Callable:
+        if not ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            method = event.get('httpMethod', 'GET')
+            if method == 'OPTIONS':
+                return handler(event, context)
+            invocation = Invocation(function, method, _action(event), getattr(context, 'request_id', None))
+            _local.invocation = invocation
+            status = 500
+            try:
+                response = handler(event, context)
+                status = response.get('statusCode', 200)
+                return response
+            finally:
+                _local.invocation = None
+                emit(invocation.summary(status))
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,212 @@
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import SETTINGS_TABLE
+from watermark import committed_max
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+LEDGER_TOP_UP = 'top_up'
+LEDGER_ADJUSTMENT = 'adjustment'
+REVENUE_KINDS = ('purchase', 'refund')
+
+COMPACT_BATCH = int(os.environ.get('LEDGER_COMPACT_BATCH', '50000'))
+REPORT_DEFAULT_DAYS = int(os.environ.get('LEDGER_REPORT_DEFAULT_DAYS', '30'))
+REPORT_MAX_DAYS = int(os.environ.get('LEDGER_REPORT_MAX_DAYS', '366'))
+REPORT_MAX_GAMES = 500
+WATERMARK_KEY = 'ledger_compacted_id'
+
+ADD_BALANCE_SQL = f"""
+    WITH upd AS (
+        UPDATE {SCHEMA}.users SET balance = balance + %(amount)s WHERE id = %(user_id)s
+        RETURNING id, balance
+    ),
+    ledger AS (
+        INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind)
+        SELECT id, %(amount)s, %(kind)s FROM upd
+    )
+    SELECT balance FROM upd
+"""
+
+SET_BALANCE_SQL = f"""
+    WITH prev AS (
+        SELECT id, balance FROM {SCHEMA}.users WHERE id = %(user_id)s FOR UPDATE
+    ),
+    upd AS (
+        UPDATE {SCHEMA}.users u SET balance = %(balance)s
+        FROM prev WHERE u.id = prev.id
+        RETURNING u.balance
+    ),
+    ledger AS (
+        INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind)
+        SELECT prev.id, upd.balance - prev.balance, '{LEDGER_ADJUSTMENT}' FROM prev, upd
+        WHERE upd.balance <> prev.balance
+    )
+    SELECT balance FROM upd
+"""
+
+BALANCE_SQL = f"""
+    SELECT COALESCE(s.balance, 0) + COALESCE(tail.amount, 0), COALESCE(s.ledger_id, 0), tail.entries, u.balance
+    FROM {SCHEMA}.users u
+    LEFT JOIN {SCHEMA}.balance_snapshots s ON s.user_id = u.id
+    CROSS JOIN LATERAL (
+        SELECT SUM(l.amount) AS amount, COUNT(*) AS entries
+        FROM {SCHEMA}.balance_ledger l
+        WHERE l.user_id = u.id AND l.id > COALESCE(s.ledger_id, 0)
+    ) tail
+    WHERE u.id = %s
+"""
+
+COMPACT_SQL = f"""
+    WITH delta AS (
+        SELECT user_id, SUM(amount) AS amount
+        FROM {SCHEMA}.balance_ledger
+        WHERE id > %(after)s AND id <= %(upto)s
+        GROUP BY user_id
+    ),
+    snap AS (
+        INSERT INTO {SCHEMA}.balance_snapshots (user_id, balance, ledger_id, taken_at)
+        SELECT user_id, amount, %(upto)s, CURRENT_TIMESTAMP FROM delta
+        ON CONFLICT (user_id) DO UPDATE SET
+            balance = {SCHEMA}.balance_snapshots.balance + EXCLUDED.balance,
+            ledger_id = EXCLUDED.ledger_id,
+            taken_at = EXCLUDED.taken_at
+        RETURNING 1
+    )
+    UPDATE {SETTINGS_TABLE} SET value = %(upto)s::text, updated_at = CURRENT_TIMESTAMP
+    WHERE key = '{WATERMARK_KEY}'
+    RETURNING (SELECT COUNT(*) FROM snap)
+"""
+
+
+def add_balance(cur: Any, user_id: Any, amount: Any, kind: str = LEDGER_TOP_UP) -> Optional[Decimal]:
+    '''
+    Business: Credits a user's balance and records the credit in the ledger in one statement
+    Args: cur - open cursor, caller commits; user_id; amount; kind - ledger entry kind
+    Returns: new balance, or None when the user does not exist
+    '''
+    cur.execute(ADD_BALANCE_SQL, {'user_id': user_id, 'amount': amount, 'kind': kind})
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_balance(cur: Any, user_id: Any, balance: Any) -> Optional[Decimal]:
+    '''
+    Business: Overwrites a user's balance, recording the difference as an adjustment entry
+    Args: cur - open cursor, caller commits; user_id; balance - new absolute value
+    Returns: new balance, or None when the user does not exist
+    '''
+    cur.execute(SET_BALANCE_SQL, {'user_id': user_id, 'balance': balance})
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def top_up_entries(amount: Decimal) -> Callable[[Any, List[int]], None]:
+    def record(cur: Any, user_ids: List[int]) -> None:
+        cur.execute(
+            f"""INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind)
+                SELECT unnest(%s::int[]), %s, '{LEDGER_TOP_UP}'""",
+            (user_ids, amount)
+        )
+    return record
+
+
+def ledger_balance(cur: Any, user_id: Any) -> Optional[Dict[str, Any]]:
+    '''
+    Business: Reads a balance from the ledger - latest snapshot plus the entries written after it
+    Args: cur - open cursor; user_id
+    Returns: dict with balance, snapshot_ledger_id, tail_entries and the stored users.balance,
+             or None when the user does not exist
+    '''
+    cur.execute(BALANCE_SQL, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    balance, snapshot_id, entries, stored = row
+    return {'balance': balance, 'snapshot_ledger_id': snapshot_id, 'tail_entries': entries, 'stored_balance': stored}
+
+
+def compact(conn: Any, cur: Any, batch_size: int = COMPACT_BATCH) -> Dict[str, int]:
+    '''
+    Business: Folds new ledger entries into per-user balance snapshots, one id range per commit
+    Args: conn/cur - pooled connection with no open work and its cursor; batch_size ledger ids per commit
+    Returns: dict with from_id, to_id, batches and snapshots (rows upserted); only ids no open
+             transaction can still commit below are folded, the rest wait for the next run
+    '''
+    cur.execute(f"INSERT INTO {SETTINGS_TABLE} (key, value, updated_at) VALUES ('{WATERMARK_KEY}', '0', CURRENT_TIMESTAMP) ON CONFLICT (key) DO NOTHING")
+    conn.commit()
+    settled = committed_max(conn, cur, f'{SCHEMA}.balance_ledger', 'id') or 0
+
+    totals = {'from_id': 0, 'to_id': 0, 'batches': 0, 'snapshots': 0}
+    first = True
+    while True:
+        cur.execute(f"SELECT value::bigint FROM {SETTINGS_TABLE} WHERE key = '{WATERMARK_KEY}' FOR UPDATE")
+        after = cur.fetchone()[0]
+        if first:
+            totals['from_id'] = totals['to_id'] = after
+            first = False
+        if settled <= after:
+            conn.rollback()
+            break
+        upto = min(after + batch_size, settled)
+        cur.execute(COMPACT_SQL, {'after': after, 'upto': upto})
+        totals['snapshots'] += cur.fetchone()[0]
+        conn.commit()
+        totals['to_id'] = upto
+        totals['batches'] += 1
+    return totals
+
+
+def parse_range(params: Dict[str, Any]) -> Tuple[datetime, datetime]:
+    '''
+    Business: Reads a report date range from query params
+    Args: params with optional 'from' and 'to' (YYYY-MM-DD, both inclusive);
+          defaults to the last LEDGER_REPORT_DEFAULT_DAYS days
+    Returns: (start, end) datetimes, end exclusive; raises ValueError
+    '''
+    end_day = date.fromisoformat(params['to']) if params.get('to') else date.today()
+    start_day = date.fromisoformat(params['from']) if params.get('from') else end_day - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    if start_day > end_day:
+        raise ValueError('from must not be after to')
+    if (end_day - start_day).days >= REPORT_MAX_DAYS:
+        raise ValueError(f'At most {REPORT_MAX_DAYS} days per report')
+    return datetime.combine(start_day, datetime.min.time()), datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+
+
+def revenue_by_game(cur: Any, start: datetime, end: datetime, game_id: Optional[int] = None,
+                    limit: int = REPORT_MAX_GAMES) -> List[Tuple[Any, ...]]:
+    '''
+    Business: Net game revenue (purchases minus refunds) per game over a time range
+    Args: cur - open cursor; start/end - range, end exclusive; game_id to report a single game; limit rows
+    Returns: rows (game_id, revenue, purchases, refunds) by revenue descending
+    '''
+    condition, args = ('game_id = %s', [game_id]) if game_id is not None else ('game_id IS NOT NULL', [])
+    cur.execute(f"""
+        SELECT game_id, -SUM(amount) AS revenue,
+               COUNT(*) FILTER (WHERE kind = 'purchase'), COUNT(*) FILTER (WHERE kind = 'refund')
+        FROM {SCHEMA}.balance_ledger
+        WHERE {condition} AND created_at >= %s AND created_at < %s AND kind IN %s
+        GROUP BY game_id
+        ORDER BY revenue DESC, game_id
+        LIMIT %s
+    """, [*args, start, end, REVENUE_KINDS, limit])
+    return cur.fetchall()
+
+
+def revenue_by_day(cur: Any, start: datetime, end: datetime) -> List[Tuple[Any, ...]]:
+    '''
+    Business: Net store revenue (game and frame purchases minus refunds) per calendar day
+    Args: cur - open cursor; start/end - range, end exclusive
+    Returns: rows (day, revenue, purchases, refunds) by day
+    '''
+    cur.execute(f"""
+        SELECT created_at::date AS day, -SUM(amount),
+               COUNT(*) FILTER (WHERE kind = 'purchase'), COUNT(*) FILTER (WHERE kind = 'refund')
+        FROM {SCHEMA}.balance_ledger
+        WHERE created_at >= %s AND created_at < %s AND kind IN %s
+        GROUP BY day
+        ORDER BY day
+    """, (start, end, REVENUE_KINDS))
+    return cur.fetchall()
@@ -0,0 +1,185 @@
+import base64
+import csv
+import io
+import json
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from responses import dumps, money, row_encoder
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.environ.get('ADMIN_MAX_PAGE_SIZE', '500'))
+EXPORT_BATCH_SIZE = int(os.environ.get('ADMIN_EXPORT_BATCH_SIZE', '2000'))
+EXPORT_MAX_ROWS = int(os.environ.get('ADMIN_EXPORT_MAX_ROWS', '20000'))
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+Columns = Dict[str, Tuple[str, Optional[Callable[[Any], Any]]]]
+
+USER_COLUMNS: Columns = {
+    'id': ('id', None),
+    'email': ('email', None),
+    'username': ('username', None),
+    'avatar_url': ('avatar_url', None),
+    'role': ('role', None),
+    'balance': ('balance', money),
+    'is_banned': ('is_banned', None),
+    'is_verified': ('is_verified', None),
+}
+
+PENDING_GAME_COLUMNS: Columns = {
+    'id': ('id', None),
+    'title': ('title', None),
+    'description': ('description', None),
+    'genre': ('genre', None),
+    'age_rating': ('age_rating', None),
+    'price': ('price', money),
+    'logo_url': ('logo_url', None),
+    'file_url': ('file_url', None),
+    'contact_email': ('contact_email', None),
+    'created_by': ('created_by', None),
+    'engine_type': ('engine_type', None),
+    'validation': ('validation', None),
+}
+
+
+class Listing:
+    '''
+    Business: Keyset-ordered admin listing with column projection
+    Args: table, columns spec, key_columns selected after the projection, order_by,
+          keyset comparison matching that order, and base WHERE conditions
+    Returns: object that builds page and export queries
+    '''
+
+    def __init__(self, table: str, columns: Columns, key_columns: List[str], order_by: str, keyset: str, where: List[str]):
+        self.table = table
+        self.columns = columns
+        self.key_columns = key_columns
+        self.order_by = order_by
+        self.keyset = keyset
+        self.where = where
+
+    def fields(self, requested: Optional[str]) -> List[str]:
+        if not requested:
+            return list(self.columns)
+        fields = [f.strip() for f in requested.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in self.columns]
+        if unknown or not fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown) or '-'}")
+        return fields
+
+    def query(self, fields: List[str], conditions: List[str], args: List[Any], cursor: Optional[str], limit: Optional[int]) -> Tuple[str, List[Any]]:
+        conditions = self.where + conditions
+        args = list(args)
+        if cursor:
+            key = decode_cursor(cursor)
+            if len(key) != len(self.key_columns):
+                raise ValueError('Invalid cursor')
+            conditions.append(self.keyset)
+            args.extend(key)
+        select = ', '.join([self.columns[f][0] for f in fields] + self.key_columns)
+        sql = f"SELECT {select} FROM {SCHEMA}.{self.table}"
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {self.order_by}'
+        if limit is not None:
+            sql += ' LIMIT %s'
+            args.append(limit)
+        return sql, args
+
+    def encoder(self, fields: List[str]) -> Callable[[Tuple], Dict[str, Any]]:
+        return self._encoder(tuple(fields))
+
+    @lru_cache(maxsize=32)
+    def _encoder(self, fields: Tuple[str, ...]) -> Callable[[Tuple], Dict[str, Any]]:
+        converters = [self.columns[name][1] for name in fields]
+        return row_encoder({name: (i, convert) if convert else i for i, (name, convert) in enumerate(zip(fields, converters))})
+
+
+USERS = Listing(
+    'users', USER_COLUMNS,
+    key_columns=['NOT is_verified', 'username', 'id'],
+    order_by='NOT is_verified, username, id',
+    keyset='(NOT is_verified, username, id) > (%s, %s, %s)',
+    where=[],
+)
+
+PENDING_GAMES = Listing(
+    'games', PENDING_GAME_COLUMNS,
+    key_columns=['created_at', 'id'],
+    order_by='created_at DESC, id DESC',
+    keyset='(created_at, id) < (%s, %s)',
+    where=["status = 'pending'"],
+)
+
+
+def encode_cursor(values: Tuple) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page(cur: Any, listing: Listing, params: Dict[str, Any], conditions: List[str], args: List[Any]) -> Dict[str, Any]:
+    '''
+    Business: Fetches one keyset page of a listing
+    Args: cur - open cursor; listing; params with limit, cursor, fields; extra conditions and args
+    Returns: dict with items and next_cursor (None on the last page)
+    '''
+    fields = listing.fields(params.get('fields'))
+    limit = min(max(int(params.get('limit') or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    sql, sql_args = listing.query(fields, conditions, args, params.get('cursor'), limit + 1)
+    cur.execute(sql, sql_args)
+    rows = cur.fetchall()
+    encode = listing.encoder(fields)
+    next_cursor = encode_cursor(rows[limit - 1][len(fields):]) if len(rows) > limit else None
+    return {'items': [encode(r) for r in rows[:limit]], 'next_cursor': next_cursor}
+
+
+def export(conn: Any, listing: Listing, params: Dict[str, Any], conditions: List[str], args: List[Any], fmt: str,
+           max_rows: int = EXPORT_MAX_ROWS) -> Tuple[str, Optional[str]]:
+    '''
+    Business: Exports one part of a listing as NDJSON or CSV, read from a server-side cursor in
+              EXPORT_BATCH_SIZE batches; the response body is built whole, so a part is capped at max_rows
+    Args: conn - pooled connection (a transaction is opened); listing; params with fields, cursor;
+          extra conditions and args; fmt 'ndjson' or 'csv'; max_rows per part
+    Returns: (body, next_cursor) - pass next_cursor back as cursor for the next part, None after the last row
+    '''
+    fields = listing.fields(params.get('fields'))
+    sql, sql_args = listing.query(fields, conditions, args, params.get('cursor'), max_rows + 1)
+    encode = listing.encoder(fields)
+    width = len(fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(fields)
+
+    exported, last, more = 0, None, False
+    with conn.cursor(name=f'admin_export_{listing.table}') as cur:
+        cur.itersize = EXPORT_BATCH_SIZE
+        cur.execute(sql, sql_args)
+        while not more:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if exported + len(rows) > max_rows:
+                rows, more = rows[:max_rows - exported], True
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(r[:width] for r in rows)
+            else:
+                buffer.write(''.join(dumps(encode(r)) + '\n' for r in rows))
+            exported += len(rows)
+            last = rows[-1]
+    return buffer.getvalue(), encode_cursor(last[width:]) if more and last is not None else None
@@ -0,0 +1,196 @@
+import json
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from db import get_pool
+from responses import error_response, preflight_response
+from sessions import AuthError, Session, acting_user, authenticate, require_admin
+from settings import is_maintenance, maintenance_response
+
+Converter = Callable[[Any], Any]
+
+
+class Request:
+    '''
+    Business: One invocation as seen by a route handler
+    Args: event; params - query string; body - parsed JSON body ({} for GET); args - fields
+          converted by the route's declaration
+    Returns: object carrying the pooled conn/cur; routes declared with db=False get neither and
+             no session - they authenticate with a cursor of their own (see social receive)
+    '''
+
+    _unauthenticated = object()
+
+    def __init__(self, event: Dict[str, Any], params: Dict[str, Any], body: Dict[str, Any], args: Dict[str, Any]):
+        self.event = event
+        self.params = params
+        self.body = body
+        self.data = params if event.get('httpMethod', 'GET') == 'GET' else body
+        self.args = args
+        self.conn: Any = None
+        self.cur: Any = None
+        self._session: Any = self._unauthenticated
+
+    def session(self) -> Optional[Session]:
+        if self.cur is None:
+            raise RuntimeError('db=False routes resolve the session with their own cursor')
+        if self._session is self._unauthenticated:
+            self._session = authenticate(self.event, self.cur)
+        return self._session
+
+    def user_id(self) -> Any:
+        return acting_user(self.session(), self.data.get('user_id'))
+
+
+Handler = Callable[[Request], Dict[str, Any]]
+
+
+class Route(NamedTuple):
+    handler: Handler
+    fields: Dict[str, Converter]
+    invalid: Optional[str]
+    admin: bool
+    writes: bool
+    db: bool
+
+
+class Router:
+    '''
+    Business: Dispatch table keyed by (httpMethod, action) shared by the cloud functions
+    Args: methods - value of Access-Control-Allow-Methods for preflights
+    Returns: router whose dispatch(event) answers preflights, unknown methods or actions and
+             invalid fields before a database connection is taken (or psycopg2 imported)
+    '''
+
+    def __init__(self, methods: str):
+        self.methods = methods
+        self.routes: Dict[str, Dict[Optional[str], Route]] = {}
+
+    def route(self, method: str, action: Optional[str] = None, fields: Optional[Dict[str, Converter]] = None,
+              invalid: Optional[str] = None, admin: bool = False, writes: bool = False, db: bool = True) -> Callable[[Handler], Handler]:
+        '''
+        Business: Registers a handler for one (method, action); action None is the route taken
+                  when the request has no action
+        Args: fields - name to converter for values read from the query string (GET) or body,
+              a converter raising ValueError/TypeError answers 400 with invalid or the error text;
+              admin - require an admin session; writes - refuse during maintenance;
+              db - acquire a pooled connection for the handler (admin and writes need it)
+        Returns: decorator leaving the handler unchanged
+        '''
+        if not db and (admin or writes):
+            raise ValueError(f'{method} {action}: admin and writes checks need db=True')
+        
+        def register(handler: Handler) -> Handler:
+            self.routes.setdefault(method, {})[action] = Route(handler, fields or {}, invalid, admin, writes, db)
+            return handler
+        return register
+
+    def dispatch(self, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return preflight_response(self.methods)
+
+        routes = self.routes.get(method)
+        if routes is None:
+            return error_response(405, 'Method not allowed')
+
+        params = event.get('queryStringParameters') or {}
+        body: Dict[str, Any] = {}
+        if method != 'GET':
+            try:
+                body = json.loads(event.get('body') or '{}')
+            except ValueError:
+                return error_response(400, 'Invalid JSON body')
+            if not isinstance(body, dict):
+                return error_response(400, 'Invalid JSON body')
+
+        data = params if method == 'GET' else body
+        route = routes.get(data.get('action'))
+        if route is None:
+            return error_response(400, 'Invalid action')
+
+        try:
+            args = {name: convert(data.get(name)) for name, convert in route.fields.items()}
+        except (TypeError, ValueError) as e:
+            return error_response(400, route.invalid or str(e))
+
+        request = Request(event, params, body, args)
+        if not route.db:
+            try:
+                return route.handler(request)
+            except AuthError as e:
+                return error_response(e.status, str(e))
+
+        pool = get_pool()
+        request.conn = pool.acquire()
+        request.cur = request.conn.cursor()
+        try:
+            if route.writes and is_maintenance(request.cur):
+                return maintenance_response()
+            if route.admin:
+                require_admin(request.session())
+            return route.handler(request)
+        except AuthError as e:
+            return error_response(e.status, str(e))
+        finally:
+            request.cur.close()
+            pool.release(request.conn)
+
+
+def _bounded(cast: Callable[[Any], Any], default: Any, low: Any, high: Any) -> Converter:
+    def convert(raw: Any) -> Any:
+        if raw is None or raw == '':
+            if default is None:
+                raise ValueError('Missing value')
+            return default
+        value = cast(raw)
+        if low is not None and not value >= low:
+            raise ValueError(f'Must be at least {low}')
+        if high is not None and not value <= high:
+            value = high
+        return value
+    return convert
+
+
+def whole(raw: Any) -> int:
+    '''
+    Business: Strict int() - 2.7, "2.7" and true are rejected instead of read as 2 or 1
+    Args: raw - query string or JSON value
+    Returns: the integer; raises ValueError
+    '''
+    if isinstance(raw, bool) or (isinstance(raw, float) and not raw.is_integer()):
+        raise ValueError('Expected an integer')
+    if not isinstance(raw, (int, float, str)):
+        raise ValueError('Expected an integer')
+    return int(raw)
+
+
+def integer(default: Optional[int] = None, low: Optional[int] = None, high: Optional[int] = None) -> Converter:
+    '''
+    Business: Field converter for an integer
+    Args: default used when the value is missing or empty (None makes it required);
+          low - smaller values are rejected; high - documented maximum (page size, timeout),
+          larger values are capped to it
+    Returns: converter
+    '''
+    return _bounded(whole, default, low, high)
+
+
+def number(default: Optional[float] = None, low: Optional[float] = None, high: Optional[float] = None) -> Converter:
+    return _bounded(float, default, low, high)
+
+
+def text(raw: Any) -> str:
+    if raw is None:
+        return ''
+    if not isinstance(raw, str):
+        raise ValueError('Expected a string')
+    return raw
+
+
+def id_list(raw: Any) -> list:
+    if raw is None:
+        return []
+    if not isinstance(raw, (list, tuple)):
+        # A string would otherwise be read digit by digit: "12" is not [1, 2]
+        raise ValueError('Expected a list of ids')
+    return [whole(i) for i in raw]
@@ -0,0 +1,34 @@
+import os
+from typing import Any, Optional
+
+from db import driver
+
+LOCK_TIMEOUT_MS = int(os.environ.get('WATERMARK_LOCK_TIMEOUT_MS', '1000'))
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def committed_max(conn: Any, cur: Any, table: str, column: str, wait: bool = True) -> Optional[int]:
+    '''
+    Business: Highest value of a sequence-filled column that no open transaction can still commit
+              below. INSERT and UPDATE take ROW EXCLUSIVE on the table before nextval runs, so once
+              SHARE is granted every value handed out so far is committed or rolled back for good
+    Args: conn with no open work - this call ends the transaction, releasing the lock; cur - its cursor;
+          table - schema-qualified name; column; wait - queue behind running writers for up to
+          WATERMARK_LOCK_TIMEOUT_MS (new writers queue behind it meanwhile) instead of giving up at once
+    Returns: the bound (0 for an empty table), or None when writers were still running
+    '''
+    try:
+        if wait:
+            cur.execute(f'SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}')
+            cur.execute(f'LOCK TABLE {table} IN SHARE MODE')
+        else:
+            cur.execute(f'LOCK TABLE {table} IN SHARE MODE NOWAIT')
+    except driver().Error as e:
+        if e.pgcode != LOCK_NOT_AVAILABLE:
+            raise
+        conn.rollback()
+        return None
+    cur.execute(f'SELECT COALESCE(MAX({column}), 0) FROM {table}')
+    bound = cur.fetchone()[0]
+    conn.commit()
+    return bound
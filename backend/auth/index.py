@@ -1,294 +1,296 @@
-import json
 import os
-import psycopg2
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional, Sequence
 
+from cache import bump_version, etag_for, etag_matches, get_version, not_modified, response_cache
+from instrument import instrumented
+from passwords import hash_password, needs_rehash, verify_password
+from purchases import ALREADY_OWNED, INSUFFICIENT_FUNDS, NOT_FOUND, purchase
+from responses import dumps_bytes, error_response, json_response, money, raw_response, row_encoder
+from router import Request, Router, integer, text
+from sessions import acting_user, issue_token
+
+USER_COLUMNS = 'id, email, username, avatar_url, role, balance, is_verified, time_spent_hours, active_frame_id'
+
+encode_user = row_encoder({
+    'id': 0,
+    'email': 1,
+    'username': 2,
+    'avatar_url': 3,
+    'role': 4,
+    'balance': (5, money),
+    'is_verified': 6,
+    'time_spent_hours': 7,
+    'active_frame_id': 8
+})
+
+encode_library_entry = row_encoder({
+    'game_id': 0,
+    'game': {
+        'id': 1,
+        'title': 2,
+        'description': 3,
+        'genre': 4,
+        'age_rating': 5,
+        'price': (6, money),
+        'logo_url': 7,
+        'file_url': 8,
+        'status': 9
+    }
+})
+
+LIBRARY_SQL = """
+    SELECT gp.game_id, g.id, g.title, g.description, g.genre, g.age_rating, g.price, g.logo_url, g.file_url, g.status
+    FROM t_p74122035_gde_store_creation.game_purchases gp
+    JOIN t_p74122035_gde_store_creation.games g ON gp.game_id = g.id
+    WHERE gp.user_id = %s{filter}
+    ORDER BY gp.purchased_at, gp.id
+"""
+LIBRARY_ALL_SQL = LIBRARY_SQL.format(filter='')
+LIBRARY_SOME_SQL = LIBRARY_SQL.format(filter=' AND gp.game_id = ANY(%s)')
+MAX_LIBRARY_IDS = int(os.environ.get('LIBRARY_MAX_IDS', '200'))
+
+LIBRARY_RECOMMENDATIONS_SQL = """
+    WITH library AS (
+        SELECT game_ids FROM t_p74122035_gde_store_creation.user_libraries WHERE user_id = %(user_id)s
+    ),
+    scored AS (
+        SELECT r.recommended_id, SUM(r.score) AS score
+        FROM library, t_p74122035_gde_store_creation.game_recommendations r
+        WHERE r.game_id = ANY(library.game_ids) AND NOT r.recommended_id = ANY(library.game_ids)
+        GROUP BY r.recommended_id
+    )
+    SELECT g.id, g.title, g.description, g.genre, g.age_rating, g.price, g.logo_url, g.file_url, g.status, s.score
+    FROM scored s
+    JOIN t_p74122035_gde_store_creation.games g ON g.id = s.recommended_id AND g.status = 'approved'
+    ORDER BY s.score DESC, g.id
+    LIMIT %(limit)s
+"""
+RECOMMENDATIONS_LIMIT = int(os.environ.get('RECOMMENDATIONS_LIMIT', '12'))
+
+encode_recommendation = row_encoder({
+    'id': 0,
+    'title': 1,
+    'description': 2,
+    'genre': 3,
+    'age_rating': 4,
+    'price': (5, money),
+    'logo_url': 6,
+    'file_url': 7,
+    'status': 8,
+    'score': 9
+})
+
+encode_frame = row_encoder({'id': 0, 'name': 1, 'image_url': 2, 'price': (3, money)})
+
+
+def session_response(user: Sequence, is_banned: bool) -> Dict[str, Any]:
+    payload = encode_user(user)
+    issued = issue_token(user[0], user[4], is_banned)
+    if issued:
+        payload['token'], payload['token_expires_at'] = issued
+    return payload
+
+
+def parse_id_list(raw: Optional[str]) -> Optional[List[int]]:
+    if raw is None:
+        return None
+    ids = [int(part) for part in raw.split(',') if part.strip()]
+    if len(ids) > MAX_LIBRARY_IDS:
+        raise ValueError(f'At most {MAX_LIBRARY_IDS} ids per request')
+    return ids
+
+
+def library_revision(cur: Any, user_id: Any) -> int:
+    cur.execute("SELECT revision FROM t_p74122035_gde_store_creation.user_libraries WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+router = Router('GET, POST, PUT, OPTIONS')
+
+
+@router.route('GET', 'library', fields={'game_ids': parse_id_list}, invalid='Invalid game_ids')
+def library(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    user_id = req.user_id()
+    game_ids = req.args['game_ids']
+    
+    revision = library_revision(cur, user_id)
+    etag = etag_for('library', user_id, get_version(cur, 'games'), revision, req.params.get('game_ids'))
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    if game_ids is None:
+        cur.execute(LIBRARY_ALL_SQL, (user_id,))
+    else:
+        cur.execute(LIBRARY_SOME_SQL, (user_id, game_ids))
+    
+    return json_response([encode_library_entry(p) for p in cur.fetchall()], headers={'ETag': etag})
+
+
+@router.route('GET', 'library_ids')
+def library_ids(req: Request) -> Dict[str, Any]:
+    user_id = req.user_id()
+    req.cur.execute("SELECT revision, game_ids FROM t_p74122035_gde_store_creation.user_libraries WHERE user_id = %s", (user_id,))
+    library = req.cur.fetchone() or (0, [])
+    etag = etag_for('library_ids', user_id, library[0])
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    return json_response({'revision': library[0], 'game_ids': library[1]}, headers={'ETag': etag})
+
+
+@router.route('GET', 'recommendations', fields={'limit': integer(RECOMMENDATIONS_LIMIT, 1, MAX_LIBRARY_IDS)}, invalid='Invalid limit')
+def recommendations(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    user_id = req.user_id()
+    limit = req.args['limit']
+    
+    etag = etag_for('recommendations', user_id, limit, library_revision(cur, user_id), get_version(cur, 'recommendations'))
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cur.execute(LIBRARY_RECOMMENDATIONS_SQL, {'user_id': user_id, 'limit': limit})
+    
+    return json_response([encode_recommendation(g) for g in cur.fetchall()], headers={'ETag': etag})
+
+
+@router.route('GET', 'frames')
+def frames(req: Request) -> Dict[str, Any]:
+    version = get_version(req.cur, 'frames')
+    etag = etag_for('frames', version)
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cached = response_cache.get('frames', version)
+    if cached is not None:
+        return raw_response(cached, headers={'ETag': etag, 'X-Cache': 'HIT'})
+    
+    req.cur.execute("SELECT id, name, image_url, price FROM t_p74122035_gde_store_creation.frames ORDER BY id")
+    payload = dumps_bytes([encode_frame(f) for f in req.cur.fetchall()])
+    response_cache.set('frames', version, payload)
+    
+    return raw_response(payload, headers={'ETag': etag, 'X-Cache': 'MISS'})
+
+
+@router.route('GET', 'user_frames')
+def user_frames(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    user_id = req.user_id()
+    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM t_p74122035_gde_store_creation.user_frames WHERE user_id = %s", (user_id,))
+    etag = etag_for('user_frames', user_id, *cur.fetchone())
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cur.execute("SELECT frame_id FROM t_p74122035_gde_store_creation.user_frames WHERE user_id = %s", (user_id,))
+    
+    return json_response([{'frame_id': f[0]} for f in cur.fetchall()], headers={'ETag': etag})
+
+
+@router.route('POST', 'login', fields={'email': text, 'password': text}, invalid='Invalid email or password')
+def login(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    email, password = req.args['email'], req.args['password']
+    
+    cur.execute(f"SELECT {USER_COLUMNS}, is_banned, password FROM t_p74122035_gde_store_creation.users WHERE email = %s", (email,))
+    user = cur.fetchone()
+    
+    if not verify_password(password, user[10] if user else None):
+        return error_response(401, 'Неверный email или пароль')
+    
+    if user[9]:
+        return error_response(403, 'Вы заблокированы')
+    
+    if needs_rehash(user[10]):
+        cur.execute("UPDATE t_p74122035_gde_store_creation.users SET password = %s WHERE id = %s AND password = %s",
+                   (hash_password(password), user[0], user[10]))
+        req.conn.commit()
+    
+    return json_response(session_response(user, False))
+
+
+@router.route('POST', 'register', fields={'email': text, 'password': text, 'username': text},
+              invalid='Invalid email, password or username')
+def register(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    email, password, username = req.args['email'], req.args['password'], req.args['username']
+    
+    cur.execute("SELECT id FROM t_p74122035_gde_store_creation.users WHERE email = %s", (email,))
+    if cur.fetchone():
+        return error_response(409, 'Пользователь с таким email уже существует')
+    
+    cur.execute(f"INSERT INTO t_p74122035_gde_store_creation.users (email, password, username) VALUES (%s, %s, %s) RETURNING {USER_COLUMNS}",
+               (email, hash_password(password), username))
+    user = cur.fetchone()
+    bump_version(cur, 'users')
+    req.conn.commit()
+    
+    return json_response(session_response(user, False))
+
+
+@router.route('POST', 'purchase_frame', writes=True)
+def purchase_frame(req: Request) -> Dict[str, Any]:
+    result = purchase(req.conn, 'frame', req.user_id(), req.body.get('frame_id'))
+    
+    if result['status'] == NOT_FOUND:
+        return error_response(404, 'Frame not found', result=result['status'])
+    if result['status'] == INSUFFICIENT_FUNDS:
+        return error_response(400, 'Недостаточно средств', result=result['status'])
+    if result['status'] == ALREADY_OWNED:
+        return error_response(409, 'Рамка уже куплена', result=result['status'])
+    
+    return json_response({'message': 'Рамка куплена', 'result': result['status'], 'balance': result['balance']})
+
+
+@router.route('PUT', 'refresh_user')
+def refresh_user(req: Request) -> Dict[str, Any]:
+    # New sessions come only from login and register. A valid token is renewed for its own user;
+    # legacy callers without one get their profile back but never a token.
+    session = req.session()
+    user_id = req.user_id() if session is None else acting_user(session, None)
+    
+    req.cur.execute(f"SELECT {USER_COLUMNS}, is_banned FROM t_p74122035_gde_store_creation.users WHERE id = %s", (user_id,))
+    user = req.cur.fetchone()
+    
+    if not user:
+        return error_response(404, 'User not found')
+    
+    if session is None:
+        return json_response(encode_user(user))
+    return json_response(session_response(user, user[9]))
+
+
+@router.route('PUT', 'update_profile')
+def update_profile(req: Request) -> Dict[str, Any]:
+    user_id = req.user_id()
+    username = req.body.get('username')
+    avatar_url = req.body.get('avatar_url')
+    
+    req.cur.execute(f"UPDATE t_p74122035_gde_store_creation.users SET username = %s, avatar_url = %s WHERE id = %s RETURNING {USER_COLUMNS}", (username, avatar_url, user_id))
+    user = req.cur.fetchone()
+    bump_version(req.cur, 'users')
+    req.conn.commit()
+    
+    return json_response({'message': 'Профиль обновлён', 'user': encode_user(user)})
+
+
+@router.route('PUT', 'set_frame')
+def set_frame(req: Request) -> Dict[str, Any]:
+    user_id = req.user_id()
+    frame_id = req.body.get('frame_id')
+    
+    req.cur.execute(f"UPDATE t_p74122035_gde_store_creation.users SET active_frame_id = %s WHERE id = %s RETURNING {USER_COLUMNS}", (frame_id, user_id))
+    user = req.cur.fetchone()
+    req.conn.commit()
+    
+    return json_response({'message': 'Рамка установлена', 'user': encode_user(user)})
+
+
+@instrumented('auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Handles user authentication, registration, library, frames
     Args: event with httpMethod, body; context with request_id
     Returns: HTTP response with user data or error
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    try:
-        if method == 'GET':
-            params = event.get('queryStringParameters') or {}
-            action = params.get('action')
-            
-            if action == 'library':
-                user_id = params.get('user_id')
-                cur.execute("""
-                    SELECT gp.game_id, g.id, g.title, g.description, g.genre, g.age_rating, g.price, g.logo_url, g.file_url, g.status
-                    FROM t_p74122035_gde_store_creation.game_purchases gp
-                    JOIN t_p74122035_gde_store_creation.games g ON gp.game_id = g.id
-                    WHERE gp.user_id = %s
-                """, (user_id,))
-                purchases = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'game_id': p[0],
-                        'game': {
-                            'id': p[1],
-                            'title': p[2],
-                            'description': p[3],
-                            'genre': p[4],
-                            'age_rating': p[5],
-                            'price': float(p[6]),
-                            'logo_url': p[7],
-                            'file_url': p[8],
-                            'status': p[9]
-                        }
-                    } for p in purchases])
-                }
-            
-            elif action == 'frames':
-                cur.execute("SELECT id, name, image_url, price FROM t_p74122035_gde_store_creation.frames ORDER BY id")
-                frames = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': f[0],
-                        'name': f[1],
-                        'image_url': f[2],
-                        'price': float(f[3])
-                    } for f in frames])
-                }
-            
-            elif action == 'user_frames':
-                user_id = params.get('user_id')
-                cur.execute("SELECT frame_id FROM t_p74122035_gde_store_creation.user_frames WHERE user_id = %s", (user_id,))
-                user_frames = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{'frame_id': f[0]} for f in user_frames])
-                }
-        
-        elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'login':
-                email = body.get('email', '')
-                password = body.get('password', '')
-                
-                cur.execute("SELECT id, email, username, avatar_url, role, balance, is_banned, is_verified, time_spent_hours, active_frame_id FROM t_p74122035_gde_store_creation.users WHERE email = %s AND password = %s", (email, password))
-                user = cur.fetchone()
-                
-                if not user:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Неверный email или пароль'})
-                    }
-                
-                if user[6]:
-                    return {
-                        'statusCode': 403,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Вы заблокированы'})
-                    }
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'id': user[0],
-                        'email': user[1],
-                        'username': user[2],
-                        'avatar_url': user[3],
-                        'role': user[4],
-                        'balance': float(user[5]),
-                        'is_verified': user[7],
-                        'time_spent_hours': user[8],
-                        'active_frame_id': user[9]
-                    })
-                }
-            
-            elif action == 'register':
-                email = body.get('email', '')
-                password = body.get('password', '')
-                username = body.get('username', '')
-                
-                cur.execute("SELECT id FROM t_p74122035_gde_store_creation.users WHERE email = %s", (email,))
-                if cur.fetchone():
-                    return {
-                        'statusCode': 409,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Пользователь с таким email уже существует'})
-                    }
-                
-                cur.execute("INSERT INTO t_p74122035_gde_store_creation.users (email, password, username) VALUES (%s, %s, %s) RETURNING id, email, username, avatar_url, role, balance, is_verified, time_spent_hours", 
-                           (email, password, username))
-                user = cur.fetchone()
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'id': user[0],
-                        'email': user[1],
-                        'username': user[2],
-                        'avatar_url': user[3],
-                        'role': user[4],
-                        'balance': float(user[5]),
-                        'is_verified': user[6],
-                        'time_spent_hours': user[7]
-                    })
-                }
-            
-            elif action == 'purchase_frame':
-                user_id = body.get('user_id')
-                frame_id = body.get('frame_id')
-                
-                cur.execute("SELECT price FROM t_p74122035_gde_store_creation.frames WHERE id = %s", (frame_id,))
-                frame = cur.fetchone()
-                if not frame:
-                    return {'statusCode': 404, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Frame not found'})}
-                
-                price = float(frame[0])
-                
-                cur.execute("SELECT balance FROM t_p74122035_gde_store_creation.users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                if float(user[0]) < price:
-                    return {'statusCode': 400, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Недостаточно средств'})}
-                
-                cur.execute("INSERT INTO t_p74122035_gde_store_creation.user_frames (user_id, frame_id) VALUES (%s, %s) ON CONFLICT DO NOTHING", (user_id, frame_id))
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET balance = balance - %s WHERE id = %s", (price, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Рамка куплена'})
-                }
-        
-        elif method == 'PUT':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'refresh_user':
-                user_id = body.get('user_id')
-                
-                cur.execute("SELECT id, email, username, avatar_url, role, balance, is_verified, time_spent_hours, active_frame_id FROM t_p74122035_gde_store_creation.users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                
-                if not user:
-                    return {'statusCode': 404, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'User not found'})}
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'id': user[0],
-                        'email': user[1],
-                        'username': user[2],
-                        'avatar_url': user[3],
-                        'role': user[4],
-                        'balance': float(user[5]),
-                        'is_verified': user[6],
-                        'time_spent_hours': user[7],
-                        'active_frame_id': user[8]
-                    })
-                }
-            
-            elif action == 'update_profile':
-                user_id = body.get('user_id')
-                username = body.get('username')
-                avatar_url = body.get('avatar_url')
-                
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET username = %s, avatar_url = %s WHERE id = %s RETURNING id, email, username, avatar_url, role, balance, is_verified, time_spent_hours, active_frame_id", (username, avatar_url, user_id))
-                user = cur.fetchone()
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'message': 'Профиль обновлён',
-                        'user': {
-                            'id': user[0],
-                            'email': user[1],
-                            'username': user[2],
-                            'avatar_url': user[3],
-                            'role': user[4],
-                            'balance': float(user[5]),
-                            'is_verified': user[6],
-                            'time_spent_hours': user[7],
-                            'active_frame_id': user[8]
-                        }
-                    })
-                }
-            
-            elif action == 'set_frame':
-                user_id = body.get('user_id')
-                frame_id = body.get('frame_id')
-                
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET active_frame_id = %s WHERE id = %s RETURNING id, email, username, avatar_url, role, balance, is_verified, time_spent_hours, active_frame_id", (frame_id, user_id))
-                user = cur.fetchone()
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'message': 'Рамка установлена',
-                        'user': {
-                            'id': user[0],
-                            'email': user[1],
-                            'username': user[2],
-                            'avatar_url': user[3],
-                            'role': user[4],
-                            'balance': float(user[5]),
-                            'is_verified': user[6],
-                            'time_spent_hours': user[7],
-                            'active_frame_id': user[8]
-                        }
-                    })
-                }
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+    return router.dispatch(event, context)
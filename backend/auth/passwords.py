@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import os
+from typing import NamedTuple, Optional
+
+SCHEME = 'scrypt'
+
+
+class ScryptParams(NamedTuple):
+    n: int
+    r: int
+    p: int
+
+    @property
+    def maxmem(self) -> int:
+        return 128 * self.n * self.r * (self.p + 1) + 1024 * 1024
+
+
+DEFAULT_PARAMS = ScryptParams(
+    n=int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 14))),
+    r=int(os.environ.get('PASSWORD_SCRYPT_R', '8')),
+    p=int(os.environ.get('PASSWORD_SCRYPT_P', '1')),
+)
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Checked when the account does not exist, so an unknown email costs the same scrypt run as a wrong password
+_MISSING_ACCOUNT = (DEFAULT_PARAMS, bytes(SALT_BYTES), bytes(KEY_BYTES))
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _derive(password: str, salt: bytes, params: ScryptParams, length: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=params.n, r=params.r, p=params.p, maxmem=params.maxmem, dklen=length)
+
+
+def _parse(stored: str) -> Optional[tuple]:
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        params = ScryptParams(int(parts[1]), int(parts[2]), int(parts[3]))
+        return params, _b64decode(parts[4]), _b64decode(parts[5])
+    except ValueError:
+        return None
+
+
+def hash_password(password: str, params: ScryptParams = DEFAULT_PARAMS) -> str:
+    '''
+    Business: Derives a storable scrypt hash for a password
+    Args: password; params - scrypt cost (n, r, p), defaults from PASSWORD_SCRYPT_* env vars
+    Returns: 'scrypt$n$r$p$salt$key' string for users.password
+    '''
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(password, salt, params, KEY_BYTES)
+    return f'{SCHEME}${params.n}${params.r}${params.p}${_b64encode(salt)}${_b64encode(key)}'
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    '''
+    Business: Checks a password against a stored hash, or against a legacy plaintext value
+    Args: password from the login form; stored users.password value, None for an unknown account
+    Returns: True when they match
+    '''
+    if not stored:
+        params, salt, key = _MISSING_ACCOUNT
+        hmac.compare_digest(_derive(password, salt, params, len(key)), key)
+        return False
+    parsed = _parse(stored)
+    if parsed is None:
+        return hmac.compare_digest(password.encode(), stored.encode())
+    params, salt, key = parsed
+    return hmac.compare_digest(_derive(password, salt, params, len(key)), key)
+
+
+def needs_rehash(stored: str, params: ScryptParams = DEFAULT_PARAMS) -> bool:
+    parsed = _parse(stored)
+    return parsed is None or parsed[0] != params
@@ -0,0 +1,102 @@
+import json
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from instrument import record
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag'}
+JSON_HEADERS = {'Content-Type': 'application/json', **CORS_HEADERS}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def _dumps_bytes(payload: Any) -> bytes:
+        return orjson.dumps(payload, default=_default)
+else:
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+
+    def _dumps_bytes(payload: Any) -> bytes:
+        return _encoder.encode(payload).encode()
+
+
+def dumps_bytes(payload: Any) -> bytes:
+    started = time.perf_counter()
+    body = _dumps_bytes(payload)
+    record('serialize', time.perf_counter() - started)
+    return body
+
+
+def dumps(payload: Any) -> str:
+    return dumps_bytes(payload).decode()
+
+
+def money(value: Optional[Decimal]) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def row_encoder(spec: Dict[str, Any]) -> Callable[[Sequence], Dict[str, Any]]:
+    '''
+    Business: Compiles a tuple-to-dict encoder for one query shape, once at import time
+    Args: spec mapping output key to a column index, a (column index, converter) pair or a nested spec
+    Returns: function turning a result row into the response dict
+    '''
+    converters: Dict[str, Callable] = {}
+
+    def source(node: Dict[str, Any]) -> str:
+        parts = []
+        for key, column in node.items():
+            if isinstance(column, dict):
+                value = source(column)
+            elif isinstance(column, tuple):
+                name = f'_c{len(converters)}'
+                converters[name] = column[1]
+                value = f'{name}(r[{column[0]}])'
+            else:
+                value = f'r[{column}]'
+            parts.append(f'{key!r}: {value}')
+        return '{' + ', '.join(parts) + '}'
+
+    return eval(f'lambda r: {source(spec)}', converters)
+
+
+def json_response(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return raw_response(dumps(payload), status, headers)
+
+
+def raw_response(body: Union[str, bytes], status: int = 200, headers: Optional[Dict[str, str]] = None, content_type: str = 'application/json') -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, 'Content-Type': content_type, **(headers or {})},
+        'isBase64Encoded': False,
+        'body': body.decode() if isinstance(body, bytes) else body
+    }
+
+
+def error_response(status: int, message: str, **extra: Any) -> Dict[str, Any]:
+    return json_response({'error': message, **extra}, status)
+
+
+def preflight_response(methods: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Session-Token, X-User-Id, If-None-Match',
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': ''
+    }
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '').encode()
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '900'))
+SESSION_REQUIRED = os.environ.get('SESSION_REQUIRED', '').lower() in ('1', 'true', 'yes')
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('SESSION_REVOCATION_REFRESH_SECONDS', '15'))
+
+
+class Session(NamedTuple):
+    user_id: int
+    role: str
+    is_banned: bool
+    issued_at_ms: int
+    expires_at: int
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'admin' and not self.is_banned
+
+
+class AuthError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, role: str, is_banned: bool) -> Optional[Tuple[str, int]]:
+    '''
+    Business: Issues a short-lived signed session token with the claims handlers authorize from
+    Args: user_id, role and is_banned of the user row
+    Returns: (token, expires_at unix seconds), or None when SESSION_SECRET is not configured
+    '''
+    if not SESSION_SECRET:
+        return None
+    now = time.time()
+    expires_at = int(now) + SESSION_TTL_SECONDS
+    claims = {'uid': user_id, 'role': role, 'ban': bool(is_banned), 'iat': int(now * 1000), 'exp': expires_at}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{payload}.{_sign(payload)}', expires_at
+
+
+def decode_token(token: str) -> Session:
+    '''
+    Business: Verifies a session token signature and expiry without touching the database
+    Args: token as issued by issue_token
+    Returns: Session with the signed claims; raises AuthError(401) when invalid or expired
+    '''
+    if not SESSION_SECRET:
+        raise AuthError(401, 'Sessions are not configured')
+    payload, _, signature = token.partition('.')
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        raise AuthError(401, 'Invalid session token')
+    try:
+        claims = json.loads(_b64decode(payload))
+        session = Session(int(claims['uid']), str(claims['role']), bool(claims['ban']), int(claims['iat']), int(claims['exp']))
+    except (ValueError, KeyError, TypeError):
+        raise AuthError(401, 'Invalid session token')
+    if session.expires_at <= time.time():
+        raise AuthError(401, 'Session expired')
+    return session
+
+
+def bearer_token(event: Dict[str, Any]) -> Optional[str]:
+    headers = event.get('headers') or {}
+    for key, value in headers.items():
+        name = key.lower()
+        if name == 'authorization' and value and value[:7].lower() == 'bearer ':
+            return value[7:].strip()
+        if name == 'x-session-token' and value:
+            return value.strip()
+    return None
+
+
+_revoked: Dict[int, int] = {}
+_revoked_loaded_at = float('-inf')
+_revoked_lock = threading.Lock()
+
+
+def _revocations(cur: Any) -> Dict[int, int]:
+    global _revoked, _revoked_loaded_at
+    now = time.monotonic()
+    if now - _revoked_loaded_at < REVOCATION_REFRESH_SECONDS:
+        return _revoked
+    with _revoked_lock:
+        if now - _revoked_loaded_at >= REVOCATION_REFRESH_SECONDS:
+            horizon_ms = int((time.time() - SESSION_TTL_SECONDS) * 1000)
+            cur.execute(f"SELECT user_id, revoked_at_ms FROM {SCHEMA}.session_revocations WHERE revoked_at_ms > %s", (horizon_ms,))
+            _revoked = dict(cur.fetchall())
+            _revoked_loaded_at = now
+    return _revoked
+
+
+def revoke_user(cur: Any, user_id: int) -> None:
+    '''
+    Business: Invalidates every session token issued to a user up to now (ban, unban)
+    Args: cur - open cursor, caller commits; user_id
+    Returns: None; other containers pick it up within SESSION_REVOCATION_REFRESH_SECONDS
+    '''
+    revoked_at_ms = int(time.time() * 1000)
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.session_revocations (user_id, revoked_at_ms) VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET revoked_at_ms = EXCLUDED.revoked_at_ms""",
+        (user_id, revoked_at_ms)
+    )
+    with _revoked_lock:
+        _revoked[int(user_id)] = revoked_at_ms
+
+
+def revoke_users(cur: Any, user_ids: List[int]) -> None:
+    revoked_at_ms = int(time.time() * 1000)
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.session_revocations (user_id, revoked_at_ms)
+            SELECT unnest(%s::int[]), %s
+            ON CONFLICT (user_id) DO UPDATE SET revoked_at_ms = EXCLUDED.revoked_at_ms""",
+        (user_ids, revoked_at_ms)
+    )
+    with _revoked_lock:
+        _revoked.update(dict.fromkeys((int(i) for i in user_ids), revoked_at_ms))
+
+
+def authenticate(event: Dict[str, Any], cur: Any) -> Optional[Session]:
+    '''
+    Business: Resolves the caller's session from the Authorization header
+    Args: event; cur - used only when the in-memory revocation list is due for a refresh
+    Returns: Session, or None when no token was sent; raises AuthError(401) for bad or revoked tokens
+    '''
+    token = bearer_token(event)
+    if token is None:
+        return None
+    session = decode_token(token)
+    if _revocations(cur).get(session.user_id, -1) >= session.issued_at_ms:
+        raise AuthError(401, 'Session revoked')
+    return session
+
+
+def acting_user(session: Optional[Session], claimed_user_id: Any) -> Any:
+    '''
+    Business: Picks the user a request acts for - the token's user, or the legacy body user_id
+    Args: session from authenticate; claimed_user_id from the request body or query
+    Returns: user id; raises AuthError when a token user acts for someone else, is banned,
+             or when SESSION_REQUIRED is set and no token was sent
+    '''
+    if session is None:
+        if SESSION_REQUIRED:
+            raise AuthError(401, 'Требуется авторизация')
+        return claimed_user_id
+    if session.is_banned:
+        raise AuthError(403, 'Вы заблокированы')
+    if claimed_user_id in (None, '') or str(claimed_user_id) == str(session.user_id):
+        return session.user_id
+    if session.is_admin:
+        return claimed_user_id
+    raise AuthError(403, 'Недостаточно прав')
+
+
+def require_admin(session: Optional[Session]) -> None:
+    if session is None:
+        if SESSION_REQUIRED:
+            raise AuthError(401, 'Требуется авторизация')
+        return
+    if not session.is_admin:
+        raise AuthError(403, 'Недостаточно прав')
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cache import SETTINGS_TABLE, VERSION_KEY_PREFIX
+
+SETTINGS_TTL = float(os.environ.get('SETTINGS_CACHE_TTL_SECONDS', '5'))
+VERSION_KEY = VERSION_KEY_PREFIX + 'settings'
+
+_lock = threading.Lock()
+_snapshot: Dict[str, Any] = {'version': None, 'values': {}, 'expires_at': 0.0}
+_stats = {'hits': 0, 'checks': 0, 'reloads': 0}
+
+
+def _refresh(cur: Any) -> None:
+    cur.execute(
+        f"""SELECT key, value FROM {SETTINGS_TABLE}
+            WHERE key = %(version_key)s
+               OR COALESCE((SELECT value FROM {SETTINGS_TABLE} WHERE key = %(version_key)s), '0') IS DISTINCT FROM %(known)s""",
+        {'version_key': VERSION_KEY, 'known': _snapshot['version']}
+    )
+    rows = dict(cur.fetchall())
+    version = rows.get(VERSION_KEY, '0')
+    _stats['checks'] += 1
+    if version != _snapshot['version'] or len(rows) > 1:
+        _snapshot['values'] = rows
+        _snapshot['version'] = version
+        _stats['reloads'] += 1
+    _snapshot['expires_at'] = time.monotonic() + SETTINGS_TTL
+
+
+def get_setting(cur: Any, key: str, default: Optional[str] = None) -> Optional[str]:
+    '''
+    Business: Reads a system_settings value from the per-container snapshot
+    Args: cur - open cursor, used only when the snapshot is older than SETTINGS_CACHE_TTL_SECONDS;
+          key; default when the key is missing
+    Returns: setting value; at most SETTINGS_CACHE_TTL_SECONDS stale after the version is bumped
+    '''
+    with _lock:
+        if _snapshot['expires_at'] <= time.monotonic():
+            _refresh(cur)
+        else:
+            _stats['hits'] += 1
+        return _snapshot['values'].get(key, default)
+
+
+def invalidate() -> None:
+    with _lock:
+        _snapshot['expires_at'] = 0.0
+
+
+def is_maintenance(cur: Any) -> bool:
+    return get_setting(cur, 'maintenance_mode', 'false') == 'true'
+
+
+def maintenance_response() -> Dict[str, Any]:
+    return {
+        'statusCode': 503,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(int(SETTINGS_TTL) or 1)},
+        'isBase64Encoded': False,
+        'body': json.dumps({'error': 'Технические работы', 'maintenance_mode': True})
+    }
+
+
+def settings_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from instrument import connection_factory, record
+
+
+def driver() -> Any:
+    # Imported on the first connection, so preflights and rejected requests never load psycopg2
+    import psycopg2
+    import psycopg2.extensions
+    return psycopg2
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Business: Keeps Postgres connections alive across warm invocations of one container
+    Args: dsn for psycopg2.connect, max_size cap per container, healthcheck_interval in seconds
+          after which an idle connection is probed before reuse, acquire_timeout in seconds,
+          connection_factory passed to psycopg2.connect
+    Returns: pool with acquire/release and hit/miss/reconnect counters
+    '''
+
+    def __init__(self, dsn: str, max_size: int = 4, healthcheck_interval: float = 30.0, acquire_timeout: float = 5.0, connection_factory: Any = None):
+        self.dsn = dsn
+        self.connection_factory = connection_factory
+        self.max_size = max(1, max_size)
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[Any] = []
+        self._last_used: Dict[int, float] = {}
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'health_checks': 0, 'discarded': 0, 'waits': 0}
+
+    def _connect(self) -> Any:
+        return driver().connect(self.dsn, connection_factory=self.connection_factory)
+
+    def _is_alive(self, conn: Any) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < self.healthcheck_interval:
+            return True
+        self._stats['health_checks'] += 1
+        psycopg2 = driver()
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute('SELECT 1')
+                cur.fetchone()
+            finally:
+                cur.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _close_quietly(self, conn: Any) -> None:
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> Any:
+        started = time.perf_counter()
+        conn = self._acquire()
+        record('connect', time.perf_counter() - started)
+        return conn
+
+    def _acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f'No free database connection within {self.acquire_timeout}s (max_size={self.max_size})')
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats['hits'] += 1
+            else:
+                conn = None
+                self._size += 1
+                self._stats['misses'] += 1
+
+        if conn is None:
+            try:
+                return self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        if self._is_alive(conn):
+            return conn
+
+        self._close_quietly(conn)
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['reconnects'] += 1
+        return conn
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        if not discard and not conn.closed:
+            psycopg2 = driver()
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                self._close_quietly(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+    def close_all(self) -> None:
+        with self._cond:
+            for conn in self._idle:
+                self._close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    os.environ['DATABASE_URL'],
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+                    healthcheck_interval=float(os.environ.get('DB_POOL_HEALTHCHECK_SECONDS', '30')),
+                    acquire_timeout=float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5')),
+                    connection_factory=connection_factory(),
+                )
+    return _pool
+
+
+def pool_stats() -> Dict[str, int]:
+    return get_pool().stats() if _pool is not None else {}
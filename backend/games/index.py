@@ -1,142 +1,407 @@
+import base64
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Tuple
 
+from bulk import GAME_FILTERS, bulk_update, parse_target
+from cache import bump_version, etag_for, etag_matches, get_version, not_modified, response_cache
+from instrument import instrumented
+from purchases import ALREADY_OWNED, INSUFFICIENT_FUNDS, NOT_FOUND, checkout, purchase, refund_game
+from rankings import CHART_SQL, PERIODS, RANKINGS_SIZE, chart_scope, refresh as refresh_rankings
+from responses import dumps_bytes, error_response, json_response, money, raw_response, row_encoder
+from router import Request, Router, id_list, integer, whole
+from watermark import committed_max
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('GAMES_PAGE_SIZE', '24'))
+MAX_PAGE_SIZE = int(os.environ.get('GAMES_MAX_PAGE_SIZE', '100'))
+MAX_CART_ITEMS = int(os.environ.get('CHECKOUT_MAX_ITEMS', '100'))
+SYNC_PAGE_SIZE = int(os.environ.get('GAMES_SYNC_PAGE_SIZE', '500'))
+RECOMMENDATIONS_LIMIT = int(os.environ.get('RECOMMENDATIONS_LIMIT', '12'))
+
+GAME_COLUMNS = 'id, title, description, genre, age_rating, price, logo_url, file_url, status, created_by, engine_type'
+
+encode_game = row_encoder({
+    'id': 0,
+    'title': 1,
+    'description': 2,
+    'genre': 3,
+    'age_rating': 4,
+    'price': (5, money),
+    'logo_url': 6,
+    'file_url': 7,
+    'status': 8,
+    'created_by': 9,
+    'engine_type': 10
+})
+
+encode_chart_entry = row_encoder({
+    'rank': 0,
+    'purchases': 1,
+    'revenue': (2, money),
+    'game': {
+        'id': 3,
+        'title': 4,
+        'description': 5,
+        'genre': 6,
+        'age_rating': 7,
+        'price': (8, money),
+        'logo_url': 9,
+        'file_url': 10,
+        'status': 11,
+        'created_by': 12,
+        'engine_type': 13
+    }
+})
+
+encode_recommendation = row_encoder({
+    'id': 0,
+    'title': 1,
+    'description': 2,
+    'genre': 3,
+    'age_rating': 4,
+    'price': (5, money),
+    'logo_url': 6,
+    'file_url': 7,
+    'status': 8,
+    'created_by': 9,
+    'engine_type': 10,
+    'score': 11,
+    'co_purchases': 12
+})
+
+encode_search_hit = row_encoder({
+    'id': 0,
+    'title': 1,
+    'genre': 2,
+    'age_rating': 3,
+    'price': (4, money),
+    'logo_url': 5,
+    'engine_type': 6,
+    'rank': 7
+})
+
+
+def encode_cursor(created_at: datetime, game_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{game_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, game_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(created_at), whole(game_id)
+
+
+def build_prefix_tsquery(text: str) -> str:
+    words = re.findall(r'\w+', text.lower())[:8]
+    return ' & '.join(f'{w}:*' for w in words)
+
+
+router = Router('GET, POST, PUT, DELETE, OPTIONS')
+
+
+@router.route('GET', 'sync', fields={'since': integer(0, low=0), 'limit': integer(SYNC_PAGE_SIZE, 1, SYNC_PAGE_SIZE)},
+              invalid='Invalid since or limit')
+def sync(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    since, limit = req.args['since'], req.args['limit']
+    etag = etag_for('sync', since, limit, get_version(cur, 'games'))
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    # Revisions an open transaction can still commit below this are not handed out as the cursor;
+    # while a catalog write is running the client gets the rows but keeps its revision
+    committed = committed_max(req.conn, cur, 't_p74122035_gde_store_creation.games', 'revision', wait=False)
+    cur.execute(f"""
+        SELECT {GAME_COLUMNS}, revision
+        FROM t_p74122035_gde_store_creation.games
+        WHERE revision > %s{'' if since else " AND status = 'approved'"}
+        ORDER BY revision
+        LIMIT %s
+    """, (since, limit + 1))
+    rows = cur.fetchall()
+    
+    revision, settled = since, True
+    for row in rows[:limit]:
+        if committed is None or row[11] > committed:
+            settled = False
+            break
+        revision = row[11]
+    
+    return json_response({
+        'revision': revision,
+        'upserted': [encode_game(g) for g in rows[:limit] if g[8] == 'approved'],
+        'removed': [g[0] for g in rows[:limit] if g[8] != 'approved'],
+        'has_more': settled and len(rows) > limit
+    }, headers={'ETag': etag} if settled else None)
+
+
+@router.route('GET', 'rankings', fields={'limit': integer(DEFAULT_PAGE_SIZE, 1, RANKINGS_SIZE)}, invalid='Invalid limit')
+def rankings(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    period = req.params.get('period') or '7d'
+    limit = req.args['limit']
+    try:
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        scope = chart_scope(req.params.get('genre'), req.params.get('engine_type'))
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    request_key = f'rankings:{period}:{scope}:{limit}'
+    version = f"{get_version(cur, 'rankings')}.{get_version(cur, 'games')}"
+    etag = etag_for(request_key, version)
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cached = response_cache.get(request_key, version)
+    if cached is not None:
+        return raw_response(cached, headers={'ETag': etag, 'X-Cache': 'HIT'})
+    
+    cur.execute(CHART_SQL, (period, scope, limit))
+    payload = dumps_bytes({'period': period, 'scope': scope, 'items': [encode_chart_entry(r) for r in cur.fetchall()]})
+    response_cache.set(request_key, version, payload)
+    
+    return raw_response(payload, headers={'ETag': etag, 'X-Cache': 'MISS'})
+
+
+@router.route('GET', 'recommendations', fields={'game_id': integer(), 'limit': integer(RECOMMENDATIONS_LIMIT, 1, MAX_PAGE_SIZE)},
+              invalid='Invalid game_id or limit')
+def recommendations(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    game_id, limit = req.args['game_id'], req.args['limit']
+    request_key = f'recommendations:{game_id}:{limit}'
+    version = f"{get_version(cur, 'recommendations')}.{get_version(cur, 'games')}"
+    etag = etag_for(request_key, version)
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cached = response_cache.get(request_key, version)
+    if cached is not None:
+        return raw_response(cached, headers={'ETag': etag, 'X-Cache': 'HIT'})
+    
+    cur.execute("""
+        SELECT g.id, g.title, g.description, g.genre, g.age_rating, g.price, g.logo_url, g.file_url, g.status,
+               g.created_by, g.engine_type, r.score, r.co_purchases
+        FROM t_p74122035_gde_store_creation.game_recommendations r
+        JOIN t_p74122035_gde_store_creation.games g ON g.id = r.recommended_id
+        WHERE r.game_id = %s AND g.status = 'approved'
+        ORDER BY r.rank
+        LIMIT %s
+    """, (game_id, limit))
+    payload = dumps_bytes([encode_recommendation(g) for g in cur.fetchall()])
+    response_cache.set(request_key, version, payload)
+    
+    return raw_response(payload, headers={'ETag': etag, 'X-Cache': 'MISS'})
+
+
+@router.route('GET', 'search', fields={'limit': integer(DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE), 'offset': integer(0, low=0)},
+              invalid='Invalid limit or offset')
+def search(req: Request) -> Dict[str, Any]:
+    query = build_prefix_tsquery(req.params.get('q', ''))
+    limit, offset = req.args['limit'], req.args['offset']
+    
+    games = []
+    if query:
+        req.cur.execute("""
+            SELECT id, title, genre, age_rating, price, logo_url, engine_type, ts_rank_cd(search_vector, q) AS rank
+            FROM t_p74122035_gde_store_creation.games, to_tsquery('simple', %s) q
+            WHERE status = 'approved' AND search_vector @@ q
+            ORDER BY rank DESC, id DESC
+            LIMIT %s OFFSET %s
+        """, (query, limit + 1, offset))
+        games = req.cur.fetchall()
+    
+    return json_response({
+        'items': [encode_search_hit(g) for g in games[:limit]],
+        'next_offset': offset + limit if len(games) > limit else None
+    })
+
+
+@router.route('GET', fields={'limit': integer(DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)}, invalid='Invalid limit')
+def catalog(req: Request) -> Dict[str, Any]:
+    cur, params = req.cur, req.params
+    status_filter = params.get('status', 'approved')
+    
+    conditions = ['status = %s']
+    args: List[Any] = [status_filter]
+    for column in ('genre', 'age_rating', 'engine_type'):
+        if params.get(column):
+            conditions.append(f'{column} = %s')
+            args.append(params[column])
+    try:
+        if params.get('min_price') not in (None, ''):
+            conditions.append('price >= %s')
+            args.append(Decimal(params['min_price']))
+        if params.get('max_price') not in (None, ''):
+            conditions.append('price <= %s')
+            args.append(Decimal(params['max_price']))
+    except InvalidOperation:
+        return error_response(400, 'Invalid price filter')
+    
+    paginated = 'limit' in params or 'cursor' in params
+    limit_clause = ''
+    if paginated:
+        page_size = req.args['limit']
+        if params.get('cursor'):
+            try:
+                cursor_created_at, cursor_id = decode_cursor(params['cursor'])
+            except ValueError:
+                return error_response(400, 'Invalid cursor')
+            conditions.append('(created_at, id) < (%s, %s)')
+            args.extend([cursor_created_at, cursor_id])
+        limit_clause = ' LIMIT %s'
+        args.append(page_size + 1)
+    
+    request_key = 'games:' + json.dumps(params, sort_keys=True)
+    version = get_version(cur, 'games')
+    etag = etag_for(request_key, version)
+    if etag_matches(req.event, etag):
+        return not_modified(etag)
+    
+    cacheable = status_filter == 'approved'
+    if cacheable:
+        cached = response_cache.get(request_key, version)
+        if cached is not None:
+            return raw_response(cached, headers={'ETag': etag, 'X-Cache': 'HIT'})
+    
+    cur.execute(
+        f"SELECT {GAME_COLUMNS}, created_at FROM t_p74122035_gde_store_creation.games WHERE "
+        + ' AND '.join(conditions) + " ORDER BY created_at DESC, id DESC" + limit_clause,
+        tuple(args)
+    )
+    games = cur.fetchall()
+    
+    next_cursor = None
+    if paginated and len(games) > page_size:
+        games = games[:page_size]
+        next_cursor = encode_cursor(games[-1][11], games[-1][0])
+    
+    items = [encode_game(g) for g in games]
+    
+    payload = dumps_bytes({'items': items, 'next_cursor': next_cursor} if paginated else items)
+    if cacheable:
+        response_cache.set(request_key, version, payload)
+    
+    return raw_response(payload, headers={'ETag': etag, 'X-Cache': 'MISS'})
+
+
+@router.route('POST', 'submit', writes=True)
+def submit(req: Request) -> Dict[str, Any]:
+    body = req.body
+    # Validation runs in jobs/validate_submissions.py; the job row commits with the game
+    req.cur.execute("""WITH game AS (
+                           INSERT INTO t_p74122035_gde_store_creation.games (title, description, genre, age_rating, price, logo_url, file_url, contact_email, created_by, engine_type) 
+                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+                       ), job AS (
+                           INSERT INTO t_p74122035_gde_store_creation.validation_jobs (game_id) SELECT id FROM game
+                       )
+                       SELECT id FROM game""",
+                   (body.get('title'), body.get('description'), body.get('genre'), 
+                    body.get('age_rating'), body.get('price'), body.get('logo_url'), 
+                    body.get('file_url'), body.get('contact_email'), req.user_id(),
+                    body.get('engine_type', 'other')))
+    game_id = req.cur.fetchone()[0]
+    bump_version(req.cur, 'games')
+    req.conn.commit()
+    
+    return json_response({'id': game_id, 'message': 'Игра отправлена на модерацию'})
+
+
+@router.route('POST', 'purchase', writes=True)
+def purchase_game(req: Request) -> Dict[str, Any]:
+    result = purchase(req.conn, 'game', req.user_id(), req.body.get('game_id'))
+    
+    if result['status'] == NOT_FOUND:
+        return error_response(404, 'Game not found', result=result['status'])
+    if result['status'] == INSUFFICIENT_FUNDS:
+        return error_response(400, 'Недостаточно средств', result=result['status'])
+    if result['status'] == ALREADY_OWNED:
+        return error_response(409, 'Игра уже куплена', result=result['status'])
+    
+    return json_response({'message': 'Игра куплена', 'result': result['status'], 'balance': result['balance']})
+
+
+@router.route('POST', 'checkout', fields={'game_ids': id_list, 'frame_ids': id_list}, writes=True,
+              invalid='game_ids and frame_ids must be lists of ids')
+def checkout_cart(req: Request) -> Dict[str, Any]:
+    game_ids, frame_ids = req.args['game_ids'], req.args['frame_ids']
+    if not game_ids and not frame_ids:
+        return error_response(400, 'Корзина пуста')
+    if len(game_ids) + len(frame_ids) > MAX_CART_ITEMS:
+        return error_response(400, f'Не больше {MAX_CART_ITEMS} товаров за раз')
+    
+    result = checkout(req.conn, req.user_id(), game_ids, frame_ids)
+    
+    if result['status'] == NOT_FOUND:
+        return error_response(404, 'User not found')
+    
+    insufficient = result['status'] == INSUFFICIENT_FUNDS
+    return json_response({
+        **({'error': 'Недостаточно средств'} if insufficient else {'message': 'Заказ оформлен'}),
+        'result': result['status'],
+        'items': result['items'],
+        'total': result['total'],
+        'balance': result['balance']
+    }, 400 if insufficient else 200)
+
+
+@router.route('PUT', 'refresh_rankings', admin=True)
+def rebuild_rankings(req: Request) -> Dict[str, Any]:
+    result = refresh_rankings(req.conn, req.cur)
+    return json_response({'message': 'Рейтинги обновлены', **result})
+
+
+@router.route('PUT', admin=True)
+def update_status(req: Request) -> Dict[str, Any]:
+    conn, cur, body = req.conn, req.cur, req.body
+    game_id = body.get('game_id')
+    status = body.get('status')
+    
+    if 'game_ids' in body or 'filter' in body:
+        if not status:
+            return error_response(400, 'status is required')
+        try:
+            ids, condition, args = parse_target(body, 'game_ids', GAME_FILTERS)
+        except (TypeError, ValueError) as e:
+            return error_response(400, str(e))
+        
+        result = bulk_update(
+            conn, cur, 'games',
+            "status = %s, revision = nextval('t_p74122035_gde_store_creation.games_revision_seq'), updated_at = CURRENT_TIMESTAMP", [status],
+            't.status IS DISTINCT FROM %s', [status], ids, condition, args,
+            on_chunk=lambda c, updated: bump_version(c, 'games')
+        )
+        return json_response({'message': 'Статусы игр обновлены', **result})
+    
+    cur.execute("""UPDATE t_p74122035_gde_store_creation.games
+                   SET status = %s, revision = nextval('t_p74122035_gde_store_creation.games_revision_seq'), updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s AND status IS DISTINCT FROM %s""", (status, game_id, status))
+    if cur.rowcount:
+        bump_version(cur, 'games')
+    conn.commit()
+    
+    return json_response({'message': 'Статус игры обновлён'})
+
+
+@router.route('DELETE', writes=True)
+def refund(req: Request) -> Dict[str, Any]:
+    result = refund_game(req.conn, req.user_id(), req.body.get('game_id'))
+    
+    if result['status'] == NOT_FOUND:
+        return error_response(404, 'Purchase not found')
+    
+    return json_response({'message': 'Игра удалена из библиотеки', 'refund': result['refund'], 'balance': result['balance']})
+
+
+@instrumented('games')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Handles game operations - submit, approve, list, purchase
     Args: event with httpMethod, body, queryStringParameters; context with request_id
     Returns: HTTP response with games data or status
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            status_filter = params.get('status', 'approved')
-            
-            cur.execute("SELECT id, title, description, genre, age_rating, price, logo_url, file_url, status, created_by, engine_type FROM t_p74122035_gde_store_creation.games WHERE status = %s ORDER BY created_at DESC", (status_filter,))
-            games = cur.fetchall()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps([{
-                    'id': g[0],
-                    'title': g[1],
-                    'description': g[2],
-                    'genre': g[3],
-                    'age_rating': g[4],
-                    'price': float(g[5]),
-                    'logo_url': g[6],
-                    'file_url': g[7],
-                    'status': g[8],
-                    'created_by': g[9],
-                    'engine_type': g[10]
-                } for g in games])
-            }
-        
-        elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'submit':
-                cur.execute("""INSERT INTO t_p74122035_gde_store_creation.games (title, description, genre, age_rating, price, logo_url, file_url, contact_email, created_by, engine_type) 
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
-                           (body.get('title'), body.get('description'), body.get('genre'), 
-                            body.get('age_rating'), body.get('price'), body.get('logo_url'), 
-                            body.get('file_url'), body.get('contact_email'), body.get('user_id'), body.get('engine_type', 'other')))
-                game_id = cur.fetchone()[0]
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'id': game_id, 'message': 'Игра отправлена на модерацию'})
-                }
-            
-            elif action == 'purchase':
-                user_id = body.get('user_id')
-                game_id = body.get('game_id')
-                
-                cur.execute("SELECT price FROM t_p74122035_gde_store_creation.games WHERE id = %s", (game_id,))
-                game = cur.fetchone()
-                if not game:
-                    return {'statusCode': 404, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Game not found'})}
-                
-                price = float(game[0])
-                
-                cur.execute("SELECT balance FROM t_p74122035_gde_store_creation.users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                if float(user[0]) < price:
-                    return {'statusCode': 400, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Недостаточно средств'})}
-                
-                cur.execute("INSERT INTO t_p74122035_gde_store_creation.game_purchases (user_id, game_id, purchase_price) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING", (user_id, game_id, price))
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET balance = balance - %s WHERE id = %s", (price, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Игра куплена'})
-                }
-        
-        elif method == 'PUT':
-            body = json.loads(event.get('body', '{}'))
-            game_id = body.get('game_id')
-            status = body.get('status')
-            
-            cur.execute("UPDATE t_p74122035_gde_store_creation.games SET status = %s WHERE id = %s", (status, game_id))
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'message': 'Статус игры обновлён'})
-            }
-        
-        elif method == 'DELETE':
-            body = json.loads(event.get('body', '{}'))
-            user_id = body.get('user_id')
-            game_id = body.get('game_id')
-            
-            cur.execute("SELECT purchase_price FROM t_p74122035_gde_store_creation.game_purchases WHERE user_id = %s AND game_id = %s", (user_id, game_id))
-            purchase = cur.fetchone()
-            if purchase:
-                refund = float(purchase[0]) * 0.9
-                cur.execute("DELETE FROM t_p74122035_gde_store_creation.game_purchases WHERE user_id = %s AND game_id = %s", (user_id, game_id))
-                cur.execute("UPDATE t_p74122035_gde_store_creation.users SET balance = balance + %s WHERE id = %s", (refund, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'message': 'Игра удалена из библиотеки', 'refund': refund})
-                }
-        
-        return {'statusCode': 405, 'headers': {'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Method not allowed'})}
-    
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+    return router.dispatch(event, context)
@@ -0,0 +1,256 @@
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+PURCHASED = 'purchased'
+ALREADY_OWNED = 'already_owned'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+NOT_FOUND = 'not_found'
+REFUNDED = 'refunded'
+
+REFUND_RATE = Decimal('0.9')
+
+LEDGER_PURCHASE = 'purchase'
+LEDGER_REFUND = 'refund'
+
+ITEM_KINDS: Dict[str, Dict[str, Any]] = {
+    'game': {'items': 'games', 'owned': 'game_purchases', 'column': 'game_id', 'records_price': True, 'library': True},
+    'frame': {'items': 'frames', 'owned': 'user_frames', 'column': 'frame_id', 'records_price': False, 'library': False},
+}
+
+
+def _purchase_sql(kind: Dict[str, Any]) -> str:
+    price_column = ', purchase_price' if kind['records_price'] else ''
+    price_value = ', item.price' if kind['records_price'] else ''
+    library = f"""
+        library AS (
+            INSERT INTO {SCHEMA}.user_libraries AS l (user_id, game_ids, revision, updated_at)
+            SELECT %(user_id)s, ARRAY[%(item_id)s]::int[], 1, CURRENT_TIMESTAMP FROM ins
+            ON CONFLICT (user_id) DO UPDATE
+            SET game_ids = l.game_ids || EXCLUDED.game_ids, revision = l.revision + 1, updated_at = CURRENT_TIMESTAMP
+        ),""" if kind['library'] else ''
+    return f"""
+        WITH item AS (
+            SELECT price FROM {SCHEMA}.{kind['items']} WHERE id = %(item_id)s
+        ),
+        buyer AS (
+            SELECT id, balance FROM {SCHEMA}.users WHERE id = %(user_id)s FOR UPDATE
+        ),
+        owned AS (
+            SELECT 1 FROM {SCHEMA}.{kind['owned']} WHERE user_id = %(user_id)s AND {kind['column']} = %(item_id)s
+        ),
+        ins AS (
+            INSERT INTO {SCHEMA}.{kind['owned']} (user_id, {kind['column']}{price_column})
+            SELECT buyer.id, %(item_id)s{price_value} FROM buyer, item
+            WHERE buyer.balance >= item.price
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        ),{library}
+        debit AS (
+            UPDATE {SCHEMA}.users u SET balance = u.balance - item.price
+            FROM item
+            WHERE u.id = %(user_id)s AND EXISTS (SELECT 1 FROM ins)
+            RETURNING u.balance
+        ),
+        ledger AS (
+            INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind, {kind['column']})
+            SELECT %(user_id)s, -item.price, '{LEDGER_PURCHASE}', %(item_id)s FROM item
+            WHERE EXISTS (SELECT 1 FROM debit)
+        )
+        SELECT (SELECT price FROM item), (SELECT balance FROM buyer), EXISTS (SELECT 1 FROM owned),
+               EXISTS (SELECT 1 FROM ins), (SELECT balance FROM debit)
+    """
+
+
+PURCHASE_SQL = {name: _purchase_sql(kind) for name, kind in ITEM_KINDS.items()}
+
+REFUND_SQL = f"""
+    WITH buyer AS (
+        SELECT id FROM {SCHEMA}.users WHERE id = %(user_id)s FOR UPDATE
+    ),
+    removed AS (
+        DELETE FROM {SCHEMA}.game_purchases WHERE user_id = (SELECT id FROM buyer) AND game_id = %(item_id)s
+        RETURNING ROUND(purchase_price * %(rate)s, 2) AS amount
+    ),
+    library AS (
+        UPDATE {SCHEMA}.user_libraries l
+        SET game_ids = array_remove(l.game_ids, %(item_id)s::int), revision = l.revision + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE l.user_id = %(user_id)s AND EXISTS (SELECT 1 FROM removed)
+    ),
+    credit AS (
+        UPDATE {SCHEMA}.users u SET balance = u.balance + removed.amount
+        FROM removed
+        WHERE u.id = %(user_id)s
+        RETURNING u.balance
+    ),
+    ledger AS (
+        INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind, game_id)
+        SELECT %(user_id)s, removed.amount, '{LEDGER_REFUND}', %(item_id)s FROM removed
+        WHERE EXISTS (SELECT 1 FROM credit)
+    )
+    SELECT (SELECT amount FROM removed), (SELECT balance FROM credit)
+"""
+
+
+def _result(status: str, price: Optional[Decimal] = None, balance: Optional[Decimal] = None) -> Dict[str, Any]:
+    return {
+        'status': status,
+        'price': float(price) if price is not None else None,
+        'balance': float(balance) if balance is not None else None,
+    }
+
+
+def purchase(conn: Any, item_kind: str, user_id: Any, item_id: Any) -> Dict[str, Any]:
+    '''
+    Business: Atomically prices an item, debits the buyer and records ownership in one statement
+    Args: conn - pooled connection with no open work; item_kind 'game' or 'frame'; user_id; item_id
+    Returns: dict with status (purchased/already_owned/insufficient_funds/not_found), price, balance
+    '''
+    with conn.cursor() as cur:
+        cur.execute(PURCHASE_SQL[item_kind], {'user_id': user_id, 'item_id': item_id})
+        price, balance, owned, inserted, new_balance = cur.fetchone()
+
+    if inserted and new_balance is not None:
+        conn.commit()
+        return _result(PURCHASED, price, new_balance)
+
+    conn.rollback()
+    if price is None or balance is None:
+        return _result(NOT_FOUND)
+    if owned or (not inserted and balance >= price):
+        return _result(ALREADY_OWNED, price, balance)
+    return _result(INSUFFICIENT_FUNDS, price, balance)
+
+
+def refund_game(conn: Any, user_id: Any, game_id: Any, rate: Decimal = REFUND_RATE) -> Dict[str, Any]:
+    '''
+    Business: Atomically removes a game from the library and credits the refund in one statement
+    Args: conn - pooled connection; user_id; game_id; rate - share of purchase_price returned
+    Returns: dict with status (refunded/not_found), refund amount and new balance
+    '''
+    with conn.cursor() as cur:
+        cur.execute(REFUND_SQL, {'user_id': user_id, 'item_id': game_id, 'rate': rate})
+        amount, balance = cur.fetchone()
+
+    if amount is None or balance is None:
+        conn.rollback()
+        return {'status': NOT_FOUND, 'refund': None, 'balance': None}
+    conn.commit()
+    return {'status': REFUNDED, 'refund': float(amount), 'balance': float(balance)}
+
+
+CHECKOUT_PRICE_SQL = f"""
+    SELECT 'game', g.id, g.price,
+           EXISTS (SELECT 1 FROM {SCHEMA}.game_purchases gp WHERE gp.user_id = %(user_id)s AND gp.game_id = g.id)
+    FROM {SCHEMA}.games g WHERE g.id = ANY(%(game_ids)s)
+    UNION ALL
+    SELECT 'frame', f.id, f.price,
+           EXISTS (SELECT 1 FROM {SCHEMA}.user_frames uf WHERE uf.user_id = %(user_id)s AND uf.frame_id = f.id)
+    FROM {SCHEMA}.frames f WHERE f.id = ANY(%(frame_ids)s)
+"""
+
+
+CHECKOUT_GAMES_SQL = f"""
+    WITH ins AS (
+        INSERT INTO {SCHEMA}.game_purchases (user_id, game_id, purchase_price)
+        SELECT %(user_id)s, t.game_id, t.price FROM unnest(%(game_ids)s::int[], %(prices)s::numeric[]) AS t(game_id, price)
+        ON CONFLICT DO NOTHING RETURNING game_id
+    ),
+    library AS (
+        INSERT INTO {SCHEMA}.user_libraries AS l (user_id, game_ids, revision, updated_at)
+        SELECT %(user_id)s, array_agg(game_id), 1, CURRENT_TIMESTAMP FROM ins HAVING COUNT(*) > 0
+        ON CONFLICT (user_id) DO UPDATE
+        SET game_ids = l.game_ids || EXCLUDED.game_ids, revision = l.revision + 1, updated_at = CURRENT_TIMESTAMP
+    )
+    SELECT game_id FROM ins
+"""
+
+
+CHECKOUT_DEBIT_SQL = f"""
+    WITH debit AS (
+        UPDATE {SCHEMA}.users SET balance = balance - %(charged)s WHERE id = %(user_id)s RETURNING balance
+    ),
+    ledger AS (
+        INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind, game_id, frame_id)
+        SELECT %(user_id)s, -t.price, '{LEDGER_PURCHASE}', t.game_id, t.frame_id
+        FROM unnest(%(prices)s::numeric[], %(game_ids)s::int[], %(frame_ids)s::int[]) AS t(price, game_id, frame_id)
+    )
+    SELECT balance FROM debit
+"""
+
+
+def checkout(conn: Any, user_id: Any, game_ids: List[int], frame_ids: List[int]) -> Dict[str, Any]:
+    '''
+    Business: Buys a whole cart in one transaction - one pricing query, one debit, one insert per item kind
+    Args: conn - pooled connection; user_id; game_ids and frame_ids to buy (duplicates ignored)
+    Returns: dict with per-item results, charged total and new balance; nothing is bought
+             unless the balance covers every purchasable item
+    '''
+    game_ids = list(dict.fromkeys(game_ids))
+    frame_ids = list(dict.fromkeys(frame_ids))
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT balance FROM {SCHEMA}.users WHERE id = %s FOR UPDATE", (user_id,))
+        buyer = cur.fetchone()
+        if buyer is None:
+            conn.rollback()
+            return {'status': NOT_FOUND, 'items': [], 'total': 0.0, 'balance': None}
+        balance = buyer[0]
+
+        cur.execute(CHECKOUT_PRICE_SQL, {'user_id': user_id, 'game_ids': game_ids, 'frame_ids': frame_ids})
+        priced = {(kind, item_id): (price, owned) for kind, item_id, price, owned in cur.fetchall()}
+
+        items: List[Dict[str, Any]] = []
+        to_buy: Dict[str, List[Tuple[int, Decimal]]] = {'game': [], 'frame': []}
+        for kind, ids in (('game', game_ids), ('frame', frame_ids)):
+            for item_id in ids:
+                price, owned = priced.get((kind, item_id), (None, False))
+                if price is None:
+                    items.append({'type': kind, 'id': item_id, 'status': NOT_FOUND, 'price': None})
+                elif owned:
+                    items.append({'type': kind, 'id': item_id, 'status': ALREADY_OWNED, 'price': float(price)})
+                else:
+                    items.append({'type': kind, 'id': item_id, 'status': PURCHASED, 'price': float(price)})
+                    to_buy[kind].append((item_id, price))
+
+        total = sum((price for rows in to_buy.values() for _, price in rows), Decimal('0'))
+        if total > balance:
+            conn.rollback()
+            for item in items:
+                if item['status'] == PURCHASED:
+                    item['status'] = INSUFFICIENT_FUNDS
+            return {'status': INSUFFICIENT_FUNDS, 'items': items, 'total': float(total), 'balance': float(balance)}
+
+        bought = set()
+        if to_buy['game']:
+            cur.execute(CHECKOUT_GAMES_SQL, {
+                'user_id': user_id,
+                'game_ids': [i for i, _ in to_buy['game']],
+                'prices': [p for _, p in to_buy['game']],
+            })
+            bought.update(('game', r[0]) for r in cur.fetchall())
+        if to_buy['frame']:
+            cur.execute(
+                f"""INSERT INTO {SCHEMA}.user_frames (user_id, frame_id)
+                    SELECT %s, unnest(%s::int[]) ON CONFLICT DO NOTHING RETURNING frame_id""",
+                (user_id, [i for i, _ in to_buy['frame']])
+            )
+            bought.update(('frame', r[0]) for r in cur.fetchall())
+
+        charged_items = [(kind, item_id, price) for kind, rows in to_buy.items() for item_id, price in rows if (kind, item_id) in bought]
+        charged = sum((price for _, _, price in charged_items), Decimal('0'))
+        for item in items:
+            if item['status'] == PURCHASED and (item['type'], item['id']) not in bought:
+                item['status'] = ALREADY_OWNED
+
+        if charged_items:
+            cur.execute(CHECKOUT_DEBIT_SQL, {
+                'user_id': user_id,
+                'charged': charged,
+                'prices': [price for _, _, price in charged_items],
+                'game_ids': [item_id if kind == 'game' else None for kind, item_id, _ in charged_items],
+                'frame_ids': [item_id if kind == 'frame' else None for kind, item_id, _ in charged_items],
+            })
+            balance = cur.fetchone()[0]
+    conn.commit()
+    return {'status': PURCHASED, 'items': items, 'total': float(charged), 'balance': float(balance)}
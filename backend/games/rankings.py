@@ -0,0 +1,114 @@
+import os
+from typing import Any, Dict, Optional
+
+from cache import SETTINGS_TABLE, bump_version
+from watermark import committed_max
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+PERIODS = ('24h', '7d', 'all')
+RANKINGS_SIZE = int(os.environ.get('RANKINGS_SIZE', '100'))
+WATERMARK_KEY = 'rankings_ledger_id'
+
+FOLD_SQL = f"""
+    WITH sales AS (
+        SELECT game_id, date_trunc('hour', created_at) AS hour,
+               SUM(CASE WHEN kind = 'purchase' THEN 1 ELSE -1 END) AS purchases, -SUM(amount) AS revenue
+        FROM {SCHEMA}.balance_ledger
+        WHERE id > %(after)s AND id <= %(upto)s AND game_id IS NOT NULL AND kind IN ('purchase', 'refund')
+        GROUP BY 1, 2
+    ),
+    hourly AS (
+        INSERT INTO {SCHEMA}.game_sales_hourly AS h (game_id, hour, purchases, revenue)
+        SELECT game_id, hour, purchases, revenue FROM sales
+        ON CONFLICT (game_id, hour) DO UPDATE SET
+            purchases = h.purchases + EXCLUDED.purchases,
+            revenue = h.revenue + EXCLUDED.revenue
+    ),
+    totals AS (
+        INSERT INTO {SCHEMA}.game_sales_totals AS t (game_id, purchases, revenue)
+        SELECT game_id, SUM(purchases), SUM(revenue) FROM sales GROUP BY game_id
+        ON CONFLICT (game_id) DO UPDATE SET
+            purchases = t.purchases + EXCLUDED.purchases,
+            revenue = t.revenue + EXCLUDED.revenue
+    )
+    SELECT COUNT(*) FROM sales
+"""
+
+REBUILD_SQL = f"""
+    WITH windows AS (
+        SELECT '24h' AS period, game_id, SUM(purchases) AS purchases, SUM(revenue) AS revenue
+        FROM {SCHEMA}.game_sales_hourly
+        WHERE hour >= date_trunc('hour', CURRENT_TIMESTAMP) - INTERVAL '23 hours'
+        GROUP BY game_id
+        UNION ALL
+        SELECT '7d', game_id, SUM(purchases), SUM(revenue)
+        FROM {SCHEMA}.game_sales_hourly
+        WHERE hour >= date_trunc('hour', CURRENT_TIMESTAMP) - INTERVAL '167 hours'
+        GROUP BY game_id
+        UNION ALL
+        SELECT 'all', game_id, purchases, revenue FROM {SCHEMA}.game_sales_totals
+    ),
+    scoped AS (
+        SELECT w.period, s.scope, w.game_id, w.purchases, w.revenue
+        FROM windows w
+        JOIN {SCHEMA}.games g ON g.id = w.game_id AND g.status = 'approved'
+        CROSS JOIN LATERAL (VALUES ('all'), ('genre:' || g.genre), ('engine:' || g.engine_type)) s(scope)
+        WHERE w.purchases > 0 AND s.scope IS NOT NULL
+    ),
+    ranked AS (
+        SELECT period, scope, game_id, purchases, revenue,
+               ROW_NUMBER() OVER (PARTITION BY period, scope ORDER BY purchases DESC, revenue DESC, game_id) AS rank
+        FROM scoped
+    )
+    INSERT INTO {SCHEMA}.game_rankings (period, scope, rank, game_id, purchases, revenue)
+    SELECT period, scope, rank, game_id, purchases, revenue FROM ranked WHERE rank <= %s
+"""
+
+CHART_SQL = f"""
+    SELECT r.rank, r.purchases, r.revenue, g.id, g.title, g.description, g.genre, g.age_rating, g.price, g.logo_url,
+           g.file_url, g.status, g.created_by, g.engine_type
+    FROM {SCHEMA}.game_rankings r
+    JOIN {SCHEMA}.games g ON g.id = r.game_id
+    WHERE r.period = %s AND r.scope = %s AND g.status = 'approved'
+    ORDER BY r.rank
+    LIMIT %s
+"""
+
+
+def chart_scope(genre: Optional[str], engine_type: Optional[str]) -> str:
+    if genre and engine_type:
+        raise ValueError('Pass genre or engine_type, not both')
+    if genre:
+        return f'genre:{genre}'
+    if engine_type:
+        return f'engine:{engine_type}'
+    return 'all'
+
+
+def refresh(conn: Any, cur: Any, size: int = RANKINGS_SIZE) -> Dict[str, int]:
+    '''
+    Business: Folds purchases and refunds written to the ledger since the last run into the sales
+              counters and rebuilds every chart; meant to run on a schedule, not per request
+    Args: conn/cur - pooled connection with no open work and its cursor; size - rows per chart
+    Returns: dict with from_id, to_id, buckets (hourly rows touched) and rows (chart rows written);
+             ledger ids an open transaction can still commit below wait for the next run
+    '''
+    settled = committed_max(conn, cur, f'{SCHEMA}.balance_ledger', 'id') or 0
+    cur.execute(f"INSERT INTO {SETTINGS_TABLE} (key, value, updated_at) VALUES ('{WATERMARK_KEY}', '0', CURRENT_TIMESTAMP) ON CONFLICT (key) DO NOTHING")
+    cur.execute(f"SELECT value::bigint FROM {SETTINGS_TABLE} WHERE key = '{WATERMARK_KEY}' FOR UPDATE")
+    after = cur.fetchone()[0]
+    upto = max(settled, after)
+
+    buckets = 0
+    if upto > after:
+        cur.execute(FOLD_SQL, {'after': after, 'upto': upto})
+        buckets = cur.fetchone()[0]
+        cur.execute(f"UPDATE {SETTINGS_TABLE} SET value = %s, updated_at = CURRENT_TIMESTAMP WHERE key = '{WATERMARK_KEY}'", (str(upto),))
+    cur.execute(f"DELETE FROM {SCHEMA}.game_sales_hourly WHERE hour < date_trunc('hour', CURRENT_TIMESTAMP) - INTERVAL '168 hours'")
+    cur.execute(f"DELETE FROM {SCHEMA}.game_rankings")
+    cur.execute(REBUILD_SQL, (size,))
+    rows = cur.rowcount
+    bump_version(cur, 'rankings')
+    conn.commit()
+    return {'from_id': after, 'to_id': upto, 'buckets': buckets, 'rows': rows}
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+SETTINGS_TABLE = 't_p74122035_gde_store_creation.system_settings'
+VERSION_KEY_PREFIX = 'cache_version:'
+
+
+class ResponseCache:
+    '''
+    Business: Per-container LRU cache of pre-serialized JSON bodies with TTL and size bounds
+    Args: ttl in seconds, max_entries and max_bytes bounds for the whole cache
+    Returns: cache whose get/set are keyed by request key and data version
+    '''
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[str, float, bytes]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _drop(self, key: str) -> None:
+        _, _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def get(self, key: str, version: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            entry_version, expires_at, body = entry
+            if entry_version != version:
+                self._drop(key)
+                self._stats['invalidations'] += 1
+                self._stats['misses'] += 1
+                return None
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return body
+
+    def set(self, key: str, version: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, time.monotonic() + self.ttl, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+
+response_cache = ResponseCache(
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '30')),
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256')),
+    max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+)
+
+VERSION_CHECK_SECONDS = float(os.environ.get('CACHE_VERSION_CHECK_SECONDS', '1'))
+_versions: Dict[str, Tuple[str, float]] = {}
+
+
+def get_version(cur: Any, namespace: str) -> str:
+    '''
+    Business: Reads the invalidation counter for a cached namespace from system_settings
+    Args: cur - open cursor; namespace such as 'games' or 'frames'
+    Returns: version string, re-read from the DB at most every CACHE_VERSION_CHECK_SECONDS
+    '''
+    now = time.monotonic()
+    known = _versions.get(namespace)
+    if known is not None and known[1] > now:
+        return known[0]
+    cur.execute(f"SELECT value FROM {SETTINGS_TABLE} WHERE key = %s", (VERSION_KEY_PREFIX + namespace,))
+    row = cur.fetchone()
+    version = row[0] if row else '0'
+    _versions[namespace] = (version, now + VERSION_CHECK_SECONDS)
+    return version
+
+
+def bump_version(cur: Any, namespace: str) -> str:
+    '''
+    Business: Invalidates every container's cache for a namespace; runs inside the caller's transaction
+    Args: cur - open cursor; namespace such as 'games' or 'frames'
+    Returns: new version string
+    '''
+    cur.execute(
+        f"INSERT INTO {SETTINGS_TABLE} AS s (key, value, updated_at) VALUES (%s, '1', CURRENT_TIMESTAMP) "
+        "ON CONFLICT (key) DO UPDATE SET value = (s.value::bigint + 1)::text, updated_at = CURRENT_TIMESTAMP "
+        "RETURNING value",
+        (VERSION_KEY_PREFIX + namespace,)
+    )
+    version = cur.fetchone()[0]
+    _versions.pop(namespace, None)
+    return version
+
+
+def cache_stats() -> Dict[str, int]:
+    return response_cache.stats()
+
+
+def etag_for(*parts: Any) -> str:
+    '''
+    Business: Builds a strong ETag from a version stamp and whatever else selects the response
+    Args: parts - version counters, row stamps, request keys or the serialized body itself
+    Returns: quoted ETag header value
+    '''
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = event.get('headers') or {}
+    header = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), None)
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def not_modified(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag'},
+        'isBase64Encoded': False,
+        'body': ''
+    }
@@ -0,0 +1,113 @@
+import os
+import select
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from db import driver
+
+CHANNEL = 'social_messages'
+HUB_RECONNECT_SECONDS = float(os.environ.get('HUB_RECONNECT_SECONDS', '1'))
+HUB_HEALTHCHECK_SECONDS = float(os.environ.get('HUB_HEALTHCHECK_SECONDS', '60'))
+
+
+class MessageHub:
+    '''
+    Business: Holds one LISTEN connection per container and wakes every request long-polling
+              for the user a new message was sent to
+    Args: dsn for the listening connection; channel the messages trigger notifies on
+    Returns: hub with subscribe/unsubscribe; waiters are threading.Event objects set on delivery
+    '''
+
+    def __init__(self, dsn: str, channel: str = CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._waiters: Dict[int, Set[threading.Event]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'notifications': 0, 'wakeups': 0, 'reconnects': 0}
+
+    def subscribe(self, user_id: int) -> threading.Event:
+        waiter = threading.Event()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='message-hub', daemon=True)
+                self._thread.start()
+            self._waiters.setdefault(user_id, set()).add(waiter)
+        return waiter
+
+    def unsubscribe(self, user_id: int, waiter: threading.Event) -> None:
+        with self._lock:
+            waiters = self._waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, users=len(self._waiters), waiters=sum(len(w) for w in self._waiters.values()))
+
+    def _wake(self, user_id: int) -> None:
+        with self._lock:
+            self._stats['notifications'] += 1
+            for waiter in self._waiters.get(user_id, ()):
+                waiter.set()
+                self._stats['wakeups'] += 1
+
+    def _wake_all(self) -> None:
+        with self._lock:
+            for waiters in self._waiters.values():
+                for waiter in waiters:
+                    waiter.set()
+
+    def _listen(self) -> Any:
+        psycopg2 = driver()
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {self.channel}')
+        return conn
+
+    def _run(self) -> None:
+        psycopg2 = driver()
+        while True:
+            conn = None
+            try:
+                conn = self._listen()
+                # Anything sent while nobody was listening: let every waiter re-check the table
+                self._wake_all()
+                while True:
+                    if select.select([conn], [], [], HUB_HEALTHCHECK_SECONDS) == ([], [], []):
+                        with conn.cursor() as cur:
+                            cur.execute('SELECT 1')
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        if payload.isdigit():
+                            self._wake(int(payload))
+            except (psycopg2.Error, OSError):
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                self._wake_all()
+                time.sleep(HUB_RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+_hub: Optional[MessageHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> MessageHub:
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = MessageHub(os.environ['DATABASE_URL'])
+    return _hub
@@ -0,0 +1,314 @@
+import base64
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import get_pool
+from hub import get_hub
+from instrument import instrumented
+from responses import error_response, json_response, row_encoder
+from router import Request, Router, integer, number
+from sessions import acting_user, authenticate
+
+MESSAGES_PAGE_SIZE = int(os.environ.get('MESSAGES_PAGE_SIZE', '50'))
+MESSAGES_MAX_PAGE_SIZE = int(os.environ.get('MESSAGES_MAX_PAGE_SIZE', '200'))
+MESSAGE_MAX_LENGTH = int(os.environ.get('MESSAGE_MAX_LENGTH', '4000'))
+SUGGESTIONS_LIMIT = int(os.environ.get('FRIEND_SUGGESTIONS_LIMIT', '20'))
+RECEIVE_TIMEOUT_SECONDS = float(os.environ.get('RECEIVE_TIMEOUT_SECONDS', '20'))
+RECEIVE_MAX_TIMEOUT_SECONDS = float(os.environ.get('RECEIVE_MAX_TIMEOUT_SECONDS', '25'))
+
+encode_friend = row_encoder({'id': 0, 'username': 1, 'avatar_url': 2, 'active_frame_id': 3, 'since': 4})
+encode_suggestion = row_encoder({'id': 0, 'username': 1, 'avatar_url': 2, 'active_frame_id': 3, 'mutual_friends': 4})
+encode_message = row_encoder({'id': 0, 'sender_id': 1, 'receiver_id': 2, 'message': 3, 'created_at': 4})
+encode_unread = row_encoder({'peer_id': 0, 'unread': 1, 'last_message_id': 2})
+
+FRIENDS_SQL = """
+    SELECT u.id, u.username, u.avatar_url, u.active_frame_id, f.created_at
+    FROM t_p74122035_gde_store_creation.friendships f
+    JOIN t_p74122035_gde_store_creation.users u ON u.id = f.friend_id
+    WHERE f.user_id = %s
+    ORDER BY u.username, u.id
+"""
+
+MUTUAL_FRIENDS_SQL = """
+    SELECT u.id, u.username, u.avatar_url, u.active_frame_id, a.created_at
+    FROM t_p74122035_gde_store_creation.friendships a
+    JOIN t_p74122035_gde_store_creation.friendships b ON b.user_id = %(other_id)s AND b.friend_id = a.friend_id
+    JOIN t_p74122035_gde_store_creation.users u ON u.id = a.friend_id
+    WHERE a.user_id = %(user_id)s
+    ORDER BY u.username, u.id
+"""
+
+SUGGESTIONS_SQL = """
+    SELECT u.id, u.username, u.avatar_url, u.active_frame_id, s.mutual
+    FROM (
+        SELECT f2.friend_id AS id, COUNT(*) AS mutual
+        FROM t_p74122035_gde_store_creation.friendships f1
+        JOIN t_p74122035_gde_store_creation.friendships f2 ON f2.user_id = f1.friend_id
+        WHERE f1.user_id = %(user_id)s AND f2.friend_id <> %(user_id)s
+          AND NOT EXISTS (
+              SELECT 1 FROM t_p74122035_gde_store_creation.friendships x
+              WHERE x.user_id = %(user_id)s AND x.friend_id = f2.friend_id
+          )
+        GROUP BY f2.friend_id
+    ) s
+    JOIN t_p74122035_gde_store_creation.users u ON u.id = s.id
+    WHERE NOT u.is_banned
+    ORDER BY s.mutual DESC, u.id
+    LIMIT %(limit)s
+"""
+
+CONVERSATION_SQL = """
+    SELECT id, sender_id, receiver_id, message, created_at FROM (
+        (SELECT id, sender_id, receiver_id, message, created_at
+         FROM t_p74122035_gde_store_creation.messages
+         WHERE sender_id = %(user_id)s AND receiver_id = %(peer_id)s{keyset}
+         ORDER BY created_at DESC, id DESC LIMIT %(limit)s)
+        UNION ALL
+        (SELECT id, sender_id, receiver_id, message, created_at
+         FROM t_p74122035_gde_store_creation.messages
+         WHERE sender_id = %(peer_id)s AND receiver_id = %(user_id)s{keyset}
+         ORDER BY created_at DESC, id DESC LIMIT %(limit)s)
+    ) m
+    ORDER BY created_at DESC, id DESC
+    LIMIT %(limit)s
+"""
+CONVERSATION_FIRST_SQL = CONVERSATION_SQL.format(keyset='')
+CONVERSATION_NEXT_SQL = CONVERSATION_SQL.format(keyset=' AND (created_at, id) < (%(before_at)s, %(before_id)s)')
+
+INCOMING_SQL = """
+    SELECT id, sender_id, receiver_id, message, created_at
+    FROM t_p74122035_gde_store_creation.messages
+    WHERE receiver_id = %s AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+SEND_MESSAGE_SQL = """
+    WITH sent AS (
+        INSERT INTO t_p74122035_gde_store_creation.messages (sender_id, receiver_id, message)
+        SELECT sender.id, receiver.id, %(message)s
+        FROM t_p74122035_gde_store_creation.users sender
+        JOIN t_p74122035_gde_store_creation.users receiver ON receiver.id = %(receiver_id)s
+        WHERE sender.id = %(sender_id)s
+        RETURNING id, sender_id, receiver_id, message, created_at
+    ),
+    counter AS (
+        INSERT INTO t_p74122035_gde_store_creation.message_unread (user_id, peer_id, unread, last_message_id, updated_at)
+        SELECT receiver_id, sender_id, 1, id, created_at FROM sent
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            unread = t_p74122035_gde_store_creation.message_unread.unread + 1,
+            last_message_id = EXCLUDED.last_message_id,
+            updated_at = EXCLUDED.updated_at
+    )
+    SELECT id, sender_id, receiver_id, message, created_at FROM sent
+"""
+
+
+def encode_cursor(values: tuple) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError('Invalid cursor')
+        # Parsed here so a tampered cursor is a 400, not a DataError from the keyset query
+        return datetime.fromisoformat(values[0]), integer()(values[1])
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def conversation_page(cur: Any, user_id: Any, peer_id: Any, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+    '''
+    Business: Loads one page of a conversation, newest first, by keyset on (created_at, id)
+    Args: cur - open cursor; user_id and peer_id of the two participants; cursor from the
+          previous page or None for the latest messages; limit messages per page
+    Returns: dict with items and next_cursor (None when the history is exhausted)
+    '''
+    args = {'user_id': user_id, 'peer_id': peer_id, 'limit': limit + 1}
+    if cursor:
+        args['before_at'], args['before_id'] = decode_cursor(cursor)
+        cur.execute(CONVERSATION_NEXT_SQL, args)
+    else:
+        cur.execute(CONVERSATION_FIRST_SQL, args)
+    rows = cur.fetchall()
+    next_cursor = encode_cursor((rows[limit - 1][4], rows[limit - 1][0])) if len(rows) > limit else None
+    return {'items': [encode_message(r) for r in rows[:limit]], 'next_cursor': next_cursor}
+
+
+def fetch_incoming(pool: Any, user_id: int, after_id: int) -> List[Any]:
+    conn = pool.acquire()
+    cur = conn.cursor()
+    try:
+        cur.execute(INCOMING_SQL, (user_id, after_id, MESSAGES_MAX_PAGE_SIZE))
+        return cur.fetchall()
+    finally:
+        cur.close()
+        pool.release(conn)
+
+
+router = Router('GET, POST, PUT, DELETE, OPTIONS')
+
+
+@router.route('GET', 'receive', db=False, invalid='Invalid user_id, after_id or timeout',
+              fields={'after_id': integer(0), 'timeout': number(RECEIVE_TIMEOUT_SECONDS, 0.0, RECEIVE_MAX_TIMEOUT_SECONDS)})
+def receive(req: Request) -> Dict[str, Any]:
+    '''
+    Business: Long-polls for messages sent to a user after after_id
+    Args: req with user_id, after_id (last message id the client has) and timeout seconds
+          (capped at RECEIVE_MAX_TIMEOUT_SECONDS)
+    Returns: HTTP response with items (possibly empty on timeout) and the after_id to poll with next;
+             no database connection is held while waiting, the container's hub wakes the request
+    '''
+    after_id, timeout = req.args['after_id'], req.args['timeout']
+    pool = get_pool()
+    conn = pool.acquire()
+    cur = conn.cursor()
+    try:
+        user_id = int(acting_user(authenticate(req.event, cur), req.params.get('user_id')))
+    except (TypeError, ValueError):
+        return error_response(400, 'Invalid user_id, after_id or timeout')
+    finally:
+        cur.close()
+        pool.release(conn)
+    
+    hub = get_hub()
+    waiter = hub.subscribe(user_id)
+    try:
+        rows = fetch_incoming(pool, user_id, after_id)
+        deadline = time.monotonic() + timeout
+        while not rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not waiter.wait(remaining):
+                break
+            waiter.clear()
+            rows = fetch_incoming(pool, user_id, after_id)
+    finally:
+        hub.unsubscribe(user_id, waiter)
+    
+    return json_response({'items': [encode_message(r) for r in rows], 'after_id': rows[-1][0] if rows else after_id})
+
+
+@router.route('GET', 'friends')
+def friends(req: Request) -> Dict[str, Any]:
+    req.cur.execute(FRIENDS_SQL, (req.user_id(),))
+    
+    return json_response([encode_friend(f) for f in req.cur.fetchall()])
+
+
+@router.route('GET', 'mutual_friends')
+def mutual_friends(req: Request) -> Dict[str, Any]:
+    req.cur.execute(MUTUAL_FRIENDS_SQL, {'user_id': req.user_id(), 'other_id': req.params.get('other_id')})
+    
+    return json_response([encode_friend(f) for f in req.cur.fetchall()])
+
+
+@router.route('GET', 'suggestions', fields={'limit': integer(SUGGESTIONS_LIMIT, 1, SUGGESTIONS_LIMIT)}, invalid='Invalid limit')
+def suggestions(req: Request) -> Dict[str, Any]:
+    req.cur.execute(SUGGESTIONS_SQL, {'user_id': req.user_id(), 'limit': req.args['limit']})
+    
+    return json_response([encode_suggestion(s) for s in req.cur.fetchall()])
+
+
+@router.route('GET', 'messages', fields={'peer_id': integer(), 'limit': integer(MESSAGES_PAGE_SIZE, 1, MESSAGES_MAX_PAGE_SIZE)},
+              invalid='Invalid peer_id or limit')
+def messages(req: Request) -> Dict[str, Any]:
+    user_id = req.user_id()
+    try:
+        result = conversation_page(req.cur, user_id, req.args['peer_id'], req.params.get('cursor'), req.args['limit'])
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    return json_response(result)
+
+
+@router.route('GET', 'unread')
+def unread(req: Request) -> Dict[str, Any]:
+    req.cur.execute("""
+        SELECT peer_id, unread, last_message_id FROM t_p74122035_gde_store_creation.message_unread
+        WHERE user_id = %s AND unread > 0
+        ORDER BY last_message_id DESC
+    """, (req.user_id(),))
+    conversations = [encode_unread(r) for r in req.cur.fetchall()]
+    
+    return json_response({'total': sum(c['unread'] for c in conversations), 'conversations': conversations})
+
+
+@router.route('POST', 'add_friend', writes=True)
+def add_friend(req: Request) -> Dict[str, Any]:
+    cur = req.cur
+    user_id = req.user_id()
+    friend_id = req.body.get('friend_id')
+    if str(friend_id) == str(user_id):
+        return error_response(400, 'Нельзя добавить себя в друзья')
+    
+    cur.execute("SELECT id FROM t_p74122035_gde_store_creation.users WHERE id = %s", (friend_id,))
+    if not cur.fetchone():
+        return error_response(404, 'Пользователь не найден')
+    cur.execute("""
+        INSERT INTO t_p74122035_gde_store_creation.friendships (user_id, friend_id)
+        VALUES (%(user_id)s, %(friend_id)s), (%(friend_id)s, %(user_id)s)
+        ON CONFLICT (user_id, friend_id) DO NOTHING
+    """, {'user_id': user_id, 'friend_id': friend_id})
+    req.conn.commit()
+    
+    return json_response({'message': 'Друг добавлен'})
+
+
+@router.route('POST', 'send_message', fields={'receiver_id': integer()}, invalid='Invalid receiver_id', writes=True)
+def send_message(req: Request) -> Dict[str, Any]:
+    try:
+        user_id = integer()(req.user_id())
+    except (TypeError, ValueError):
+        return error_response(400, 'Invalid user_id')
+    message = (req.body.get('message') or '').strip()
+    if not message or len(message) > MESSAGE_MAX_LENGTH:
+        return error_response(400, 'Invalid message')
+    
+    # Both ends are matched against users, so a deleted sender or receiver is a 404, not a foreign key error
+    req.cur.execute(SEND_MESSAGE_SQL, {'sender_id': user_id, 'receiver_id': req.args['receiver_id'], 'message': message})
+    sent = req.cur.fetchone()
+    if not sent:
+        return error_response(404, 'Пользователь не найден')
+    req.conn.commit()
+    
+    return json_response(encode_message(sent))
+
+
+@router.route('PUT', 'mark_read', writes=True)
+def mark_read(req: Request) -> Dict[str, Any]:
+    req.cur.execute("""
+        UPDATE t_p74122035_gde_store_creation.message_unread
+        SET unread = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = %(user_id)s AND peer_id = %(peer_id)s AND unread > 0
+          AND (%(seen_id)s::int IS NULL OR last_message_id <= %(seen_id)s::int)
+    """, {'user_id': req.user_id(), 'peer_id': req.body.get('peer_id'), 'seen_id': req.body.get('last_message_id')})
+    req.conn.commit()
+    
+    return json_response({'message': 'Сообщения прочитаны'})
+
+
+@router.route('DELETE', 'remove_friend', writes=True)
+def remove_friend(req: Request) -> Dict[str, Any]:
+    req.cur.execute("""
+        DELETE FROM t_p74122035_gde_store_creation.friendships
+        WHERE (user_id = %(user_id)s AND friend_id = %(friend_id)s) OR (user_id = %(friend_id)s AND friend_id = %(user_id)s)
+    """, {'user_id': req.user_id(), 'friend_id': req.body.get('friend_id')})
+    req.conn.commit()
+    
+    return json_response({'message': 'Друг удалён'})
+
+
+@instrumented('social')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Friends, friend suggestions and direct messages between users
+    Args: event with httpMethod, body, queryStringParameters; context with request_id
+    Returns: HTTP response with friends, messages or unread counters
+    '''
+    return router.dispatch(event, context)
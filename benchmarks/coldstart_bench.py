@@ -0,0 +1,150 @@
+'''
+Cold-start benchmark for the cloud functions (backend/games, auth, admin, social).
+
+Every sample is a fresh interpreter, the way a new container starts. Measured per function:
+
+  import          - importing index.py, and whether psycopg2 got loaded by it
+  options/invalid - the first OPTIONS preflight and the first request with an unknown action,
+                    and whether either of them loaded psycopg2 or touched the database
+  first_request   - the first real request (needs DATABASE_URL; skipped otherwise)
+
+--baseline REV measures the functions of another git revision the same way (extracted with
+git archive), for a before/after table.
+
+    DATABASE_URL=postgresql://localhost/store_bench python benchmarks/coldstart_bench.py --runs 15 --baseline HEAD~1
+'''
+import argparse
+import importlib.util
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Not taken from pgfixture: the child interpreters must not import psycopg2 themselves
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+FUNCTIONS = ('games', 'auth', 'admin', 'social')
+FIRST_REQUESTS = {
+    'games': {'httpMethod': 'GET', 'queryStringParameters': {'status': 'approved', 'limit': '24'}},
+    'auth': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'frames'}},
+    'admin': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'maintenance_status'}},
+    'social': {'httpMethod': 'GET', 'queryStringParameters': {'action': 'unread', 'user_id': '1'}},
+}
+INVALID_REQUEST = {'httpMethod': 'GET', 'queryStringParameters': {'action': 'no_such_action'}}
+PREFLIGHT = {'httpMethod': 'OPTIONS'}
+
+
+def _timed_call(handler: Any, event: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        status: Any = handler(event, type('Context', (), {'request_id': 'coldstart'})())['statusCode']
+    except Exception as e:
+        status = type(e).__name__
+    return {'ms': (time.perf_counter() - started) * 1000, 'status': status, 'psycopg2': 'psycopg2' in sys.modules}
+
+
+def child(path: str, name: str, with_database: bool) -> Dict[str, Any]:
+    '''
+    Business: One cold start, run inside a fresh interpreter
+    Args: path of the function directory; name of the function; with_database - also send a real request
+    Returns: timings in ms and psycopg2 visibility after each step
+    '''
+    sys.path.insert(0, path)
+    if not with_database:
+        # A request that reaches the pool fails fast instead of waiting for a server
+        os.environ['DATABASE_URL'] = 'postgresql://coldstart.invalid:1/none?connect_timeout=1'
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('index', Path(path) / 'index.py')
+    index = importlib.util.module_from_spec(spec)
+    sys.modules['index'] = index
+    spec.loader.exec_module(index)
+    result: Dict[str, Any] = {'import': {'ms': (time.perf_counter() - started) * 1000, 'psycopg2': 'psycopg2' in sys.modules}}
+    result['options'] = _timed_call(index.handler, PREFLIGHT)
+    result['invalid'] = _timed_call(index.handler, INVALID_REQUEST)
+    if with_database:
+        result['first_request'] = _timed_call(index.handler, FIRST_REQUESTS[name])
+    return result
+
+
+def sample(backend: Path, name: str, with_database: bool) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', str(backend / name), name] + (['--with-database'] if with_database else []),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    steps: Dict[str, Any] = {}
+    for step in samples[0]:
+        rows = [s[step] for s in samples]
+        steps[step] = {
+            'median_ms': round(statistics.median(r['ms'] for r in rows), 3),
+            'max_ms': round(max(r['ms'] for r in rows), 3),
+            'psycopg2_loaded': any(r['psycopg2'] for r in rows),
+        }
+        if 'status' in rows[0]:
+            steps[step]['status'] = rows[-1]['status']
+    return steps
+
+
+def extract(revision: str, into: str) -> Path:
+    archive = subprocess.run(['git', 'archive', revision, 'backend'], cwd=ROOT, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(into)
+    return Path(into) / 'backend'
+
+
+def measure(backend: Path, runs: int, with_database: bool) -> Dict[str, Any]:
+    return {
+        name: summarize([sample(backend, name, with_database) for _ in range(runs)])
+        for name in FUNCTIONS if (backend / name / 'index.py').exists()
+    }
+
+
+def format_step(step: str, row: Dict[str, Any]) -> str:
+    text = f"{step} {row['median_ms']:.1f} ms"
+    if 'status' in row:
+        text += f" -> {row['status']}"
+    return text + (' [psycopg2]' if row['psycopg2_loaded'] else '')
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print(json.dumps(child(sys.argv[2], sys.argv[3], '--with-database' in sys.argv)))
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per function')
+    parser.add_argument('--baseline', help='git revision to compare the working tree against')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    with_database = bool(os.environ.get('DATABASE_URL'))
+    results: Dict[str, Optional[Dict[str, Any]]] = {'current': measure(BACKEND, args.runs, with_database), 'baseline': None}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            results['baseline'] = measure(extract(args.baseline, tmp), args.runs, with_database)
+
+    if args.json:
+        print(json.dumps({'runs': args.runs, 'baseline_revision': args.baseline, **results}, indent=2))
+        return
+    for label in ('baseline', 'current'):
+        tree = results[label]
+        if tree is None:
+            continue
+        print(f"{label}{f' ({args.baseline})' if label == 'baseline' else ''}, median of {args.runs} cold starts:")
+        for name, steps in tree.items():
+            cells = [format_step(step, row) for step, row in steps.items()]
+            print(f"  {name:<7} " + '  '.join(cells))
+
+
+if __name__ == '__main__':
+    main()
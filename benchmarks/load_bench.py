@@ -0,0 +1,308 @@
+'''
+In-process load benchmark for the three cloud functions (backend/games, backend/auth, backend/admin).
+
+Seeds a local Postgres from db_migrations at a configurable scale, imports every handler
+the way the platform would (each function directory isolated in its own module namespace),
+replays a weighted mix of realistic events and reports per-scenario p50/p95/p99 latency,
+requests/sec, database round trips per request and peak RSS.
+
+    DATABASE_URL=postgresql://localhost/store_bench python benchmarks/load_bench.py \\
+        --users 5000 --games 2000 --purchases 50000 --requests 5000 --json > HEAD.json
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from pgfixture import BACKEND, ROOT, SCHEMA, bootstrap_schema, connect
+
+BENCH_PASSWORD = 'bench-password'
+SCENARIOS = {
+    'catalog_browse': 40,
+    'catalog_page': 15,
+    'login': 10,
+    'library': 15,
+    'purchase': 10,
+    'admin_search': 10,
+}
+
+_counter = threading.local()
+
+
+def _count_round_trip() -> None:
+    _counter.value = getattr(_counter, 'value', 0) + 1
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        _count_round_trip()
+        return super().execute(query, vars)
+
+    def executemany(self, query: Any, vars_list: Any) -> Any:
+        _count_round_trip()
+        return super().executemany(query, vars_list)
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+
+    def commit(self) -> None:
+        _count_round_trip()
+        super().commit()
+
+    def rollback(self) -> None:
+        _count_round_trip()
+        super().rollback()
+
+
+class Function:
+    '''
+    Business: One cloud function loaded in-process with its own copies of the shared modules
+    Args: name of the directory under backend/, dsn for its connection pool
+    Returns: object whose call(event) runs handler() the way the platform would
+    '''
+
+    def __init__(self, name: str, dsn: str):
+        self.name = name
+        self.path = BACKEND / name
+        local = {p.stem for p in self.path.glob('*.py')}
+        saved = {m: sys.modules.pop(m) for m in list(sys.modules) if m in local}
+        sys.path.insert(0, str(self.path))
+        try:
+            spec = importlib.util.spec_from_file_location('index', self.path / 'index.py')
+            index = importlib.util.module_from_spec(spec)
+            sys.modules['index'] = index
+            spec.loader.exec_module(index)
+            self.modules: Dict[str, ModuleType] = {m: sys.modules.pop(m) for m in list(sys.modules) if m in local}
+        finally:
+            sys.path.remove(str(self.path))
+            sys.modules.update(saved)
+        self.handler: Callable = index.handler
+
+        db = self.modules['db']
+        pool = db.ConnectionPool(dsn, max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '4')))
+        pool._connect = lambda: psycopg2.connect(dsn, connection_factory=CountingConnection)
+        db._pool = pool
+
+    def call(self, event: Dict[str, Any], request_id: str) -> Tuple[Dict[str, Any], int]:
+        sys.modules.update(self.modules)
+        _counter.value = 0
+        response = self.handler(event, type('Context', (), {'request_id': request_id})())
+        return response, _counter.value
+
+
+def bench_password_hash() -> str:
+    spec = importlib.util.spec_from_file_location('bench_passwords', BACKEND / 'auth' / 'passwords.py')
+    passwords = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(passwords)
+    return passwords.hash_password(BENCH_PASSWORD)
+
+
+def seed(users: int, games: int, purchases: int, rnd: random.Random) -> Dict[str, List[Any]]:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {SCHEMA}.game_purchases, {SCHEMA}.user_frames, {SCHEMA}.user_libraries, "
+                    f"{SCHEMA}.balance_ledger, {SCHEMA}.balance_snapshots, "
+                    f"{SCHEMA}.messages, {SCHEMA}.message_unread, {SCHEMA}.friendships")
+        cur.execute(f"DELETE FROM {SCHEMA}.games")
+        cur.execute(f"DELETE FROM {SCHEMA}.users WHERE role <> 'admin'")
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.users (email, password, username, balance, is_verified) "
+            "SELECT 'bench' || g || '@example.com', %s, "
+            "(ARRAY['player', 'gamer', 'pixel', 'shadow', 'nova'])[1 + g %% 5] || '_' || substr(md5(g::text), 1, 6), "
+            "1000000, g %% 7 = 0 FROM generate_series(1, %s) g RETURNING id, email",
+            (bench_password_hash(), users)
+        )
+        accounts = cur.fetchall()
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.games (title, description, genre, age_rating, price, logo_url, file_url, status, created_by, engine_type) "
+            "SELECT (ARRAY['Space', 'Dungeon', 'Racing', 'Puzzle', 'Farm'])[1 + g %% 5] || ' ' || substr(md5(g::text), 1, 8), "
+            "repeat('Описание игры ', 8), (ARRAY['action', 'rpg', 'strategy', 'puzzle'])[1 + g %% 4], '12+', "
+            "(1 + g %% 50) * 0.99, 'https://cdn.example.com/logo.png', 'https://cdn.example.com/game.zip', "
+            "CASE WHEN g %% 20 = 0 THEN 'pending' ELSE 'approved' END, %s, 'html5' "
+            "FROM generate_series(1, %s) g RETURNING id, status",
+            (accounts[0][0], games)
+        )
+        catalog = cur.fetchall()
+        approved = [game_id for game_id, status in catalog if status == 'approved']
+        user_ids = [user_id for user_id, _ in accounts]
+        pairs = {(rnd.choice(user_ids), rnd.choice(approved)) for _ in range(purchases)}
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.game_purchases (user_id, game_id, purchase_price) "
+            f"SELECT t.user_id, t.game_id, g.price FROM unnest(%s::int[], %s::int[]) AS t(user_id, game_id) "
+            f"JOIN {SCHEMA}.games g ON g.id = t.game_id ON CONFLICT DO NOTHING",
+            ([u for u, _ in pairs], [g for _, g in pairs])
+        )
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.user_libraries (user_id, game_ids, revision) "
+            f"SELECT user_id, array_agg(game_id ORDER BY purchased_at, id), 1 FROM {SCHEMA}.game_purchases GROUP BY user_id"
+        )
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.users")
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.games")
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.game_purchases")
+    conn.close()
+    return {'accounts': accounts, 'games': approved}
+
+
+def make_event(scenario: str, data: Dict[str, List[Any]], rnd: random.Random) -> Tuple[str, Dict[str, Any]]:
+    user_id, email = rnd.choice(data['accounts'])
+    if scenario == 'catalog_browse':
+        params = {'status': 'approved'}
+        if rnd.random() < 0.3:
+            params['genre'] = rnd.choice(['action', 'rpg', 'strategy', 'puzzle'])
+        return 'games', {'httpMethod': 'GET', 'queryStringParameters': params}
+    if scenario == 'catalog_page':
+        return 'games', {'httpMethod': 'GET', 'queryStringParameters': {'status': 'approved', 'limit': '24'}}
+    if scenario == 'login':
+        body = {'action': 'login', 'email': email, 'password': BENCH_PASSWORD}
+        return 'auth', {'httpMethod': 'POST', 'body': json.dumps(body)}
+    if scenario == 'library':
+        return 'auth', {'httpMethod': 'GET', 'queryStringParameters': {'action': 'library', 'user_id': str(user_id)}}
+    if scenario == 'purchase':
+        body = {'action': 'purchase', 'user_id': user_id, 'game_id': rnd.choice(data['games'])}
+        return 'games', {'httpMethod': 'POST', 'body': json.dumps(body)}
+    if scenario == 'admin_search':
+        term = rnd.choice(['play', 'gam', 'pix', 'shad', 'nov', 'player_1'])
+        return 'admin', {'httpMethod': 'GET', 'queryStringParameters': {'action': 'search_users', 'q': term}}
+    raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def percentile(samples: List[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float], round_trips: List[int], statuses: Dict[int, int], elapsed: float) -> Dict[str, Any]:
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'round_trips_per_request': round(statistics.fmean(round_trips), 2),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--purchases', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests across all workers')
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=1, help='worker threads sharing the in-process functions')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in SCENARIOS.items()),
+                        help='comma-separated scenario=weight pairs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-seed', action='store_true', help='reuse data from a previous run')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    mix = {name: int(weight) for name, weight in (pair.split('=') for pair in args.mix.split(','))}
+    rnd = random.Random(args.seed)
+    dsn = os.environ['DATABASE_URL']
+
+    bootstrap_schema()
+    if args.skip_seed:
+        conn = connect()
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id, email FROM {SCHEMA}.users WHERE email LIKE 'bench%@example.com'")
+            accounts = cur.fetchall()
+            cur.execute(f"SELECT id FROM {SCHEMA}.games WHERE status = 'approved'")
+            data = {'accounts': accounts, 'games': [r[0] for r in cur.fetchall()]}
+        conn.close()
+    else:
+        data = seed(args.users, args.games, args.purchases, rnd)
+
+    functions = {name: Function(name, dsn) for name in ('games', 'auth', 'admin')}
+    names, weights = list(mix), list(mix.values())
+
+    for i in range(args.warmup):
+        function, event = make_event(rnd.choices(names, weights)[0], data, rnd)
+        functions[function].call(event, f'warmup-{i}')
+
+    samples: Dict[str, List[Tuple[float, int, int]]] = defaultdict(list)
+    lock = threading.Lock()
+    per_worker = args.requests // args.concurrency
+    barrier = threading.Barrier(args.concurrency)
+
+    def worker(worker_id: int) -> None:
+        local_rnd = random.Random(args.seed * 1000 + worker_id)
+        local: Dict[str, List[Tuple[float, int, int]]] = defaultdict(list)
+        barrier.wait()
+        for i in range(per_worker):
+            scenario = local_rnd.choices(names, weights)[0]
+            function, event = make_event(scenario, data, local_rnd)
+            started = time.perf_counter()
+            response, round_trips = functions[function].call(event, f'bench-{worker_id}-{i}')
+            local[scenario].append((time.perf_counter() - started, round_trips, response['statusCode']))
+        with lock:
+            for scenario, rows in local.items():
+                samples[scenario].extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    def report(rows: List[Tuple[float, int, int]], window: float) -> Dict[str, Any]:
+        statuses: Dict[int, int] = defaultdict(int)
+        for _, _, status in rows:
+            statuses[status] += 1
+        return summarize([r[0] for r in rows], [r[1] for r in rows], statuses, window)
+
+    everything = [row for rows in samples.values() for row in rows]
+    results = {
+        'revision': git_revision(),
+        'config': {k: v for k, v in vars(args).items() if k != 'json'},
+        'elapsed_s': round(elapsed, 3),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'total': report(everything, elapsed),
+        'scenarios': {name: report(rows, elapsed) for name, rows in sorted(samples.items())},
+        'pools': {name: f.modules['db'].pool_stats() for name, f in functions.items()},
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"revision {results['revision']}, {len(everything)} requests in {elapsed:.2f}s, "
+          f"concurrency {args.concurrency}, peak RSS {results['peak_rss_kb'] // 1024} MiB")
+    print(f"{'scenario':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rt/req':>7}  statuses")
+    for name, row in [*results['scenarios'].items(), ('total', results['total'])]:
+        print(f"{name:<16} {row['requests']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['round_trips_per_request']:>7}  {row['statuses']}")
+    print(f"throughput {results['total']['rps']} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+'''
+Long-poll delivery benchmark for the social function (backend/social, action=receive).
+
+Seeds sender/receiver pairs on a local Postgres, parks one receive long-poll per receiver
+and then, in two phases, reports:
+
+  idle      - database round trips per parked request while nothing is sent
+  delivery  - send-to-receive latency (p50/p99) when messages arrive at random times
+
+    DATABASE_URL=postgresql://localhost/store_bench python benchmarks/longpoll_bench.py --receivers 50 --json
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from load_bench import Function
+from pgfixture import SCHEMA, bootstrap_schema, connect
+
+
+def seed(pairs: int) -> List[int]:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id FROM {SCHEMA}.users WHERE email LIKE 'longpoll%@example.com'")
+        old = [r[0] for r in cur.fetchall()]
+        if old:
+            cur.execute(f"DELETE FROM {SCHEMA}.message_unread WHERE user_id = ANY(%s) OR peer_id = ANY(%s)", (old, old))
+            cur.execute(f"DELETE FROM {SCHEMA}.messages WHERE sender_id = ANY(%s) OR receiver_id = ANY(%s)", (old, old))
+            cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id = ANY(%s)", (old,))
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.users (email, password, username) "
+            "SELECT 'longpoll' || g || '@example.com', 'x', 'longpoll' || g FROM generate_series(1, %s) g RETURNING id",
+            (pairs * 2,)
+        )
+        ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def percentile(samples: List[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def receive(social: Function, user_id: int, timeout: float, results: List[Dict[str, Any]]) -> None:
+    response, round_trips = social.call({
+        'httpMethod': 'GET',
+        'queryStringParameters': {'action': 'receive', 'user_id': str(user_id), 'timeout': str(timeout)},
+    }, f'receive-{user_id}')
+    body = json.loads(response['body'])
+    results.append({'user_id': user_id, 'finished': time.perf_counter(), 'round_trips': round_trips, 'items': len(body['items'])})
+
+
+def park(social: Function, receivers: List[int], timeout: float) -> tuple:
+    results: List[Dict[str, Any]] = []
+    threads = [threading.Thread(target=receive, args=(social, r, timeout, results)) for r in receivers]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receivers', type=int, default=50)
+    parser.add_argument('--idle-seconds', type=float, default=5.0, help='long-poll timeout in the idle phase')
+    parser.add_argument('--spread-seconds', type=float, default=3.0, help='window the delivery phase sends within')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.receivers + 2))
+    bootstrap_schema()
+    ids = seed(args.receivers)
+    senders, receivers = ids[:args.receivers], ids[args.receivers:]
+    social = Function('social', os.environ['DATABASE_URL'])
+    rnd = random.Random(args.seed)
+
+    threads, idle = park(social, receivers, args.idle_seconds)
+    for t in threads:
+        t.join()
+    idle_round_trips = [r['round_trips'] for r in idle]
+
+    threads, delivered = park(social, receivers, args.spread_seconds + 10)
+    time.sleep(0.5)
+    sent_at: Dict[int, float] = {}
+    schedule = sorted((rnd.uniform(0, args.spread_seconds), s, r) for s, r in zip(senders, receivers))
+    begin = time.perf_counter()
+    for offset, sender, receiver in schedule:
+        time.sleep(max(0.0, begin + offset - time.perf_counter()))
+        sent_at[receiver] = time.perf_counter()
+        social.call({
+            'httpMethod': 'POST',
+            'body': json.dumps({'action': 'send_message', 'user_id': sender, 'receiver_id': receiver, 'message': 'ping'}),
+        }, f'send-{sender}')
+    for t in threads:
+        t.join()
+    latencies = [r['finished'] - sent_at[r['user_id']] for r in delivered if r['items']]
+
+    result = {
+        'receivers': args.receivers,
+        'idle': {
+            'timeout_seconds': args.idle_seconds,
+            'round_trips_per_request': statistics.fmean(idle_round_trips),
+            'round_trips_per_receiver_minute': round(statistics.fmean(idle_round_trips) * 60 / args.idle_seconds, 2),
+        },
+        'delivery': {
+            'delivered': sum(1 for r in delivered if r['items']),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'round_trips_per_request': statistics.fmean(r['round_trips'] for r in delivered),
+        },
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{args.receivers} receivers")
+    print(f"idle:     {result['idle']['round_trips_per_request']:.2f} round trips per {args.idle_seconds}s poll "
+          f"({result['idle']['round_trips_per_receiver_minute']} per receiver-minute)")
+    print(f"delivery: {result['delivery']['delivered']}/{args.receivers} delivered, "
+          f"p50 {result['delivery']['p50_ms']} ms, p99 {result['delivery']['p99_ms']} ms, "
+          f"{result['delivery']['round_trips_per_request']:.2f} round trips per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+'''
+Login cost benchmark for the password hasher (backend/auth/passwords.py).
+
+Times verify_password() - the CPU work added to every login - at a range of scrypt cost
+settings, single-threaded and then across worker processes, and reports per-core and
+total logins/sec, p50/p99 verify latency and memory per hash. Settings whose p99 exceeds
+--target-p99-ms are flagged so a cost can be picked for PASSWORD_SCRYPT_N/R/P.
+
+    python benchmarks/password_bench.py --n 4096,8192,16384,32768 --processes 4 --json
+'''
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+from pgfixture import BACKEND
+
+
+def load_passwords() -> Any:
+    spec = importlib.util.spec_from_file_location('passwords', BACKEND / 'auth' / 'passwords.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+passwords = load_passwords()
+
+
+def percentile(samples: List[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def verify_loop(stored: str, seconds: float) -> List[float]:
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        passwords.verify_password('correct horse battery staple', stored)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def measure(params: Any, seconds: float, processes: int) -> Dict[str, Any]:
+    stored = passwords.hash_password('correct horse battery staple', params)
+    verify_loop(stored, min(seconds, 0.2))
+    timings = verify_loop(stored, seconds)
+
+    result = {
+        'n': params.n,
+        'r': params.r,
+        'p': params.p,
+        'memory_kib': 128 * params.n * params.r // 1024,
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 2),
+        'logins_per_sec_per_core': round(len(timings) / sum(timings), 1),
+    }
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            started = time.perf_counter()
+            batches = pool.starmap(verify_loop, [(stored, seconds)] * processes)
+            elapsed = time.perf_counter() - started
+        parallel = [t for batch in batches for t in batch]
+        result.update({
+            'processes': processes,
+            'logins_per_sec_total': round(len(parallel) / elapsed, 1),
+            'p99_ms_loaded': round(percentile(parallel, 0.99) * 1000, 2),
+        })
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', default='4096,8192,16384,32768', help='comma-separated scrypt N values (powers of two)')
+    parser.add_argument('--r', type=int, default=passwords.DEFAULT_PARAMS.r)
+    parser.add_argument('--p', type=int, default=passwords.DEFAULT_PARAMS.p)
+    parser.add_argument('--seconds', type=float, default=2.0, help='measurement time per setting')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--target-p99-ms', type=float, default=100.0, help='login hashing budget')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    for n in (int(v) for v in args.n.split(',')):
+        result = measure(passwords.ScryptParams(n, args.r, args.p), args.seconds, args.processes)
+        result['meets_target'] = result.get('p99_ms_loaded', result['p99_ms']) <= args.target_p99_ms
+        results.append(result)
+
+    if args.json:
+        print(json.dumps({'target_p99_ms': args.target_p99_ms, 'default': passwords.DEFAULT_PARAMS._asdict(), 'results': results}, indent=2))
+        return
+    print(f'default {passwords.DEFAULT_PARAMS}, target p99 {args.target_p99_ms} ms, {args.processes} processes')
+    for r in results:
+        loaded = f"  {r['logins_per_sec_total']:>8} /s total  p99 loaded {r['p99_ms_loaded']:>7} ms" if 'processes' in r else ''
+        print(f"n={r['n']:<6} r={r['r']} p={r['p']} {r['memory_kib']:>7} KiB  p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>7} ms  "
+              f"{r['logins_per_sec_per_core']:>7} /s/core{loaded}  {'ok' if r['meets_target'] else 'OVER'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import psycopg2
+
+SCHEMA = 't_p74122035_gde_store_creation'
+ROOT = Path(__file__).resolve().parent.parent
+MIGRATIONS = ROOT / 'db_migrations'
+BACKEND = ROOT / 'backend'
+
+
+def connect(dsn: str = '') -> Any:
+    return psycopg2.connect(dsn or os.environ['DATABASE_URL'])
+
+
+def bootstrap_schema(dsn: str = '', reset: bool = False) -> None:
+    '''
+    Business: Creates the store schema on a local Postgres by replaying db_migrations in order
+    Args: dsn - defaults to DATABASE_URL; reset drops the schema first
+    Returns: None
+    '''
+    conn = connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            if reset:
+                cur.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+            cur.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+            cur.execute(f'SET search_path TO {SCHEMA}, public')
+            for migration in sorted(MIGRATIONS.glob('V*.sql'), key=lambda p: int(p.name[1:].split('__')[0])):
+                cur.execute(migration.read_text())
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,147 @@
+'''
+Concurrency stress test for the purchase engine (backend/games/purchases.py).
+
+Runs N parallel buyers against a local Postgres and checks that every balance equals
+its starting value minus the recorded purchase prices, that no balance goes negative
+and that every "purchased" result corresponds to exactly one ownership row, mirrored in the
+per-user library projection and by a balance ledger that sums to every balance.
+
+    DATABASE_URL=postgresql://localhost/store_bench python benchmarks/purchase_stress.py --buyers 32
+'''
+import argparse
+import random
+import sys
+import threading
+from collections import Counter
+from decimal import Decimal
+
+from pgfixture import BACKEND, SCHEMA, bootstrap_schema, connect
+
+sys.path.insert(0, str(BACKEND / 'games'))
+from purchases import PURCHASED, purchase, refund_game  # noqa: E402
+
+
+def seed(users: int, games: int, balance: Decimal, price: Decimal) -> tuple:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {SCHEMA}.game_purchases")
+        cur.execute(f"DELETE FROM {SCHEMA}.user_libraries")
+        cur.execute(f"DELETE FROM {SCHEMA}.user_frames")
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.users (email, password, username, balance) "
+            "SELECT 'stress' || g || '-' || md5(random()::text) || '@example.com', 'x', 'stress' || g, %s "
+            "FROM generate_series(1, %s) g RETURNING id",
+            (balance, users)
+        )
+        user_ids = [r[0] for r in cur.fetchall()]
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.balance_ledger (user_id, amount, kind) SELECT unnest(%s::int[]), %s, 'opening'",
+            (user_ids, balance)
+        )
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.games (title, description, genre, age_rating, price, logo_url, file_url, status) "
+            "SELECT 'Stress ' || g, 'd', 'action', '12+', %s, 'l', 'f', 'approved' FROM generate_series(1, %s) g RETURNING id",
+            (price, games)
+        )
+        game_ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    conn.close()
+    return user_ids, game_ids
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=16, help='parallel threads, each with its own connection')
+    parser.add_argument('--attempts', type=int, default=200, help='purchase attempts per buyer')
+    parser.add_argument('--users', type=int, default=4, help='accounts shared by all buyers')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--balance', type=Decimal, default=Decimal('250.00'))
+    parser.add_argument('--price', type=Decimal, default=Decimal('19.99'))
+    parser.add_argument('--refund-share', type=float, default=0.1, help='fraction of attempts that refund instead')
+    args = parser.parse_args()
+
+    bootstrap_schema()
+    user_ids, game_ids = seed(args.users, args.games, args.balance, args.price)
+    outcomes: Counter = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(args.buyers)
+
+    def buyer(seed_value: int) -> None:
+        rnd = random.Random(seed_value)
+        conn = connect()
+        local: Counter = Counter()
+        start.wait()
+        try:
+            for _ in range(args.attempts):
+                user_id, game_id = rnd.choice(user_ids), rnd.choice(game_ids)
+                if rnd.random() < args.refund_share:
+                    local['refund:' + refund_game(conn, user_id, game_id)['status']] += 1
+                else:
+                    local[purchase(conn, 'game', user_id, game_id)['status']] += 1
+        finally:
+            conn.close()
+        with lock:
+            outcomes.update(local)
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(args.buyers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT u.id, u.balance, COALESCE(SUM(gp.purchase_price), 0), COUNT(gp.id)
+                FROM {SCHEMA}.users u LEFT JOIN {SCHEMA}.game_purchases gp ON gp.user_id = u.id
+                WHERE u.id = ANY(%s) GROUP BY u.id, u.balance""",
+            (user_ids,)
+        )
+        rows = cur.fetchall()
+        cur.execute(
+            f"""SELECT COUNT(*) FROM {SCHEMA}.users u
+                LEFT JOIN {SCHEMA}.user_libraries l ON l.user_id = u.id
+                WHERE u.id = ANY(%s) AND ARRAY(SELECT unnest(l.game_ids) ORDER BY 1) IS DISTINCT FROM ARRAY(
+                    SELECT gp.game_id FROM {SCHEMA}.game_purchases gp WHERE gp.user_id = u.id ORDER BY 1
+                )""",
+            (user_ids,)
+        )
+        stale_libraries = cur.fetchone()[0]
+        cur.execute(
+            f"""SELECT COUNT(*) FROM {SCHEMA}.users u
+                WHERE u.id = ANY(%s) AND u.balance <> (
+                    SELECT COALESCE(SUM(l.amount), 0) FROM {SCHEMA}.balance_ledger l WHERE l.user_id = u.id
+                )""",
+            (user_ids,)
+        )
+        unbalanced_ledgers = cur.fetchone()[0]
+    conn.close()
+
+    refunded = outcomes['refund:refunded']
+    owned = sum(r[3] for r in rows)
+    refund_total = Decimal(refunded) * (args.price * Decimal('0.9')).quantize(Decimal('0.01'))
+    spent_total = Decimal(outcomes[PURCHASED]) * args.price
+    expected_total = args.balance * len(user_ids) - spent_total + refund_total
+    actual_total = sum(r[1] for r in rows)
+
+    print(dict(outcomes))
+    failures = []
+    if any(r[1] < 0 for r in rows):
+        failures.append('negative balance')
+    if owned != outcomes[PURCHASED] - refunded:
+        failures.append(f'ownership rows {owned} != purchased {outcomes[PURCHASED]} - refunded {refunded}')
+    if actual_total != expected_total:
+        failures.append(f'total balance {actual_total} != expected {expected_total}')
+    if stale_libraries:
+        failures.append(f'{stale_libraries} library projections out of sync with game_purchases')
+    if unbalanced_ledgers:
+        failures.append(f'{unbalanced_ledgers} balances differ from their ledger sum')
+    for failure in failures:
+        print('FAIL:', failure)
+    if not failures:
+        print(f'OK: {len(user_ids)} accounts consistent after {args.buyers * args.attempts} attempts')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+'''
+Build-time benchmark for the recommendations job (jobs/build_recommendations.py).
+
+Generates a synthetic purchase history with power-law game popularity, then runs the
+job's co-purchase counting and top-K ranking over it in chunks, each configuration in a
+fresh process, and reports seconds per phase, purchase rows/sec and peak RSS. Comparing
+--chunk-rows values shows memory staying bounded as the history grows.
+
+    python benchmarks/recommendations_bench.py --purchases 2000000 --games 20000 --chunk-rows 100000,500000 --json
+'''
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import resource
+import time
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+from pgfixture import ROOT
+
+
+def load_job() -> Any:
+    spec = importlib.util.spec_from_file_location('build_recommendations', ROOT / 'jobs' / 'build_recommendations.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+job = load_job()
+
+
+def synthetic_purchases(users: int, games: int, purchases: int, seed: int) -> tuple:
+    rnd = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, games + 1) ** 0.9
+    user_ids = rnd.integers(1, users + 1, size=purchases)
+    game_ids = rnd.choice(np.arange(1, games + 1), size=purchases, p=popularity / popularity.sum())
+    keys = np.unique(user_ids * (games + 1) + game_ids)
+    return keys // (games + 1), keys % (games + 1)
+
+
+def chunks(user_ids: np.ndarray, game_ids: np.ndarray, chunk_rows: int) -> Iterator[tuple]:
+    for start in range(0, len(user_ids), chunk_rows):
+        yield user_ids[start:start + chunk_rows], game_ids[start:start + chunk_rows]
+
+
+def measure(users: int, games: int, purchases: int, seed: int, chunk_rows: int, top_k: int) -> Dict[str, Any]:
+    user_ids, game_ids = synthetic_purchases(users, games, purchases, seed)
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    counts = job.cooccurrence(chunks(user_ids, game_ids, chunk_rows), np.arange(1, games + 1))
+    counted = time.perf_counter()
+    rows = sum(len(columns) for _, columns, _, _ in job.top_neighbours(counts, top_k))
+    ranked = time.perf_counter()
+    return {
+        'chunk_rows': chunk_rows,
+        'purchase_rows': len(user_ids),
+        'co_purchase_pairs': int(counts.nnz),
+        'neighbour_rows': rows,
+        'count_seconds': round(counted - started, 3),
+        'rank_seconds': round(ranked - counted, 3),
+        'rows_per_sec': round(len(user_ids) / (ranked - started)),
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'input_rss_mib': round(baseline_kib / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--games', type=int, default=5000)
+    parser.add_argument('--purchases', type=int, default=1000000, help='purchase rows before de-duplication')
+    parser.add_argument('--chunk-rows', default='100000,500000', help='comma-separated chunk sizes to compare')
+    parser.add_argument('--top-k', type=int, default=job.TOP_K)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    for chunk_rows in (int(v) for v in args.chunk_rows.split(',')):
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            results.append(pool.apply(measure, (args.users, args.games, args.purchases, args.seed, chunk_rows, args.top_k)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"chunk {r['chunk_rows']:>8}: {r['purchase_rows']} rows -> {r['co_purchase_pairs']} pairs, {r['neighbour_rows']} neighbours  "
+              f"count {r['count_seconds']}s  rank {r['rank_seconds']}s  {r['rows_per_sec']} rows/s  "
+              f"peak RSS {r['peak_rss_mib']} MiB (input {r['input_rss_mib']} MiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''
+Micro-benchmark for the response layer (backend/games/responses.py).
+
+Serializes a synthetic catalog of N game rows the way handlers used to (hand-built dicts
+plus stdlib json.dumps) and the way they do now (row encoders compiled at import plus
+orjson, or the stdlib fallback), reporting throughput and peak traced memory per row.
+
+    python benchmarks/serialization_bench.py --rows 10000 --json
+'''
+import argparse
+import importlib.util
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from pgfixture import BACKEND
+
+sys.path.insert(0, str(BACKEND / 'games'))
+
+RESPONSES = BACKEND / 'games' / 'responses.py'
+
+
+def load_responses(block_orjson: bool) -> Any:
+    saved = sys.modules.get('orjson')
+    if block_orjson:
+        sys.modules['orjson'] = None
+    try:
+        spec = importlib.util.spec_from_file_location(f'responses_{"stdlib" if block_orjson else "fast"}', RESPONSES)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        if block_orjson:
+            if saved is None:
+                sys.modules.pop('orjson', None)
+            else:
+                sys.modules['orjson'] = saved
+
+
+def make_rows(n: int) -> List[tuple]:
+    start = datetime(2024, 1, 1)
+    return [
+        (i, f'Game {i}', 'Описание игры ' * 8, 'action', '12+', Decimal(f'{i % 500}.99'),
+         f'https://cdn.example.com/logo/{i}.png', f'https://cdn.example.com/file/{i}.zip',
+         'approved', i % 97, 'unity', start + timedelta(minutes=i))
+        for i in range(n)
+    ]
+
+
+def legacy(rows: List[tuple]) -> str:
+    return json.dumps([{
+        'id': g[0],
+        'title': g[1],
+        'description': g[2],
+        'genre': g[3],
+        'age_rating': g[4],
+        'price': float(g[5]),
+        'logo_url': g[6],
+        'file_url': g[7],
+        'status': g[8],
+        'created_by': g[9],
+        'engine_type': g[10]
+    } for g in rows])
+
+
+def encoder_for(responses: Any) -> Callable[[List[tuple]], bytes]:
+    encode_game = responses.row_encoder({
+        'id': 0, 'title': 1, 'description': 2, 'genre': 3, 'age_rating': 4, 'price': (5, responses.money),
+        'logo_url': 6, 'file_url': 7, 'status': 8, 'created_by': 9, 'engine_type': 10
+    })
+    return lambda rows: responses.dumps_bytes([encode_game(g) for g in rows])
+
+
+def measure(fn: Callable[[List[tuple]], Any], rows: List[tuple], repeat: int) -> Dict[str, float]:
+    fn(rows)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'median_ms': round(median * 1000, 3),
+        'rows_per_sec': round(len(rows) / median),
+        'peak_bytes_per_row': round(peak / len(rows), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    variants = {'legacy_dict_json': legacy, 'encoder_stdlib': encoder_for(load_responses(block_orjson=True))}
+    fast = load_responses(block_orjson=False)
+    if fast.orjson is not None:
+        variants['encoder_orjson'] = encoder_for(fast)
+
+    results = {name: measure(fn, rows, args.repeat) for name, fn in variants.items()}
+    baseline = results['legacy_dict_json']['median_ms']
+    for result in results.values():
+        result['speedup'] = round(baseline / result['median_ms'], 2)
+
+    if args.json:
+        print(json.dumps({'rows': args.rows, 'results': results}, indent=2))
+        return
+    print(f'{args.rows} rows, median of {args.repeat} runs')
+    for name, result in results.items():
+        print(f"{name:<18} {result['median_ms']:>9.2f} ms  {result['rows_per_sec']:>9} rows/s  "
+              f"{result['peak_bytes_per_row']:>8} B/row peak  x{result['speedup']}")
+
+
+if __name__ == '__main__':
+    main()
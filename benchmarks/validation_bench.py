@@ -0,0 +1,210 @@
+'''
+Throughput benchmark for the submission validation queue (jobs/validate_submissions.py).
+
+Starts a local stub CDN that serves logos of various sizes, game files of various lengths,
+404s and flaky URLs that fail with 503 a few times before answering. Submits games through
+the games function (reporting submit latency, which no longer waits for any check), then
+drains the queue with 1..N worker processes and reports jobs/sec, retries and whether every
+game ended up with a validation result.
+
+    DATABASE_URL=postgresql://localhost/store_bench python benchmarks/validation_bench.py \\
+        --games 500 --processes 1,2,4 --stub-latency-ms 50 --json
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from load_bench import Function
+from pgfixture import ROOT, SCHEMA, bootstrap_schema, connect
+
+FLAKY_FAILURES = 2
+
+
+def png_header(width: int, height: int) -> bytes:
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+
+
+class StubCDN(BaseHTTPRequestHandler):
+    latency = 0.0
+    failures: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+
+    def _answer(self, with_body: bool) -> None:
+        time.sleep(self.latency)
+        kind, _, arg = self.path.strip('/').partition('/')
+        if kind == 'flaky':
+            with self.lock:
+                self.failures[self.path] += 1
+                failing = self.failures[self.path] <= FLAKY_FAILURES
+            if failing:
+                self.send_error(503)
+                return
+            kind, _, arg = arg.partition('/')[2].partition('/')
+        if kind == 'logo':
+            width, _, height = arg.partition('x')
+            body = png_header(int(width), int(height)) + b'\0' * 256
+        elif kind == 'text':
+            body = b'<html>not an image</html>'
+        elif kind == 'file':
+            self.send_response(200)
+            self.send_header('Content-Length', arg)
+            self.end_headers()
+            return
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self._answer(True)
+
+    def do_HEAD(self) -> None:
+        self._answer(False)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def start_stub(latency_ms: float) -> ThreadingHTTPServer:
+    StubCDN.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubCDN)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def submission(base: str, n: int, rnd: random.Random) -> Dict[str, Any]:
+    logo = rnd.choice(['logo/512x512', 'logo/512x512', 'logo/16x16', 'logo/9000x300', 'text/x', 'missing/logo.png'])
+    file = rnd.choice([f'file/{50 * 1024 * 1024}', f'file/{50 * 1024 * 1024}', f'file/{2 * 1024 ** 3}', 'missing/game.zip'])
+    if rnd.random() < 0.2:
+        logo, file = f'flaky/{n}/{logo}', f'flaky/{n}/{file}'
+    title = f'Validation Bench {n % 400 if rnd.random() < 0.1 else n}'
+    return {'title': title, 'description': 'Бенчмарк', 'genre': 'puzzle', 'age_rating': '12+', 'price': 1.99,
+            'logo_url': f'{base}/{logo}', 'file_url': f'{base}/{file}', 'engine_type': 'html5'}
+
+
+def seed_author() -> int:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {SCHEMA}.games WHERE title LIKE 'Validation Bench %%'")
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.users (email, password, username) VALUES ('validation-bench@example.com', 'x', 'validation_bench') "
+            "ON CONFLICT (email) DO UPDATE SET username = EXCLUDED.username RETURNING id"
+        )
+        author = cur.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return author
+
+
+def requeue(game_ids: List[int]) -> None:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"UPDATE {SCHEMA}.games SET validation = NULL, validated_at = NULL WHERE id = ANY(%s)", (game_ids,))
+        cur.execute(
+            f"UPDATE {SCHEMA}.validation_jobs SET status = 'queued', attempts = 0, run_after = CURRENT_TIMESTAMP, "
+            "locked_by = NULL, locked_at = NULL, last_error = NULL, finished_at = NULL WHERE game_id = ANY(%s)",
+            (game_ids,)
+        )
+    conn.commit()
+    conn.close()
+    StubCDN.failures.clear()
+
+
+def drain(processes: int, backoff: float) -> Dict[str, Any]:
+    env = dict(os.environ, VALIDATION_ALLOW_PRIVATE_HOSTS='1', VALIDATION_BACKOFF_SECONDS=str(backoff), VALIDATION_POLL_SECONDS='0.2')
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, str(ROOT / 'jobs' / 'validate_submissions.py'), '--processes', str(processes), '--exit-when-drained', '--metrics-seconds', '3600'],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    elapsed = time.perf_counter() - started
+    exits = [e for e in map(json.loads, output.splitlines()) if e['event'] == 'validation_worker_exit']
+    processed = sum(e['processed'] for e in exits)
+    return {
+        'processes': processes,
+        'processed': processed,
+        'retried': sum(e['retried'] for e in exits),
+        'failed': sum(e['failed'] for e in exits),
+        'seconds': round(elapsed, 3),
+        'jobs_per_sec': round(processed / elapsed, 2),
+    }
+
+
+def outcome(game_ids: List[int]) -> Dict[str, int]:
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT COUNT(*) FILTER (WHERE validation IS NULL), COUNT(*) FILTER (WHERE (validation->>'ok')::boolean), "
+            f"COUNT(*) FILTER (WHERE jsonb_array_length(validation->'duplicate_ids') > 0) FROM {SCHEMA}.games WHERE id = ANY(%s)",
+            (game_ids,)
+        )
+        missing, ok, duplicates = cur.fetchone()
+    conn.close()
+    return {'missing': missing, 'ok': ok, 'with_issues': len(game_ids) - missing - ok, 'duplicate_titles': duplicates}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--processes', default='1,2,4', help='comma-separated worker process counts to compare')
+    parser.add_argument('--stub-latency-ms', type=float, default=50.0, help='delay the stub CDN adds to every request')
+    parser.add_argument('--backoff-seconds', type=float, default=0.2, help='retry backoff base used by the workers')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    bootstrap_schema()
+    server = start_stub(args.stub_latency_ms)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    rnd = random.Random(args.seed)
+    author = seed_author()
+    games = Function('games', os.environ['DATABASE_URL'])
+
+    submit_ms, game_ids = [], []
+    for n in range(args.games):
+        body = dict(submission(base, n, rnd), action='submit', user_id=author)
+        started = time.perf_counter()
+        response, _ = games.call({'httpMethod': 'POST', 'body': json.dumps(body)}, f'submit-{n}')
+        submit_ms.append((time.perf_counter() - started) * 1000)
+        game_ids.append(json.loads(response['body'])['id'])
+
+    runs = []
+    for processes in (int(v) for v in args.processes.split(',')):
+        requeue(game_ids)
+        runs.append(dict(drain(processes, args.backoff_seconds), **outcome(game_ids)))
+    server.shutdown()
+
+    result = {
+        'games': args.games,
+        'stub_latency_ms': args.stub_latency_ms,
+        'submit_p50_ms': round(statistics.median(submit_ms), 2),
+        'runs': runs,
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{args.games} submissions, submit p50 {result['submit_p50_ms']} ms, stub latency {args.stub_latency_ms} ms")
+    for r in runs:
+        print(f"{r['processes']:>3} processes: {r['processed']} jobs in {r['seconds']}s = {r['jobs_per_sec']} jobs/s, "
+              f"{r['retried']} retries, {r['failed']} gave up; ok {r['ok']}, issues {r['with_issues']}, "
+              f"duplicates {r['duplicate_titles']}, missing {r['missing']}")
+
+
+if __name__ == '__main__':
+    main()
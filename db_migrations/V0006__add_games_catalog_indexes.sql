@@ -0,0 +1,17 @@
+-- Keyset pagination over the storefront catalog: (created_at, id) per status
+CREATE INDEX IF NOT EXISTS idx_games_status_created_id
+    ON t_p74122035_gde_store_creation.games (status, created_at DESC, id DESC);
+
+-- Catalog filters with the same keyset order
+CREATE INDEX IF NOT EXISTS idx_games_status_genre_created_id
+    ON t_p74122035_gde_store_creation.games (status, genre, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_games_status_age_rating_created_id
+    ON t_p74122035_gde_store_creation.games (status, age_rating, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_games_status_engine_created_id
+    ON t_p74122035_gde_store_creation.games (status, engine_type, created_at DESC, id DESC);
+
+-- Price range filter
+CREATE INDEX IF NOT EXISTS idx_games_status_price
+    ON t_p74122035_gde_store_creation.games (status, price);
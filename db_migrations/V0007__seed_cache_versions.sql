@@ -0,0 +1,4 @@
+-- Invalidation counters for per-container response caches
+INSERT INTO t_p74122035_gde_store_creation.system_settings (key, value)
+VALUES ('cache_version:games', '0'), ('cache_version:frames', '0')
+ON CONFLICT (key) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Trigram index for username search (ILIKE '%term%' and similarity ranking)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_username_trgm
+    ON t_p74122035_gde_store_creation.users USING GIN (username gin_trgm_ops);
+
+-- Weighted full-text vector over the catalog for ranked prefix search
+ALTER TABLE t_p74122035_gde_store_creation.games
+    ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(genre, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_games_search_vector
+    ON t_p74122035_gde_store_creation.games USING GIN (search_vector);
@@ -0,0 +1,6 @@
+-- Keyset order of the admin user list: verified first, then username, id
+UPDATE t_p74122035_gde_store_creation.users SET is_verified = FALSE WHERE is_verified IS NULL;
+ALTER TABLE t_p74122035_gde_store_creation.users ALTER COLUMN is_verified SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_users_verified_username_id
+    ON t_p74122035_gde_store_creation.users ((NOT is_verified), username, id);
@@ -0,0 +1,19 @@
+-- Per-user library projection: owned game ids in purchase order plus a revision
+-- bumped by every purchase, checkout and refund (backend/*/purchases.py)
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.user_libraries (
+    user_id INTEGER PRIMARY KEY REFERENCES t_p74122035_gde_store_creation.users(id),
+    game_ids INTEGER[] NOT NULL DEFAULT '{}',
+    revision BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p74122035_gde_store_creation.user_libraries (user_id, game_ids, revision)
+SELECT user_id, array_agg(game_id ORDER BY purchased_at, id), 1
+FROM t_p74122035_gde_store_creation.game_purchases
+WHERE user_id IS NOT NULL AND game_id IS NOT NULL
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
+
+-- Library reads in purchase order without touching the heap
+CREATE INDEX IF NOT EXISTS idx_game_purchases_user_purchased
+    ON t_p74122035_gde_store_creation.game_purchases (user_id, purchased_at, id) INCLUDE (game_id);
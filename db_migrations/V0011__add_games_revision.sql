@@ -0,0 +1,25 @@
+-- Catalog change feed: every insert and status change takes the next revision,
+-- so clients can ask for rows changed since the revision they last saw
+CREATE SEQUENCE IF NOT EXISTS t_p74122035_gde_store_creation.games_revision_seq;
+
+ALTER TABLE t_p74122035_gde_store_creation.games
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS revision BIGINT;
+
+UPDATE t_p74122035_gde_store_creation.games g
+SET revision = s.revision, updated_at = COALESCE(g.updated_at, g.created_at)
+FROM (
+    SELECT id, nextval('t_p74122035_gde_store_creation.games_revision_seq') AS revision
+    FROM (SELECT id FROM t_p74122035_gde_store_creation.games WHERE revision IS NULL ORDER BY created_at, id) ordered
+) s
+WHERE g.id = s.id;
+
+ALTER TABLE t_p74122035_gde_store_creation.games
+    ALTER COLUMN revision SET DEFAULT nextval('t_p74122035_gde_store_creation.games_revision_seq'),
+    ALTER COLUMN revision SET NOT NULL;
+
+ALTER SEQUENCE t_p74122035_gde_store_creation.games_revision_seq
+    OWNED BY t_p74122035_gde_store_creation.games.revision;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_games_revision
+    ON t_p74122035_gde_store_creation.games (revision);
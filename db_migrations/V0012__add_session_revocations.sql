@@ -0,0 +1,9 @@
+-- Session tokens issued to a user before revoked_at_ms (unix ms) are rejected;
+-- rows older than the token TTL no longer matter and are skipped by readers
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.session_revocations (
+    user_id INTEGER PRIMARY KEY REFERENCES t_p74122035_gde_store_creation.users(id),
+    revoked_at_ms BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_revocations_revoked_at
+    ON t_p74122035_gde_store_creation.session_revocations (revoked_at_ms);
@@ -0,0 +1,38 @@
+-- Append-only history of every balance change; users.balance stays the running total
+-- that purchases lock and check, the ledger is what history and reports read
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.balance_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES t_p74122035_gde_store_creation.users(id),
+    amount DECIMAL(12, 2) NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    game_id INTEGER,
+    frame_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Balance tail after a snapshot: (user_id, id > snapshot ledger_id)
+CREATE INDEX IF NOT EXISTS idx_balance_ledger_user_id
+    ON t_p74122035_gde_store_creation.balance_ledger (user_id, id) INCLUDE (amount);
+
+-- Revenue reports: range scans by time, per game
+CREATE INDEX IF NOT EXISTS idx_balance_ledger_created
+    ON t_p74122035_gde_store_creation.balance_ledger (created_at) INCLUDE (amount, kind, game_id);
+
+CREATE INDEX IF NOT EXISTS idx_balance_ledger_game_created
+    ON t_p74122035_gde_store_creation.balance_ledger (game_id, created_at) INCLUDE (amount)
+    WHERE game_id IS NOT NULL;
+
+-- Per-user balance as of ledger entry ledger_id, written by the compaction job
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.balance_snapshots (
+    user_id INTEGER PRIMARY KEY REFERENCES t_p74122035_gde_store_creation.users(id),
+    balance DECIMAL(12, 2) NOT NULL,
+    ledger_id BIGINT NOT NULL,
+    taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Opening entries so that the ledger sums to the current balances
+INSERT INTO t_p74122035_gde_store_creation.balance_ledger (user_id, amount, kind)
+SELECT id, balance, 'opening'
+FROM t_p74122035_gde_store_creation.users u
+WHERE balance <> 0
+  AND NOT EXISTS (SELECT 1 FROM t_p74122035_gde_store_creation.balance_ledger l WHERE l.user_id = u.id);
@@ -0,0 +1,33 @@
+-- Friendships are stored in both directions (backend/social) so that a user's friends
+-- are one range of the UNIQUE (user_id, friend_id) index; mirror existing one-way rows
+INSERT INTO t_p74122035_gde_store_creation.friendships (user_id, friend_id, created_at)
+SELECT friend_id, user_id, created_at
+FROM t_p74122035_gde_store_creation.friendships
+WHERE user_id IS NOT NULL AND friend_id IS NOT NULL AND user_id <> friend_id
+ON CONFLICT (user_id, friend_id) DO NOTHING;
+
+-- Conversation pages: one backwards range scan per direction, newest first
+CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON t_p74122035_gde_store_creation.messages (sender_id, receiver_id, created_at, id);
+
+-- Unread messages per (receiver, sender), bumped by every send and reset on read
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.message_unread (
+    user_id INTEGER NOT NULL REFERENCES t_p74122035_gde_store_creation.users(id),
+    peer_id INTEGER NOT NULL REFERENCES t_p74122035_gde_store_creation.users(id),
+    unread INTEGER NOT NULL DEFAULT 0,
+    last_message_id INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_message_unread_pending
+    ON t_p74122035_gde_store_creation.message_unread (user_id) INCLUDE (peer_id, unread, last_message_id)
+    WHERE unread > 0;
+
+-- There was no read state before; existing conversations start out read
+INSERT INTO t_p74122035_gde_store_creation.message_unread (user_id, peer_id, unread, last_message_id)
+SELECT receiver_id, sender_id, 0, MAX(id)
+FROM t_p74122035_gde_store_creation.messages
+WHERE sender_id IS NOT NULL AND receiver_id IS NOT NULL
+GROUP BY receiver_id, sender_id
+ON CONFLICT (user_id, peer_id) DO NOTHING;
@@ -0,0 +1,17 @@
+-- Wakes long-polling receivers (backend/social/hub.py): the payload is the receiver id,
+-- delivered to LISTEN social_messages when the inserting transaction commits
+CREATE OR REPLACE FUNCTION t_p74122035_gde_store_creation.notify_message() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('social_messages', NEW.receiver_id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_notify ON t_p74122035_gde_store_creation.messages;
+CREATE TRIGGER messages_notify
+    AFTER INSERT ON t_p74122035_gde_store_creation.messages
+    FOR EACH ROW EXECUTE FUNCTION t_p74122035_gde_store_creation.notify_message();
+
+-- Incoming messages after the client's last seen id
+CREATE INDEX IF NOT EXISTS idx_messages_receiver_id
+    ON t_p74122035_gde_store_creation.messages (receiver_id, id);
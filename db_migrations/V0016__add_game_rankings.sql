@@ -0,0 +1,50 @@
+-- Storefront charts (backend/games/rankings.py). Sales are folded in incrementally from
+-- balance_ledger: hourly buckets feed the rolling 24h/7d windows, totals the all-time chart
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.game_sales_hourly (
+    game_id INTEGER NOT NULL,
+    hour TIMESTAMP NOT NULL,
+    purchases INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (game_id, hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_game_sales_hourly_hour
+    ON t_p74122035_gde_store_creation.game_sales_hourly (hour) INCLUDE (game_id, purchases, revenue);
+
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.game_sales_totals (
+    game_id INTEGER PRIMARY KEY,
+    purchases INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+
+-- Precomputed leaderboards: period is 24h, 7d or all; scope is all, genre:<genre>
+-- or engine:<engine_type>. A chart is one range of the primary key
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.game_rankings (
+    period VARCHAR(8) NOT NULL,
+    scope VARCHAR(80) NOT NULL,
+    rank INTEGER NOT NULL,
+    game_id INTEGER NOT NULL,
+    purchases INTEGER NOT NULL,
+    revenue DECIMAL(12, 2) NOT NULL,
+    PRIMARY KEY (period, scope, rank)
+);
+
+-- Backfill from current ownership, then continue from the ledger's current end
+INSERT INTO t_p74122035_gde_store_creation.game_sales_totals (game_id, purchases, revenue)
+SELECT game_id, COUNT(*), COALESCE(SUM(purchase_price), 0)
+FROM t_p74122035_gde_store_creation.game_purchases
+WHERE game_id IS NOT NULL
+GROUP BY game_id
+ON CONFLICT (game_id) DO NOTHING;
+
+INSERT INTO t_p74122035_gde_store_creation.game_sales_hourly (game_id, hour, purchases, revenue)
+SELECT game_id, date_trunc('hour', purchased_at), COUNT(*), COALESCE(SUM(purchase_price), 0)
+FROM t_p74122035_gde_store_creation.game_purchases
+WHERE game_id IS NOT NULL AND purchased_at >= CURRENT_TIMESTAMP - INTERVAL '8 days'
+GROUP BY 1, 2
+ON CONFLICT (game_id, hour) DO NOTHING;
+
+INSERT INTO t_p74122035_gde_store_creation.system_settings (key, value, updated_at)
+SELECT 'rankings_ledger_id', COALESCE(MAX(id), 0)::text, CURRENT_TIMESTAMP
+FROM t_p74122035_gde_store_creation.balance_ledger
+ON CONFLICT (key) DO NOTHING;
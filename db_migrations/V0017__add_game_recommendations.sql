@@ -0,0 +1,10 @@
+-- "Players also bought": top-K co-purchase neighbours per game, rebuilt offline by
+-- jobs/build_recommendations.py. Reads are one primary-key range per game
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.game_recommendations (
+    game_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    recommended_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    co_purchases INTEGER NOT NULL,
+    PRIMARY KEY (game_id, rank)
+);
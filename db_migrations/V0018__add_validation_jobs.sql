@@ -0,0 +1,35 @@
+-- Results of the asynchronous submission checks (jobs/validate_submissions.py),
+-- shown to moderators next to the pending game
+ALTER TABLE t_p74122035_gde_store_creation.games
+    ADD COLUMN IF NOT EXISTS validation JSONB,
+    ADD COLUMN IF NOT EXISTS validated_at TIMESTAMP;
+
+-- Duplicate title detection
+CREATE INDEX IF NOT EXISTS idx_games_title_lower
+    ON t_p74122035_gde_store_creation.games (lower(title));
+
+-- Work queue polled with FOR UPDATE SKIP LOCKED; a running job whose lease expired
+-- (worker died) goes back to queued
+CREATE TABLE IF NOT EXISTS t_p74122035_gde_store_creation.validation_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    game_id INTEGER NOT NULL REFERENCES t_p74122035_gde_store_creation.games(id) ON DELETE CASCADE,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(64),
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_validation_jobs_queued
+    ON t_p74122035_gde_store_creation.validation_jobs (run_after, id) WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_validation_jobs_running
+    ON t_p74122035_gde_store_creation.validation_jobs (locked_at) WHERE status = 'running';
+
+INSERT INTO t_p74122035_gde_store_creation.validation_jobs (game_id)
+SELECT id FROM t_p74122035_gde_store_creation.games g
+WHERE status = 'pending' AND validation IS NULL
+  AND NOT EXISTS (SELECT 1 FROM t_p74122035_gde_store_creation.validation_jobs j WHERE j.game_id = g.id);
@@ -0,0 +1,169 @@
+'''
+Offline job: rebuilds the "players also bought" table (game_recommendations) from game_purchases.
+
+Streams (user_id, game_id) pairs in user order through a server-side cursor, accumulates the
+game x game co-purchase matrix X^T X one sparse block of users at a time, scores neighbours by
+cosine similarity and keeps the top K per game. Memory is bounded by --chunk-rows plus the
+co-purchase matrix itself, independent of the number of purchase rows. The table is replaced
+in one transaction, so readers switch from the old neighbours to the new ones atomically.
+
+    DATABASE_URL=postgresql://localhost/store python jobs/build_recommendations.py --top-k 20
+'''
+import argparse
+import io
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+import psycopg2
+from scipy import sparse
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', '20'))
+CHUNK_ROWS = int(os.environ.get('RECOMMENDATIONS_CHUNK_ROWS', '500000'))
+MIN_SUPPORT = int(os.environ.get('RECOMMENDATIONS_MIN_SUPPORT', '2'))
+COPY_BATCH_ROWS = 100000
+
+Chunk = Tuple[np.ndarray, np.ndarray]
+Neighbours = Tuple[int, np.ndarray, np.ndarray, np.ndarray]
+
+
+def purchase_chunks(conn: Any, chunk_rows: int = CHUNK_ROWS) -> Iterator[Chunk]:
+    with conn.cursor(name='recommendations_purchases') as cur:
+        cur.itersize = chunk_rows
+        cur.execute(f"""
+            SELECT user_id, game_id FROM {SCHEMA}.game_purchases
+            WHERE user_id IS NOT NULL AND game_id IS NOT NULL
+            ORDER BY user_id
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            pairs = np.array(rows, dtype=np.int64)
+            yield pairs[:, 0], pairs[:, 1]
+
+
+def _block(users: np.ndarray, games: np.ndarray, game_ids: np.ndarray) -> sparse.csr_matrix:
+    size = len(game_ids)
+    columns = np.searchsorted(game_ids, games)
+    known = (columns < size) & (game_ids[np.minimum(columns, size - 1)] == games)
+    if not known.any():
+        return sparse.csr_matrix((size, size), dtype=np.int32)
+    _, rows = np.unique(users[known], return_inverse=True)
+    x = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns[known])), shape=(rows.max() + 1, size))
+    return (x.T @ x).tocsr()
+
+
+def cooccurrence(chunks: Iterable[Chunk], game_ids: np.ndarray) -> sparse.csr_matrix:
+    '''
+    Business: Accumulates the game x game co-purchase counts from purchase chunks
+    Args: chunks of (user_ids, game_ids) arrays ordered by user_id; game_ids - sorted ids
+          giving the matrix columns (purchases of other games are skipped)
+    Returns: CSR matrix whose diagonal holds buyers per game and off-diagonal the co-purchases
+    '''
+    size = len(game_ids)
+    total = sparse.csr_matrix((size, size), dtype=np.int32)
+    carry_users = carry_games = np.empty(0, dtype=np.int64)
+    for users, games in chunks:
+        users = np.concatenate([carry_users, users])
+        games = np.concatenate([carry_games, games])
+        # The last user's purchases may continue in the next chunk
+        cut = np.searchsorted(users, users[-1], side='left')
+        carry_users, carry_games = users[cut:], games[cut:]
+        if cut:
+            total = total + _block(users[:cut], games[:cut], game_ids)
+    if len(carry_users):
+        total = total + _block(carry_users, carry_games, game_ids)
+    return total
+
+
+def top_neighbours(counts: sparse.csr_matrix, top_k: int = TOP_K, min_support: int = MIN_SUPPORT) -> Iterator[Neighbours]:
+    '''
+    Business: Ranks each game's co-purchased games by cosine similarity and keeps the best top_k
+    Args: counts from cooccurrence; top_k neighbours per game; min_support - fewest shared
+          buyers for a pair to count
+    Returns: iterator of (game column, neighbour columns, scores, co-purchase counts), best first
+    '''
+    buyers = np.sqrt(counts.diagonal().astype(np.float64))
+    for row in range(counts.shape[0]):
+        start, end = counts.indptr[row], counts.indptr[row + 1]
+        columns = counts.indices[start:end]
+        shared = counts.data[start:end]
+        keep = (columns != row) & (shared >= min_support)
+        if not keep.any():
+            continue
+        columns, shared = columns[keep], shared[keep]
+        scores = shared / (buyers[row] * buyers[columns])
+        if len(scores) > top_k:
+            # Everything scoring at least the k-th best, ties included, then sort and cut
+            kth = -np.partition(-scores, top_k - 1)[top_k - 1]
+            best = scores >= kth
+            columns, shared, scores = columns[best], shared[best], scores[best]
+        order = np.lexsort((columns, -scores))[:top_k]
+        yield row, columns[order], scores[order], shared[order]
+
+
+def store(conn: Any, game_ids: np.ndarray, neighbours: Iterable[Neighbours]) -> int:
+    copy_sql = f'COPY {SCHEMA}.game_recommendations (game_id, rank, recommended_id, score, co_purchases) FROM STDIN'
+    written = 0
+    with conn.cursor() as cur:
+        cur.execute(f'DELETE FROM {SCHEMA}.game_recommendations')
+        buffer, buffered = io.StringIO(), 0
+        for row, columns, scores, shared in neighbours:
+            game_id = game_ids[row]
+            for rank, (column, score, count) in enumerate(zip(columns, scores, shared), 1):
+                buffer.write(f'{game_id}\t{rank}\t{game_ids[column]}\t{score:.6f}\t{count}\n')
+            buffered += len(columns)
+            if buffered >= COPY_BATCH_ROWS:
+                buffer.seek(0)
+                cur.copy_expert(copy_sql, buffer)
+                written += buffered
+                buffer, buffered = io.StringIO(), 0
+        buffer.seek(0)
+        cur.copy_expert(copy_sql, buffer)
+        written += buffered
+        cur.execute(
+            f"INSERT INTO {SCHEMA}.system_settings AS s (key, value, updated_at) VALUES ('cache_version:recommendations', '1', CURRENT_TIMESTAMP) "
+            "ON CONFLICT (key) DO UPDATE SET value = (s.value::bigint + 1)::text, updated_at = CURRENT_TIMESTAMP"
+        )
+    conn.commit()
+    return written
+
+
+def build(dsn: str, top_k: int = TOP_K, chunk_rows: int = CHUNK_ROWS, min_support: int = MIN_SUPPORT) -> Dict[str, Any]:
+    conn = psycopg2.connect(dsn)
+    try:
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(f'SELECT id FROM {SCHEMA}.games ORDER BY id')
+            game_ids = np.array([r[0] for r in cur.fetchall()], dtype=np.int64)
+        counts = cooccurrence(purchase_chunks(conn, chunk_rows), game_ids)
+        conn.commit()
+        counted = time.perf_counter()
+        written = store(conn, game_ids, top_neighbours(counts, top_k, min_support))
+        return {
+            'games': len(game_ids),
+            'pairs': int(counts.nnz),
+            'rows': written,
+            'count_seconds': round(counted - started, 3),
+            'rank_and_store_seconds': round(time.perf_counter() - counted, 3),
+        }
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='purchase rows per sparse block')
+    parser.add_argument('--min-support', type=int, default=MIN_SUPPORT, help='fewest shared buyers per pair')
+    args = parser.parse_args()
+    print(json.dumps(build(os.environ['DATABASE_URL'], args.top_k, args.chunk_rows, args.min_support), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Scheduled job: folds new balance_ledger entries into the per-user balance_snapshots.
+
+Runs the same compaction as the admin PUT compact_ledger action (backend/admin/ledger.py), so
+balance reads only sum the entries written since the last run. Run it from cron, or keep it
+running with --interval; concurrent runs serialize on the watermark row.
+
+    DATABASE_URL=postgresql://localhost/store python jobs/compact_ledger.py --interval 60
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin'))
+from ledger import COMPACT_BATCH, compact  # noqa: E402
+
+INTERVAL_SECONDS = float(os.environ.get('LEDGER_COMPACT_INTERVAL_SECONDS', '0'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=INTERVAL_SECONDS, help='seconds between runs; 0 runs once')
+    parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH, help='ledger ids folded per commit')
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    result = compact(conn, cur, args.batch_size)
+                print(json.dumps({'event': 'ledger_compact', **result, 'seconds': round(time.perf_counter() - started, 3)}), flush=True)
+            except psycopg2.Error as e:
+                if not args.interval:
+                    raise
+                # Committed batches stay folded; the next run continues from the watermark
+                print(json.dumps({'event': 'ledger_compact_error', 'error': str(e)}), flush=True)
+                if conn.closed:
+                    conn = psycopg2.connect(dsn)
+                else:
+                    conn.rollback()
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Scheduled job: keeps the storefront charts (game_rankings) current.
+
+Runs the same refresh as the admin PUT refresh_rankings action (backend/games/rankings.py):
+folds purchases and refunds written to balance_ledger since the last watermark into the sales
+counters, rebuilds every chart and bumps cache_version:rankings. Run it from cron, or keep it
+running with --interval; concurrent runs serialize on the watermark row.
+
+    DATABASE_URL=postgresql://localhost/store python jobs/refresh_rankings.py --interval 300
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'games'))
+from rankings import RANKINGS_SIZE, refresh  # noqa: E402
+
+INTERVAL_SECONDS = float(os.environ.get('RANKINGS_REFRESH_INTERVAL_SECONDS', '0'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=INTERVAL_SECONDS, help='seconds between refreshes; 0 runs once')
+    parser.add_argument('--size', type=int, default=RANKINGS_SIZE, help='rows per chart')
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    result = refresh(conn, cur, args.size)
+                print(json.dumps({'event': 'rankings_refresh', **result, 'seconds': round(time.perf_counter() - started, 3)}), flush=True)
+            except psycopg2.Error as e:
+                if not args.interval:
+                    raise
+                # The next run folds from the same watermark
+                print(json.dumps({'event': 'rankings_refresh_error', 'error': str(e)}), flush=True)
+                if conn.closed:
+                    conn = psycopg2.connect(dsn)
+                else:
+                    conn.rollback()
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+'''
+Worker pool that validates submitted games off the request path (validation_jobs queue).
+
+games submit enqueues a job in the same statement that inserts the game. Each worker process
+claims a batch of due jobs with FOR UPDATE SKIP LOCKED, checks the game's URLs, logo image and
+file size and looks for duplicate titles, then attaches the result to games.validation for the
+admin pending_games view. Any failure of a check (network, malformed answer, bug) is retried
+with exponential backoff up to VALIDATION_MAX_ATTEMPTS; the lease is renewed before each job of a
+batch, and jobs of a worker that died are re-queued once their lease expires, or marked failed
+when they are out of attempts. Every process prints a JSON metrics line every --metrics-seconds.
+
+    DATABASE_URL=postgresql://localhost/store python jobs/validate_submissions.py --processes 4
+'''
+import argparse
+import http.client
+import ipaddress
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+SCHEMA = 't_p74122035_gde_store_creation'
+
+BATCH_SIZE = int(os.environ.get('VALIDATION_BATCH_SIZE', '10'))
+POLL_SECONDS = float(os.environ.get('VALIDATION_POLL_SECONDS', '1'))
+LEASE_SECONDS = int(os.environ.get('VALIDATION_LEASE_SECONDS', '300'))
+MAX_ATTEMPTS = int(os.environ.get('VALIDATION_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE_SECONDS = float(os.environ.get('VALIDATION_BACKOFF_SECONDS', '5'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('VALIDATION_BACKOFF_MAX_SECONDS', '600'))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get('VALIDATION_HTTP_TIMEOUT_SECONDS', '10'))
+ALLOW_PRIVATE_HOSTS = os.environ.get('VALIDATION_ALLOW_PRIVATE_HOSTS', '').lower() in ('1', 'true', 'yes')
+MAX_FILE_BYTES = int(os.environ.get('VALIDATION_MAX_FILE_BYTES', str(512 * 1024 * 1024)))
+MAX_LOGO_BYTES = int(os.environ.get('VALIDATION_MAX_LOGO_BYTES', str(5 * 1024 * 1024)))
+LOGO_MIN_PIXELS = int(os.environ.get('VALIDATION_LOGO_MIN_PIXELS', '64'))
+LOGO_MAX_PIXELS = int(os.environ.get('VALIDATION_LOGO_MAX_PIXELS', '4096'))
+IMAGE_SNIFF_BYTES = 64 * 1024
+
+
+class TransientError(Exception):
+    pass
+
+
+CLAIM_SQL = f"""
+    UPDATE {SCHEMA}.validation_jobs j
+    SET status = 'running', attempts = j.attempts + 1, locked_by = %(worker)s, locked_at = CURRENT_TIMESTAMP
+    FROM (
+        SELECT id FROM {SCHEMA}.validation_jobs
+        WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+        ORDER BY run_after, id
+        LIMIT %(batch)s
+        FOR UPDATE SKIP LOCKED
+    ) due, {SCHEMA}.games g
+    WHERE j.id = due.id AND g.id = j.game_id
+    RETURNING j.id, j.attempts, g.id, g.title, g.logo_url, g.file_url
+"""
+
+REAP_SQL = f"""
+    UPDATE {SCHEMA}.validation_jobs
+    SET status = 'queued', run_after = CURRENT_TIMESTAMP, locked_by = NULL, locked_at = NULL
+    WHERE status = 'running' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %(lease)s)
+      AND attempts < %(max_attempts)s
+"""
+
+# A job whose worker keeps dying on it (or that keeps outliving its lease) must not cycle forever
+REAP_FAILED_SQL = f"""
+    WITH job AS (
+        UPDATE {SCHEMA}.validation_jobs
+        SET status = 'failed', finished_at = CURRENT_TIMESTAMP, locked_by = NULL, locked_at = NULL,
+            last_error = COALESCE(last_error, 'lease expired')
+        WHERE status = 'running' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %(lease)s)
+          AND attempts >= %(max_attempts)s
+        RETURNING game_id, attempts, last_error
+    )
+    UPDATE {SCHEMA}.games g
+    SET validation = jsonb_build_object(
+            'ok', false,
+            'issues', jsonb_build_array('not checked after ' || job.attempts || ' attempts: ' || job.last_error),
+            'checked_at', extract(epoch FROM CURRENT_TIMESTAMP)::bigint
+        ),
+        validated_at = CURRENT_TIMESTAMP
+    FROM job WHERE g.id = job.game_id
+"""
+
+RENEW_SQL = f"""
+    UPDATE {SCHEMA}.validation_jobs SET locked_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'running' AND locked_by = %s
+"""
+
+COMPLETE_SQL = f"""
+    WITH job AS (
+        UPDATE {SCHEMA}.validation_jobs
+        SET status = 'done', finished_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = %(job_id)s
+        RETURNING game_id
+    )
+    UPDATE {SCHEMA}.games g SET validation = %(result)s, validated_at = CURRENT_TIMESTAMP
+    FROM job WHERE g.id = job.game_id
+"""
+
+RETRY_SQL = f"""
+    UPDATE {SCHEMA}.validation_jobs
+    SET status = 'queued', run_after = CURRENT_TIMESTAMP + make_interval(secs => %s), locked_by = NULL, locked_at = NULL, last_error = %s
+    WHERE id = %s
+"""
+
+# Same statement as cache.bump_version; admin pending_games folds this version into its ETag
+BUMP_SQL = (
+    f"INSERT INTO {SCHEMA}.system_settings AS s (key, value, updated_at) VALUES ('cache_version:moderation', '1', CURRENT_TIMESTAMP) "
+    "ON CONFLICT (key) DO UPDATE SET value = (s.value::bigint + 1)::text, updated_at = CURRENT_TIMESTAMP"
+)
+
+PENDING_SQL = f"SELECT EXISTS (SELECT 1 FROM {SCHEMA}.validation_jobs WHERE status IN ('queued', 'running'))"
+
+DUPLICATES_SQL = f"""
+    SELECT id FROM {SCHEMA}.games
+    WHERE lower(title) = lower(%s) AND id <> %s AND status IN ('pending', 'approved')
+    ORDER BY id
+    LIMIT 10
+"""
+
+
+def _check_url(url: str) -> None:
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('URL must be http(s)')
+
+
+def _vetted_connection(address: Tuple[str, int], timeout: Any = socket._GLOBAL_DEFAULT_TIMEOUT, source_address: Any = None) -> socket.socket:
+    '''
+    Business: Opens the TCP connection of a validation request to an address that passed the check;
+              resolving once and connecting to that result leaves no gap for DNS rebinding
+    Args: address - (host, port) as given by http.client, port already defaulted per scheme;
+          timeout and source_address as for socket.create_connection
+    Returns: connected socket; raises ValueError for unresolvable hosts and private addresses
+    '''
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f'Host does not resolve: {host}') from e
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not ALLOW_PRIVATE_HOSTS and any(not ipaddress.ip_address(a.split('%')[0]).is_global for a in addresses):
+        raise ValueError('URL points to a private address')
+    error: Optional[OSError] = None
+    for a in addresses:
+        try:
+            return socket.create_connection((a, port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error or OSError(f'No address for {host}')
+
+
+class _VettedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _vetted_connection
+
+
+class _VettedHTTPSConnection(http.client.HTTPSConnection):
+    # TLS is still set up for self.host, so SNI and certificate checks use the URL's hostname
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _vetted_connection
+
+
+class _VettedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req: Any) -> Any:
+        return self.do_open(_VettedHTTPConnection, req)
+
+
+class _VettedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req: Any) -> Any:
+        return self.do_open(_VettedHTTPSConnection, req, context=self._context)
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req: Any, fp: Any, code: int, msg: str, headers: Any, newurl: str) -> Any:
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: the vetted address must be the one connected to
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _VettedHTTPHandler, _VettedHTTPSHandler, _CheckedRedirects)
+
+
+def fetch(url: str, method: str = 'HEAD', first_bytes: int = 0) -> Tuple[int, Dict[str, str], bytes]:
+    '''
+    Business: Requests a submitted URL the way a player's client would, without downloading it
+    Args: url; method HEAD or GET; first_bytes - for GET, how much of the body to read (Range request)
+    Returns: (status, lower-cased headers, body prefix); raises ValueError for URLs that must
+             not be fetched and TransientError for network failures and 5xx answers
+    '''
+    _check_url(url)
+    request = urllib.request.Request(url, method=method, headers={'User-Agent': 'gde-store-validator/1.0'})
+    if first_bytes:
+        request.add_header('Range', f'bytes=0-{first_bytes - 1}')
+    try:
+        with _opener.open(request, timeout=HTTP_TIMEOUT_SECONDS) as response:
+            body = response.read(first_bytes) if first_bytes else b''
+            return response.status, {k.lower(): v for k, v in response.headers.items()}, body
+    except urllib.error.HTTPError as e:
+        if e.code >= 500 or e.code == 429:
+            raise TransientError(f'{url}: HTTP {e.code}') from e
+        return e.code, {k.lower(): v for k, v in e.headers.items()}, b''
+    except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+        raise TransientError(f'{url}: {e}') from e
+
+
+def content_size(headers: Dict[str, str]) -> Optional[int]:
+    total = headers.get('content-range', '').rpartition('/')[2]
+    if total.isdigit():
+        return int(total)
+    length = headers.get('content-length', '')
+    return int(length) if length.isdigit() else None
+
+
+def image_size(data: bytes) -> Optional[Tuple[str, int, int]]:
+    '''
+    Business: Reads image format and dimensions from the first bytes of a PNG, GIF, JPEG or WebP
+    Args: data - file prefix
+    Returns: (format, width, height), or None when the format is unknown or the header incomplete
+    '''
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return 'webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            return 'webp', int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    if data[:2] == b'\xff\xd8':
+        offset = 2
+        while offset + 9 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                return 'jpeg', width, height
+            offset += 2 + length
+    return None
+
+
+def check_logo(url: str) -> Dict[str, Any]:
+    try:
+        status, headers, data = fetch(url, 'GET', IMAGE_SNIFF_BYTES)
+    except ValueError as e:
+        return {'url': url, 'reachable': False, 'issues': [str(e)]}
+    result: Dict[str, Any] = {'url': url, 'reachable': status < 400, 'status': status, 'bytes': content_size(headers), 'issues': []}
+    if status >= 400:
+        result['issues'].append(f'HTTP {status}')
+        return result
+    if result['bytes'] is not None and result['bytes'] > MAX_LOGO_BYTES:
+        result['issues'].append(f'Logo is larger than {MAX_LOGO_BYTES} bytes')
+    image = image_size(data)
+    if image is None:
+        result['issues'].append('Logo is not a PNG, JPEG, GIF or WebP image')
+        return result
+    result['format'], result['width'], result['height'] = image
+    if min(image[1:]) < LOGO_MIN_PIXELS or max(image[1:]) > LOGO_MAX_PIXELS:
+        result['issues'].append(f'Logo must be between {LOGO_MIN_PIXELS} and {LOGO_MAX_PIXELS} pixels per side')
+    return result
+
+
+def check_file(url: str) -> Dict[str, Any]:
+    try:
+        status, headers, _ = fetch(url, 'HEAD')
+        if status == 405:
+            status, headers, _ = fetch(url, 'GET', 1)
+    except ValueError as e:
+        return {'url': url, 'reachable': False, 'issues': [str(e)]}
+    result: Dict[str, Any] = {'url': url, 'reachable': status < 400, 'status': status, 'bytes': content_size(headers), 'issues': []}
+    if status >= 400:
+        result['issues'].append(f'HTTP {status}')
+    elif result['bytes'] is None:
+        result['issues'].append('File size is unknown')
+    elif result['bytes'] > MAX_FILE_BYTES:
+        result['issues'].append(f'File is larger than {MAX_FILE_BYTES} bytes')
+    return result
+
+
+def validate(cur: Any, game_id: int, title: str, logo_url: str, file_url: str) -> Dict[str, Any]:
+    '''
+    Business: Runs every submission check for one game
+    Args: cur - open cursor for the duplicate lookup; the game's id, title, logo_url and file_url
+    Returns: JSON-able result with ok, issues, logo, file and duplicate_ids;
+             raises TransientError when a URL could not be checked this time
+    '''
+    logo = check_logo(logo_url)
+    file = check_file(file_url)
+    # After the fetches, so no transaction stays open while they run
+    cur.execute(DUPLICATES_SQL, (title, game_id))
+    duplicates = [r[0] for r in cur.fetchall()]
+    issues = [f'logo: {i}' for i in logo['issues']] + [f'file: {i}' for i in file['issues']]
+    if duplicates:
+        issues.append(f"title: same title as game {', '.join(map(str, duplicates))}")
+    return {'ok': not issues, 'issues': issues, 'logo': logo, 'file': file, 'duplicate_ids': duplicates, 'checked_at': int(time.time())}
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def run_batch(conn: Any, worker: str, batch_size: int, metrics: Dict[str, int]) -> int:
+    reap = {'lease': LEASE_SECONDS, 'max_attempts': MAX_ATTEMPTS}
+    with conn.cursor() as cur:
+        cur.execute(REAP_SQL, reap)
+        metrics['reaped'] += cur.rowcount
+        cur.execute(REAP_FAILED_SQL, reap)
+        if cur.rowcount:
+            metrics['failed'] += cur.rowcount
+            cur.execute(BUMP_SQL)
+        cur.execute(CLAIM_SQL, {'worker': worker, 'batch': batch_size})
+        jobs = cur.fetchall()
+    conn.commit()
+
+    for job_id, attempts, game_id, title, logo_url, file_url in jobs:
+        with conn.cursor() as cur:
+            # The lease covers one job, not the whole batch
+            cur.execute(RENEW_SQL, (job_id, worker))
+            renewed = cur.rowcount
+        conn.commit()
+        if not renewed:
+            # Reaped while the jobs before it ran; it is someone else's now
+            continue
+        with conn.cursor() as cur:
+            try:
+                result = validate(cur, game_id, title, logo_url, file_url)
+            except psycopg2.Error:
+                raise
+            except Exception as e:
+                # Network failures, malformed answers and bugs alike: a poison job must not take the worker down
+                error = str(e) if isinstance(e, TransientError) else f'{type(e).__name__}: {e}'
+                if attempts < MAX_ATTEMPTS:
+                    cur.execute(RETRY_SQL, (backoff_seconds(attempts), error, job_id))
+                    metrics['retried'] += 1
+                    conn.commit()
+                    continue
+                result = {'ok': False, 'issues': [f'not checked after {attempts} attempts: {error}'], 'checked_at': int(time.time())}
+                metrics['failed'] += 1
+            cur.execute(COMPLETE_SQL, {'job_id': job_id, 'result': psycopg2.extras.Json(result)})
+            cur.execute(BUMP_SQL)
+        conn.commit()
+        metrics['processed'] += 1
+    return len(jobs)
+
+
+def drained(conn: Any) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(PENDING_SQL)
+        pending = cur.fetchone()[0]
+    conn.commit()
+    return not pending
+
+
+def work(dsn: str, worker: str, batch_size: int, metrics_seconds: float, exit_when_drained: bool) -> None:
+    conn = psycopg2.connect(dsn)
+    metrics = {'processed': 0, 'retried': 0, 'failed': 0, 'reaped': 0, 'errors': 0}
+    started = reported = time.monotonic()
+    try:
+        while True:
+            try:
+                claimed = run_batch(conn, worker, batch_size, metrics)
+            except psycopg2.InterfaceError:
+                conn.close()
+                conn = psycopg2.connect(dsn)
+                metrics['errors'] += 1
+                claimed = 0
+            except (psycopg2.Error, OSError) as e:
+                # The job stays running and is re-queued when its lease expires
+                if conn.closed:
+                    conn = psycopg2.connect(dsn)
+                else:
+                    conn.rollback()
+                metrics['errors'] += 1
+                print(json.dumps({'event': 'validation_error', 'worker': worker, 'error': str(e)}), flush=True)
+                claimed = 0
+            now = time.monotonic()
+            if now - reported >= metrics_seconds:
+                print(json.dumps({'event': 'validation_metrics', 'worker': worker, **metrics,
+                                  'jobs_per_sec': round(metrics['processed'] / (now - started), 2)}), flush=True)
+                reported = now
+            if not claimed:
+                if exit_when_drained and drained(conn):
+                    break
+                time.sleep(POLL_SECONDS)
+    finally:
+        conn.close()
+        elapsed = time.monotonic() - started
+        print(json.dumps({'event': 'validation_worker_exit', 'worker': worker, **metrics, 'seconds': round(elapsed, 3),
+                          'jobs_per_sec': round(metrics['processed'] / elapsed, 2) if elapsed else 0.0}), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='jobs claimed per poll')
+    parser.add_argument('--metrics-seconds', type=float, default=10.0)
+    parser.add_argument('--exit-when-drained', action='store_true', help='stop once no job is queued or running')
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    host = socket.gethostname()
+    workers: List[multiprocessing.Process] = [
+        multiprocessing.Process(target=work, args=(dsn, f'{host}:{os.getpid()}:{n}', args.batch_size, args.metrics_seconds, args.exit_when_drained))
+        for n in range(args.processes)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+if __name__ == '__main__':
+    main()